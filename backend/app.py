@@ -3,27 +3,51 @@ ID Validation Backend Service
 Uses InsightFace for face comparison, Tesseract OCR for text extraction, and fuzzywuzzy for text matching
 Also includes AI Chat functionality using OpenAI API
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import cv2
 import numpy as np
-import insightface
 from PIL import Image
-import pytesseract
 from fuzzywuzzy import fuzz
 import base64
+import hmac
 import io
+import json
 import os
+import re
+import threading
+from collections import Counter
 try:
     import openai
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     # print("⚠️  OpenAI library not installed. Install with: pip install openai")
-from typing import List, Dict, Optional
+from ocr_pool import get_ocr_pool
+from ocr_engine import get_ocr_engine
+from ocr_cascade import ALL_FIELDS, run_cascade
+from field_extraction import (
+    extract_name, extract_id_number, extract_date_of_birth, detect_id_type, score_extracted_fields
+)
+from id_templates import OCR_TEMPLATES_ENABLED, extract_with_template
+from result_cache import create_face_cache, create_ocr_cache, make_key
+from image_context import ImageContext
+from face_executor import (
+    FACE_FAST_MODEL_NAME, FACE_MODEL_NAME, FACE_TIER_BAND_HIGH, FACE_TIER_BAND_LOW,
+    face_profile, face_providers, get_face_executor, provider_selection
+)
+from insightface.app.common import Face
+from face_store import FaceStore, image_hash
+from face_index import FACE_DUPLICATE_CHECK, FACE_DUPLICATE_THRESHOLD, FaceIndex, StoreFaceIndex
+from readiness import WARMUP_ON_START, Readiness
+from quality_gate import QUALITY_GATE, assess as assess_quality, first_issue, rank_frames
+from user_auth import verified_user_id
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
+# Largest request body accepted, in MB (bigger uploads get 413); /extract-text/batch backlogs larger
+# than this go through a path manifest instead
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 64))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
 
 # Initialize OpenAI client (optional - will use if API key is set)
 openai_api_key = os.environ.get('OPENAI_API_KEY')
@@ -37,27 +61,106 @@ if OPENAI_AVAILABLE and openai_api_key:
         openai_client = None
 elif not OPENAI_AVAILABLE:
     # print("⚠️  OpenAI library not installed. AI chat will use fallback responses.")
+    pass
 else:
     # print("⚠️  OpenAI API key not found. AI chat will use fallback responses.")
+    pass
 
-# Initialize InsightFace model (CORRECT SETUP)
-# print("Loading InsightFace model...")
-face_model = insightface.app.FaceAnalysis(
-    name="buffalo_l",  # Use buffalo_l model
-    providers=['CPUExecutionProvider']  # or ['CUDAExecutionProvider'] if GPU available
-)
-face_model.prepare(ctx_id=0, det_size=(640, 640))
-# print("InsightFace model loaded successfully!")
+# InsightFace models: a pool of independently threaded sessions, created on first use (or by the
+# warm-up below); get_face_executor().get() queues on the least busy one
+
+# OCR result cache (repeat uploads of the same ID image skip OCR entirely)
+ocr_cache = create_ocr_cache()
+# Detected faces per image (a selfie retry re-uses the ID photo's faces and embedding)
+face_cache = create_face_cache()
+
+# Verified ID face embeddings per user, for selfie re-verification
+face_store = FaceStore()
+# Duplicate-identity search index over the store, reloaded when another worker process changed it
+face_index = StoreFaceIndex(face_store)
+
+# Shared secret for the admin endpoints (/faces/search, DELETE /faces/<userId>, /extract-text/batch),
+# sent as "Authorization: Bearer <token>"; unset = those endpoints are disabled
+FACE_ADMIN_TOKEN = os.environ.get('FACE_ADMIN_TOKEN')
+
+def get_face_index() -> FaceIndex:
+    """
+    In-memory search index over every stored face (for duplicate-identity checks), loaded on first use
+    and reloaded whenever another worker process added, deleted or pruned faces since
+    """
+    if face_index.loaded is None:
+        prune_face_store()
+    return face_index.get()
+
+def prune_face_store():
+    """Delete expired ID faces from the store and the index (at most once per FACE_STORE_PRUNE_INTERVAL)"""
+    if face_store.prune_due():
+        expired = face_store.prune()
+        if expired:
+            face_index.apply(lambda index: index.remove(expired))
+
+def admin_denied():
+    """Error response unless the request carries FACE_ADMIN_TOKEN (None when it may proceed)"""
+    if not FACE_ADMIN_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('Authorization', '').strip()
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {FACE_ADMIN_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+# /extract-text/batch: directory that manifest paths are resolved against (unset = uploads only),
+# maximum images per request and seconds one image may take once a worker has picked it up
+OCR_BATCH_ROOT = os.environ.get('OCR_BATCH_ROOT')
+OCR_BATCH_MAX_ITEMS = int(os.environ.get('OCR_BATCH_MAX_ITEMS', 500))
+OCR_BATCH_ITEM_TIMEOUT = float(os.environ.get('OCR_BATCH_ITEM_TIMEOUT', 30))
+
+# /compare-face/burst: most selfie frames per request, and how many of the best ranked frames may
+# go through full face inference (the next one only runs when the previous one did not match)
+BURST_MAX_FRAMES = int(os.environ.get('BURST_MAX_FRAMES', 8))
+BURST_TOP_FRAMES = int(os.environ.get('BURST_TOP_FRAMES', 2))
 
 # Configure Tesseract path (update if needed)
 # For Windows: pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 # For Linux/Mac: Usually already in PATH
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': f'Request too large (max {MAX_UPLOAD_MB} MB)'}), 413
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving (models may still be loading, see /ready)"""
     return jsonify({'status': 'ok', 'message': 'ID Validation Service is running'})
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the models are loaded and warmed up, 503 until then"""
+    # Without WARMUP_ON_START the first probe starts the warm-up; later probes retry a failed step
+    readiness.start()
+    status = readiness.status()
+    status['faceProviders'] = provider_selection()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit / miss / eviction counters of the result caches"""
+    return jsonify({'ocr': ocr_cache.stats(), 'faces': face_cache.stats()})
+
+@app.route('/face/stats', methods=['GET'])
+def face_stats():
+    """Queue depth, busy time and utilization of each face model session"""
+    stats = get_face_executor().stats()
+    stats['index'] = get_face_index().stats()
+    with _face_tiers_lock:
+        stats['tiers'] = {
+            'fastModel': FACE_FAST_MODEL_NAME or None,
+            'band': [FACE_TIER_BAND_LOW, FACE_TIER_BAND_HIGH],
+            'decided': dict(face_tiers),
+        }
+    if FACE_FAST_MODEL_NAME:
+        stats['tiers']['fastSessions'] = get_face_executor(FACE_FAST_MODEL_NAME).stats()['sessions']
+    return jsonify(stats)
+
 @app.route('/ai/chat', methods=['POST'])
 def ai_chat():
     """
@@ -164,23 +267,23 @@ IMPORTANT: Keep responses SHORT, DIRECT, and USEFUL. No fluff."""
             'error': str(e)
         }), 500
 
+# Enhanced math calculations - supports decimals (compiled once, not per message)
+_MATH_PATTERNS = [
+    (re.compile(r'(\d+\.?\d*)\s*\+\s*(\d+\.?\d*)', re.IGNORECASE), lambda m: float(m.group(1)) + float(m.group(2))),
+    (re.compile(r'(\d+\.?\d*)\s*-\s*(\d+\.?\d*)', re.IGNORECASE), lambda m: float(m.group(1)) - float(m.group(2))),
+    (re.compile(r'(\d+\.?\d*)\s*\*\s*(\d+\.?\d*)', re.IGNORECASE), lambda m: float(m.group(1)) * float(m.group(2))),
+    (re.compile(r'(\d+\.?\d*)\s*/\s*(\d+\.?\d*)', re.IGNORECASE), lambda m: float(m.group(1)) / float(m.group(2)) if float(m.group(2)) != 0 else None),
+    (re.compile(r'(\d+\.?\d*)\s*%\s*of\s*(\d+\.?\d*)', re.IGNORECASE), lambda m: float(m.group(1)) * float(m.group(2)) / 100),
+]
+_NUMBER_PATTERN = re.compile(r'\d+')
+
 def _generate_fallback_response(user_message: str) -> str:
     """Generate intelligent fallback response with enhanced listing knowledge and math"""
-    import re
     message_lower = user_message.lower().strip()
     
-    # Enhanced math calculations - supports decimals
-    math_patterns = [
-        (r'(\d+\.?\d*)\s*\+\s*(\d+\.?\d*)', lambda m: float(m.group(1)) + float(m.group(2))),
-        (r'(\d+\.?\d*)\s*-\s*(\d+\.?\d*)', lambda m: float(m.group(1)) - float(m.group(2))),
-        (r'(\d+\.?\d*)\s*\*\s*(\d+\.?\d*)', lambda m: float(m.group(1)) * float(m.group(2))),
-        (r'(\d+\.?\d*)\s*/\s*(\d+\.?\d*)', lambda m: float(m.group(1)) / float(m.group(2)) if float(m.group(2)) != 0 else None),
-        (r'(\d+\.?\d*)\s*%\s*of\s*(\d+\.?\d*)', lambda m: float(m.group(1)) * float(m.group(2)) / 100),
-    ]
-    
     # Check for math questions
-    for pattern, func in math_patterns:
-        match = re.search(pattern, user_message, re.IGNORECASE)
+    for pattern, func in _MATH_PATTERNS:
+        match = pattern.search(user_message)
         if match:
             try:
                 result = func(match)
@@ -195,7 +298,7 @@ def _generate_fallback_response(user_message: str) -> str:
     
     # Enhanced rental cost calculations - Yearly/Annual calculations
     if any(word in message_lower for word in ['year', 'annual', 'per year']) and any(word in message_lower for word in ['how much', 'cost', 'spend', 'rent']):
-        numbers = re.findall(r'\d+', user_message)
+        numbers = _NUMBER_PATTERN.findall(user_message)
         if numbers:
             try:
                 monthly_rent = float(numbers[0])
@@ -206,7 +309,7 @@ def _generate_fallback_response(user_message: str) -> str:
     
     # Monthly calculations
     if 'month' in message_lower and any(word in message_lower for word in ['how much', 'cost']):
-        numbers = re.findall(r'\d+', user_message)
+        numbers = _NUMBER_PATTERN.findall(user_message)
         if len(numbers) >= 2:
             try:
                 total = float(numbers[0])
@@ -218,7 +321,7 @@ def _generate_fallback_response(user_message: str) -> str:
     
     # Enhanced rental cost calculations - First payment (rent + deposit)
     if any(word in message_lower for word in ['calculate', 'total', 'deposit', 'advance', 'first payment']):
-        numbers = re.findall(r'\d+', user_message)
+        numbers = _NUMBER_PATTERN.findall(user_message)
         if len(numbers) >= 2:
             try:
                 rent = float(numbers[0])
@@ -232,7 +335,7 @@ def _generate_fallback_response(user_message: str) -> str:
     
     # Rental cost questions with numbers - smarter detection
     if any(word in message_lower for word in ['how much', 'cost', 'spend']) and 'rent' in message_lower:
-        numbers = re.findall(r'\d+', user_message)
+        numbers = _NUMBER_PATTERN.findall(user_message)
         if numbers:
             try:
                 monthly_rent = float(numbers[0])
@@ -273,7 +376,7 @@ def _generate_fallback_response(user_message: str) -> str:
         'calculate' not in message_lower and
         'year' not in message_lower and
         'month' not in message_lower):
-        numbers = re.findall(r'\d+', user_message)
+        numbers = _NUMBER_PATTERN.findall(user_message)
         if numbers:
             return f"For ₱{numbers[0]}, you can find good options! Use search filters to find properties in your budget range. Prices vary by location, size, and amenities."
         return "Rental prices vary by location and property type. Use search filters to find properties within your budget. What's your price range?"
@@ -315,28 +418,54 @@ def extract_text():
         
         # Decode base64 image
         image_data = base64.b64decode(data['image'])
-        image = Image.open(io.BytesIO(image_data))
         
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Perform OCR
-        raw_text = pytesseract.image_to_string(image, lang='eng')
-        
-        # Extract structured data
-        extracted_data = {
-            'rawText': raw_text,
-            'fullName': extract_name(raw_text),
-            'idNumber': extract_id_number(raw_text),
-            'dateOfBirth': extract_date_of_birth(raw_text)
-        }
-        
-        return jsonify(extracted_data), 200
+        return jsonify(_extract_text_result(image_data)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/extract-text/batch', methods=['POST'])
+def extract_text_batch():
+    """
+    Extract text from many ID images in one request (admin / back-office re-checks); needs the
+    FACE_ADMIN_TOKEN bearer token
+    Accepts: multipart/form-data with any number of image files,
+             or { "paths": ["relative/path.jpg", ...] } of files under OCR_BATCH_ROOT
+    Returns: NDJSON stream, one line per image as soon as it is done:
+             { "index": 0, "name": "...", "fullName": "...", "idNumber": "...", "dateOfBirth": "...", "rawText": "..." }
+             or { "index": 0, "name": "...", "error": "..." }
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    if request.files:
+        # Read the uploads now, the request body is gone once streaming starts
+        items = [(file.filename or field, file.read(), None)
+                 for field, file in request.files.items(multi=True)]
+    else:
+        data = request.get_json(silent=True) or {}
+        paths = data.get('paths')
+        if not isinstance(paths, list) or not paths:
+            return jsonify({'error': 'No images provided'}), 400
+        if not OCR_BATCH_ROOT:
+            return jsonify({'error': 'Path manifests are disabled (OCR_BATCH_ROOT is not set)'}), 400
+        items = [(str(path), None, str(path)) for path in paths]
+    
+    if len(items) > OCR_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Too many images (max {OCR_BATCH_MAX_ITEMS})'}), 400
+    
+    def generate():
+        # Each image is one job on the shared OCR pool, so the batch uses every worker
+        # and still takes turns with interactive requests
+        jobs = [(image_data, path) for _, image_data, path in items]
+        for index, result in get_ocr_pool().imap_unordered(_extract_text_batch_item, jobs, timeout=OCR_BATCH_ITEM_TIMEOUT):
+            line = {'index': index, 'name': items[index][0]}
+            line.update(result if result is not None else {'error': 'OCR timed out'})
+            yield json.dumps(line) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/compare-face', methods=['POST'])
 def compare_face():
     """
@@ -363,17 +492,33 @@ def compare_face():
                 'message': 'Empty files provided'
             }), 400
         
-        # Load images from files
-        id_img = Image.open(io.BytesIO(id_file.read())).convert("RGB")
-        selfie_img = Image.open(io.BytesIO(selfie_file.read())).convert("RGB")
+        # Load images from files (decoded straight to BGR with EXIF orientation applied)
+        id_ctx = ImageContext(id_file.read())
+        selfie_ctx = ImageContext(selfie_file.read())
+        id_cv = id_ctx.bgr
+        selfie_cv = selfie_ctx.bgr
+        
+        if id_cv is None or selfie_cv is None:
+            return jsonify({
+                'similarity': 0.0,
+                'match': False,
+                'message': 'Failed to decode images'
+            }), 400
         
-        # Convert PIL to OpenCV format
-        id_cv = cv2.cvtColor(np.array(id_img), cv2.COLOR_RGB2BGR)
-        selfie_cv = cv2.cvtColor(np.array(selfie_img), cv2.COLOR_RGB2BGR)
+        # Reject blurry, badly exposed or glare-covered photos before running the face models
+        # (the face checks follow right away on the full images)
+        if QUALITY_GATE:
+            quality = assess_quality([(id_cv, 'id'), (selfie_cv, 'selfie')], faces=False)
+            if first_issue(quality):
+                return jsonify({
+                    'similarity': 0.0,
+                    'match': False,
+                    'message': first_issue(quality),
+                    'qualityCheck': {'id': quality[0], 'selfie': quality[1]}
+                }), 200
         
         # Extract exactly one face from each image (CRITICAL)
-        id_faces = face_model.get(id_cv)
-        selfie_faces = face_model.get(selfie_cv)
+        id_faces, selfie_faces, tier = get_pair_faces(id_ctx, selfie_ctx)
         
         # Enforce exactly one face per image
         if len(id_faces) == 0:
@@ -457,7 +602,8 @@ def compare_face():
         return jsonify({
             'similarity': float(similarity),
             'match': is_match,
-            'message': f'Face match confirmed (similarity: {similarity:.3f})' if is_match else f'Face does not match (similarity: {similarity:.3f}, required: {threshold})'
+            'message': f'Face match confirmed (similarity: {similarity:.3f})' if is_match else f'Face does not match (similarity: {similarity:.3f}, required: {threshold})',
+            'modelTier': tier
         }), 200
         
     except Exception as e:
@@ -469,6 +615,98 @@ def compare_face():
             'traceback': traceback.format_exc() if app.debug else None
         }), 500
 
+@app.route('/compare-face/burst', methods=['POST'])
+def compare_face_burst():
+    """
+    Compare the ID face with the best of several selfie frames captured in a burst
+    Accepts: multipart/form-data with an 'id_image' file and up to BURST_MAX_FRAMES 'selfie_frames' files
+    Returns: { "similarity": 0.0-1.0, "match": true/false, "message": "...", "selectedFrame": index of the
+               frame used, "framesCompared": n, "frames": [{ "ok", "issues", "metrics", "score" }] in upload order }
+    Frames are ranked with cheap checks on downscaled copies (sharpness, face size from a low-resolution
+    detection, head pose from its keypoints). Only the best one goes through full detection and
+    embedding, and the next ones (up to BURST_TOP_FRAMES) only while the comparison does not match.
+    """
+    try:
+        frame_files = request.files.getlist('selfie_frames')
+        if 'id_image' not in request.files or not frame_files:
+            return jsonify({
+                'similarity': 0.0,
+                'match': False,
+                'message': 'ID image and selfie frames required'
+            }), 400
+        
+        if len(frame_files) > BURST_MAX_FRAMES:
+            return jsonify({
+                'similarity': 0.0,
+                'match': False,
+                'message': f'Too many selfie frames ({len(frame_files)}, at most {BURST_MAX_FRAMES})'
+            }), 400
+        
+        id_ctx = ImageContext(request.files['id_image'].read())
+        frame_ctxs = [ImageContext(frame.read()) for frame in frame_files]
+        if id_ctx.bgr is None or any(ctx.bgr is None for ctx in frame_ctxs):
+            return jsonify({
+                'similarity': 0.0,
+                'match': False,
+                'message': 'Failed to decode images'
+            }), 400
+        
+        if QUALITY_GATE:
+            quality = assess_quality([(id_ctx.bgr, 'id')], faces=False)
+            if first_issue(quality):
+                return jsonify({
+                    'similarity': 0.0,
+                    'match': False,
+                    'message': first_issue(quality),
+                    'qualityCheck': {'id': quality[0]}
+                }), 200
+        
+        # Best first: frames that pass every check, then by score
+        frames = rank_frames([ctx.bgr for ctx in frame_ctxs])
+        order = sorted(range(len(frames)), key=lambda i: (frames[i]['ok'], frames[i]['score']), reverse=True)
+        best = frames[order[0]]
+        # Score 0: no single face in any frame (or all too dark or bright); a blurry best frame is still tried
+        if QUALITY_GATE and not best['ok'] and best['score'] == 0:
+            return jsonify({
+                'similarity': 0.0,
+                'match': False,
+                'message': first_issue([best]),
+                'frames': frames
+            }), 200
+        
+        result, selected, compared = None, None, 0
+        for i in order[:max(1, BURST_TOP_FRAMES)]:
+            if compared and frames[i]['score'] == 0:
+                break
+            attempt = compare_faces_internal(id_ctx, frame_ctxs[i])
+            compared += 1
+            if result is None or attempt['similarity'] > result['similarity']:
+                result, selected = attempt, i
+            # Another frame cannot help when it matched or when the ID face itself was rejected
+            if attempt['isMatch'] or not _usable_face(id_ctx.faces or []):
+                break
+        
+        response = {
+            'similarity': result['similarity'],
+            'match': result['isMatch'],
+            'message': result['message'],
+            'selectedFrame': selected,
+            'framesCompared': compared,
+            'frames': frames
+        }
+        if 'modelTier' in result:
+            response['modelTier'] = result['modelTier']
+        return jsonify(response), 200
+        
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'similarity': 0.0,
+            'match': False,
+            'message': f'Error: {str(e)}',
+            'traceback': traceback.format_exc() if app.debug else None
+        }), 500
+
 @app.route('/compare-faces', methods=['POST'])
 def compare_faces():
     """
@@ -481,23 +719,28 @@ def compare_faces():
         if not data or 'idImage' not in data or 'selfieImage' not in data:
             return jsonify({'error': 'Both ID and selfie images required'}), 400
         
-        # Decode images
-        id_image_data = base64.b64decode(data['idImage'])
-        selfie_image_data = base64.b64decode(data['selfieImage'])
-        
-        # Convert to numpy arrays
-        id_np = np.frombuffer(id_image_data, np.uint8)
-        selfie_np = np.frombuffer(selfie_image_data, np.uint8)
-        
-        id_cv = cv2.imdecode(id_np, cv2.IMREAD_COLOR)
-        selfie_cv = cv2.imdecode(selfie_np, cv2.IMREAD_COLOR)
+        # Decode images (EXIF orientation applied so sideways phone photos are upright)
+        id_ctx = ImageContext.from_base64(data['idImage'])
+        selfie_ctx = ImageContext.from_base64(data['selfieImage'])
+        id_cv = id_ctx.bgr
+        selfie_cv = selfie_ctx.bgr
         
         if id_cv is None or selfie_cv is None:
             return jsonify({'error': 'Failed to decode images'}), 400
         
+        # Reject blurry, badly exposed or glare-covered photos before running the face models
+        if QUALITY_GATE:
+            quality = assess_quality([(id_cv, 'id'), (selfie_cv, 'selfie')], faces=False)
+            if first_issue(quality):
+                return jsonify({
+                    'isMatch': False,
+                    'confidence': 0.0,
+                    'message': first_issue(quality),
+                    'qualityCheck': {'id': quality[0], 'selfie': quality[1]}
+                }), 200
+        
         # Detect and extract face embeddings
-        id_faces = face_model.get(id_cv)
-        selfie_faces = face_model.get(selfie_cv)
+        id_faces, selfie_faces, tier = get_pair_faces(id_ctx, selfie_ctx)
         
         if len(id_faces) == 0:
             return jsonify({
@@ -588,9 +831,171 @@ def compare_faces():
             'isMatch': is_match,
             'confidence': float(similarity),  # Use similarity as confidence
             'similarity': float(similarity),
+            'message': 'Face match confirmed' if is_match else f'Face does not match (similarity: {similarity:.2f}, required: {threshold})',
+            'modelTier': tier
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/verify-selfie', methods=['POST'])
+def verify_selfie():
+    """
+    Re-verify the signed-in user against the ID face stored by a successful /validate-id (no ID upload)
+    Expects: "Authorization: Bearer <Firebase ID token>" (the user to verify),
+             { "selfieImage": "base64_encoded_selfie_image", "idImageHash": "..." (optional) }
+    Returns: { "isMatch": true/false, "confidence": 0.0-1.0, "similarity": 0.0-1.0, "message": "..." }
+    """
+    try:
+        user_id = verified_user_id(request.headers.get('Authorization'))
+        if not user_id:
+            return jsonify({'error': 'Sign-in required'}), 401
+        
+        data = request.json
+        if not data or 'selfieImage' not in data:
+            return jsonify({'error': 'Selfie image required'}), 400
+        
+        record = face_store.get(user_id, data.get('idImageHash'))
+        if record is None:
+            return jsonify({
+                'isMatch': False,
+                'confidence': 0.0,
+                'similarity': 0.0,
+                'message': 'No verified ID face on file'
+            }), 404
+        
+        selfie_ctx = ImageContext.from_base64(data['selfieImage'])
+        selfie_cv = selfie_ctx.bgr
+        if selfie_cv is None:
+            return jsonify({'error': 'Failed to decode images'}), 400
+        
+        # One detection and one embedding: the ID side comes from the store
+        selfie_faces = get_faces([selfie_ctx])[0]
+        
+        if len(selfie_faces) == 0:
+            return jsonify({'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': 'No face detected in selfie'}), 200
+        
+        if len(selfie_faces) > 1:
+            return jsonify({'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': 'Multiple faces detected in selfie'}), 200
+        
+        selfie_face = selfie_faces[0]
+        
+        if selfie_face.det_score < 0.6:
+            return jsonify({'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': 'Low-quality face in selfie'}), 200
+        
+        selfie_bbox = selfie_face.bbox
+        if selfie_bbox[2] - selfie_bbox[0] < 100:
+            return jsonify({'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': 'Selfie face too small'}), 200
+        
+        # Cosine similarity = dot product when embeddings are normalized
+        similarity = float(np.dot(record.embedding, selfie_face.normed_embedding))
+        
+        # Threshold: ≥ 0.12 for PASS (12% threshold)
+        threshold = 0.12
+        is_match = similarity >= threshold
+        
+        return jsonify({
+            'isMatch': is_match,
+            'confidence': similarity,
+            'similarity': similarity,
+            'idImageHash': record.image_hash,
             'message': 'Face match confirmed' if is_match else f'Face does not match (similarity: {similarity:.2f}, required: {threshold})'
         }), 200
         
+    except Exception as e:
+        return jsonify({
+            'isMatch': False,
+            'confidence': 0.0,
+            'similarity': 0.0,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@app.route('/faces/search', methods=['POST'])
+def faces_search():
+    """
+    Find stored ID faces (all verified users) most similar to the face in an image; needs the
+    FACE_ADMIN_TOKEN bearer token (it reveals other users' IDs)
+    Expects: { "image": "base64_encoded_image", "k": 5, "threshold": 0.5 (optional), "excludeUserId": "..." (optional) }
+    Returns: { "matches": [{ "userId": "...", "idImageHash": "...", "similarity": 0.0-1.0 }], "flagged": [...] }
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        data = request.json
+        if not data or 'image' not in data:
+            return jsonify({'error': 'No image provided'}), 400
+        
+        image_ctx = ImageContext.from_base64(data['image'])
+        if image_ctx.bgr is None:
+            return jsonify({'error': 'Failed to decode images'}), 400
+        
+        faces = get_faces([image_ctx])[0]
+        if len(faces) != 1:
+            return jsonify({'error': 'No face detected in image' if not faces else 'Multiple faces detected in image'}), 400
+        
+        k = max(1, min(int(data.get('k', 5)), 100))
+        threshold = float(data.get('threshold', FACE_DUPLICATE_THRESHOLD))
+        matches = get_face_index().search(faces[0].normed_embedding, k=k, exclude_user=data.get('excludeUserId'))
+        
+        return jsonify({
+            'matches': [match.to_dict() for match in matches],
+            'flagged': [match.to_dict() for match in matches if match.similarity >= threshold],
+            'threshold': threshold,
+            'indexSize': len(get_face_index())
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/faces/<user_id>', methods=['DELETE'])
+def faces_delete(user_id):
+    """
+    Forget a user's verified ID faces (account or ID removal); needs the FACE_ADMIN_TOKEN bearer token
+    Returns: { "userId": "...", "deleted": number of stored faces removed }
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        deleted = face_store.delete(user_id)
+        if deleted:
+            face_index.apply(lambda index: index.remove_user(user_id))
+        return jsonify({'userId': user_id, 'deleted': deleted}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/precheck', methods=['POST'])
+def precheck():
+    """
+    Quality gate for a capture-screen thumbnail, before the full-resolution photo is uploaded
+    Expects: { "image": "base64_encoded_thumbnail", "kind": "id" or "selfie", "fullWidth": width of the full photo (optional) }
+             or multipart/form-data with an "image" file and the same fields
+    Returns: { "ok": true/false, "issues": [{ "check": "blur", "message": "..." }], "metrics": {...}, "ms": ... }
+    """
+    try:
+        if 'image' in request.files:
+            fields = request.form
+            image_data = request.files['image'].read()
+        else:
+            fields = request.get_json(silent=True) or {}
+            if not fields.get('image'):
+                return jsonify({'error': 'No image provided'}), 400
+            image_data = base64.b64decode(fields['image'])
+        
+        kind = fields.get('kind', 'selfie')
+        if kind not in ('id', 'selfie'):
+            return jsonify({'error': 'kind must be "id" or "selfie"'}), 400
+        
+        image_cv = ImageContext(image_data).bgr
+        if image_cv is None:
+            return jsonify({'error': 'Failed to decode image'}), 400
+        
+        # Face sizes are judged in the pixels of the photo the thumbnail stands for
+        full_width = int(fields['fullWidth']) if fields.get('fullWidth') else None
+        return jsonify(assess_quality([(image_cv, kind)], full_widths=[full_width])[0]), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -605,23 +1010,43 @@ def validate_id():
         "userInputFirstName": "...",
         "userInputLastName": "...",
         "userInputBirthday": "...",
-        "userType": "student" or "professional"
+        "userType": "student" or "professional",
+        "checkDuplicates": true  (optional: search other accounts for the same face, always on with FACE_DUPLICATE_CHECK=1)
     }
+    With "Authorization: Bearer <Firebase ID token>", the verified ID face is stored for that user
+    (for /verify-selfie) and their own faces are left out of the duplicate check
     Returns: Complete validation result
     """
     try:
         data = request.json
         
-        # Step 1: Extract text from ID
-        ocr_result = extract_text_internal(data.get('idImage'))
+        # Decode each image once; the OCR and face stages share the decoded views
+        id_ctx = ImageContext.from_base64(data.get('idImage'))
+        selfie_ctx = ImageContext.from_base64(data.get('selfieImage'))
+        
+        # Step 0: Quality gate (small copies, low-resolution face detection) before OCR and face inference
+        if QUALITY_GATE and id_ctx.bgr is not None and selfie_ctx.bgr is not None:
+            quality = assess_quality([(id_ctx.bgr, 'id'), (selfie_ctx.bgr, 'selfie')])
+            if first_issue(quality):
+                return jsonify({
+                    'isValid': False,
+                    'qualityCheck': {'id': quality[0], 'selfie': quality[1]},
+                    'errorMessage': 'Cannot validate your credentials.'
+                }), 200
+        
+        # Step 1: Extract text from ID (birth date only needs to be found if the user gave one)
+        required_fields = ['fullName', 'idNumber']
+        if data.get('userInputBirthday'):
+            required_fields.append('dateOfBirth')
+        ocr_result = extract_text_internal(id_ctx, required_fields=required_fields)
         if not ocr_result:
             return jsonify({
                 'isValid': False,
                 'errorMessage': 'Cannot validate your credentials.'
             }), 200
         
-        # Step 2: Detect ID type
-        id_type = detect_id_type(ocr_result['rawText'])
+        # Step 2: Detect ID type (already known if a field zone template matched)
+        id_type = ocr_result.get('idType') or detect_id_type(ocr_result['rawText'])
         is_government_id = id_type == 'government'
         
         # Step 3: Validate ID type requirement
@@ -644,14 +1069,35 @@ def validate_id():
         )
         
         # Step 5: Compare faces
-        face_match = compare_faces_internal(
-            data.get('idImage'),
-            data.get('selfieImage')
-        )
+        face_match = compare_faces_internal(id_ctx, selfie_ctx)
         
         # Step 6: Final validation
         is_valid = text_validation['isValid'] and face_match['isMatch']
         
+        # Step 7 (optional): is this face already registered to another account?
+        duplicate_check = None
+        user_id = verified_user_id(request.headers.get('Authorization'))
+        check_duplicates = (FACE_DUPLICATE_CHECK or data.get('checkDuplicates')) and id_ctx.faces and len(id_ctx.faces) == 1
+        # Stored and searched embeddings always come from the full pack (the one /verify-selfie embeds
+        # selfies with); when the fast tier decided the match, the ID is embedded again (a cache hit otherwise)
+        id_faces = get_faces([id_ctx])[0] if check_duplicates or (is_valid and user_id) else []
+        if check_duplicates and len(id_faces) == 1:
+            matches = get_face_index().search(id_faces[0].normed_embedding, k=5, exclude_user=user_id)
+            duplicates = [match.to_dict() for match in matches if match.similarity >= FACE_DUPLICATE_THRESHOLD]
+            duplicate_check = {
+                'flagged': bool(duplicates),
+                'threshold': FACE_DUPLICATE_THRESHOLD,
+                'matches': duplicates
+            }
+        
+        # Keep the verified ID face so later selfie re-checks (/verify-selfie) skip the ID photo
+        if is_valid and user_id and len(id_faces) == 1:
+            id_face = id_faces[0]
+            id_hash = image_hash(id_ctx.data)
+            face_store.put(user_id, id_hash, id_face.normed_embedding, id_face.det_score, id_face.bbox)
+            face_index.apply(lambda index: index.add(user_id, id_hash, id_face.normed_embedding))
+            prune_face_store()
+        
         return jsonify({
             'isValid': is_valid,
             'textValidation': text_validation,
@@ -659,6 +1105,7 @@ def validate_id():
             'extractedData': ocr_result,
             'idType': id_type,
             'isGovernmentId': is_government_id,
+            'duplicateCheck': duplicate_check,
             'errorMessage': None if is_valid else 'Cannot validate your credentials.'
         }), 200
         
@@ -668,104 +1115,43 @@ def validate_id():
             'errorMessage': 'Cannot validate your credentials.'
         }), 200
 
-def extract_text_internal(image_base64):
-    """Internal function to extract text from image with enhanced OCR for vertical text"""
+def _ocr_profile(kind, required_fields=()):
+    """Cache profile: everything besides the image bytes that affects the OCR result"""
+    mode = 'templates' if OCR_TEMPLATES_ENABLED else 'cascade'
+    return f"{kind}:{get_ocr_engine().name}:{mode}:{','.join(sorted(required_fields))}"
+
+def extract_text_internal(image, required_fields=ALL_FIELDS):
+    """
+    Internal function to extract text from image with enhanced OCR for vertical text
+    image: ImageContext or base64 string
+    required_fields: fields the OCR cascade must find before it may stop early
+    Results are cached by image content, so a retry with the same ID photo skips OCR.
+    """
     try:
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert PIL to OpenCV for preprocessing
-        import numpy as np
-        img_array = np.array(image)
-        img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        
-        # PREPROCESSING FOR BETTER OCR (especially vertical text)
-        # 1. Convert to grayscale
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        
-        # 2. Apply adaptive thresholding for better text contrast
-        thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
-        # 3. Apply morphological operations to clean up
-        kernel = np.ones((2, 2), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        
-        # 4. Convert back to PIL for Tesseract
-        processed_image = Image.fromarray(cleaned)
-        
-        # TRY MULTIPLE OCR CONFIGURATIONS FOR VERTICAL TEXT
-        all_texts = []
-        
-        # Configuration 1: Default (horizontal text)
-        config1 = '--oem 3 --psm 6'  # Uniform block of text
-        text1 = pytesseract.image_to_string(processed_image, lang='eng', config=config1)
-        if text1.strip():
-            all_texts.append(text1)
-        
-        # Configuration 2: Single column (for vertical text)
-        config2 = '--oem 3 --psm 4'  # Single column of text
-        text2 = pytesseract.image_to_string(processed_image, lang='eng', config=config2)
-        if text2.strip():
-            all_texts.append(text2)
-        
-        # Configuration 3: Single line (for ID numbers)
-        config3 = '--oem 3 --psm 7'  # Single line
-        text3 = pytesseract.image_to_string(processed_image, lang='eng', config=config3)
-        if text3.strip():
-            all_texts.append(text3)
-        
-        # Configuration 4: Single word (for vertical digits)
-        config4 = '--oem 3 --psm 8'  # Single word
-        text4 = pytesseract.image_to_string(processed_image, lang='eng', config=config4)
-        if text4.strip():
-            all_texts.append(text4)
-        
-        # Configuration 5: Sparse text (for vertical columns)
-        config5 = '--oem 3 --psm 11'  # Sparse text
-        text5 = pytesseract.image_to_string(processed_image, lang='eng', config=config5)
-        if text5.strip():
-            all_texts.append(text5)
-        
-        # Configuration 6: Raw line (for vertical digits with special chars)
-        config6 = '--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789*S'  # Digits and *S
-        text6 = pytesseract.image_to_string(processed_image, lang='eng', config=config6)
-        if text6.strip():
-            all_texts.append(text6)
-        
-        # Also try rotated versions for vertical text
-        for angle in [90, 180, 270]:
-            rotated = processed_image.rotate(angle, expand=True)
-            rotated_text = pytesseract.image_to_string(rotated, lang='eng', config='--oem 3 --psm 6')
-            if rotated_text.strip():
-                all_texts.append(rotated_text)
-        
-        # Combine all extracted texts (remove duplicates)
-        combined_text = '\n'.join(set(all_texts)) if all_texts else pytesseract.image_to_string(processed_image, lang='eng')
-        
-        # Fallback to original if preprocessing failed
-        if not combined_text.strip():
-            combined_text = pytesseract.image_to_string(image, lang='eng')
-        
-        return {
-            'rawText': combined_text,
-            'fullName': extract_name(combined_text),
-            'idNumber': extract_id_number(combined_text),
-            'dateOfBirth': extract_date_of_birth(combined_text)
-        }
+        ctx = ImageContext.wrap(image)
+    except Exception:
+        return None
+    
+    cache_key = make_key(ctx.data, _ocr_profile('validate', required_fields))
+    cached = ocr_cache.get(cache_key)
+    if cached is not None:
+        if cached.get('orientation'):
+            # Lets the face stage use the upright ID without detecting orientation again
+            ctx.set_text_orientation(cached['orientation'])
+        return dict(cached)
+    
+    try:
+        result = _extract_text_from_context(ctx, required_fields)
+        ocr_cache.put(cache_key, result)
+        return result
     except Exception as e:
         # print(f"OCR Error: {e}")
-        # Fallback to basic OCR
+        # Fallback to basic OCR (not cached, the failure may be transient)
         try:
-            image_data = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_data))
+            image = Image.open(io.BytesIO(ctx.data))
             if image.mode != 'RGB':
                 image = image.convert('RGB')
-            raw_text = pytesseract.image_to_string(image, lang='eng')
+            raw_text = _ocr_image(image)
             return {
                 'rawText': raw_text,
                 'fullName': extract_name(raw_text),
@@ -775,23 +1161,189 @@ def extract_text_internal(image_base64):
         except:
             return None
 
-def compare_faces_internal(id_image_base64, selfie_image_base64):
-    """Internal function to compare faces using InsightFace (correct implementation)"""
+def _extract_text_from_context(ctx, required_fields):
+    """Orientation, preprocessing, field zones and the OCR cascade for one decoded image"""
+    if ctx.bgr is None:
+        raise ValueError('Failed to decode image')
+    
+    # Rotate the card upright once (EXIF, then OSD / text-line estimate)
+    orientation = ctx.text_orientation
+    
+    # PREPROCESSING FOR BETTER OCR (especially vertical text)
+    # Grayscale -> adaptive threshold -> morphological close, memoized on the shared context
+    processed_image = Image.fromarray(ctx.thresholded)
+    
+    # FIELD ZONES: identify the card from its header and OCR only the field regions
+    if OCR_TEMPLATES_ENABLED:
+        template_result = extract_with_template(processed_image, _ocr_words_pass, required_fields,
+                                                gray=ctx.upright_gray)
+        if template_result:
+            fields = template_result['fields']
+            return {
+                'rawText': template_result['rawText'],
+                'fullName': fields['fullName'],
+                'idNumber': fields['idNumber'],
+                'dateOfBirth': fields['dateOfBirth'],
+                'ocrPasses': template_result['passes'],
+                'orientation': orientation,
+                'idTemplate': template_result['template'],
+                'idType': template_result['idType'],
+                'fieldConfidence': template_result['fieldConfidence']
+            }
+    
+    # CASCADE OF OCR CONFIGURATIONS (stops once the requested fields are found)
+    # Word-level passes are merged into one deduplicated, confidence-weighted text in reading order
+    merged, passes_run = run_cascade(
+        processed_image, _ocr_words_pass, score_extracted_fields,
+        required_fields=required_fields
+    )
+    combined_text = merged.text
+    
+    # Fallback to original if preprocessing failed
+    if not combined_text.strip():
+        combined_text = _ocr_image(Image.fromarray(ctx.upright_gray))
+    
+    scores = score_extracted_fields(merged) if merged.tokens else {}
+    return {
+        'rawText': combined_text,
+        'fullName': extract_name(combined_text),
+        'idNumber': extract_id_number(combined_text),
+        'dateOfBirth': extract_date_of_birth(combined_text),
+        'fieldConfidence': {field: scores.get(field, (None, 0.0))[1] for field in ALL_FIELDS},
+        'ocrPasses': passes_run,
+        'orientation': orientation
+    }
+
+def _ocr_pass(image, config):
+    """Run a single Tesseract pass (executed on an OCR pool worker)"""
+    return get_ocr_engine().image_to_string(image, config=config,
+                                            timeout=get_ocr_pool().pass_timeout)
+
+def _ocr_words_pass(image, config):
+    """Run a single word-level Tesseract pass (executed on an OCR pool worker)"""
+    return get_ocr_engine().image_to_data(image, config=config,
+                                          timeout=get_ocr_pool().pass_timeout)
+
+def _ocr_image(image, config=''):
+    """Run one OCR pass on the pool so it reuses the workers' engine handles"""
+    text = get_ocr_pool().map(_ocr_pass, [(image, config)])[0]
+    if text is None:
+        raise RuntimeError('OCR pass failed')
+    return text
+
+def _extract_text_result(image_data, run_ocr=_ocr_image):
+    """Basic single-pass OCR plus field extraction for /extract-text, cached by image content"""
+    cache_key = make_key(image_data, _ocr_profile('extract-text'))
+    cached = ocr_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    image = Image.open(io.BytesIO(image_data))
+    
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Perform OCR
+    raw_text = run_ocr(image)
+    
+    # Extract structured data
+    extracted_data = {
+        'rawText': raw_text,
+        'fullName': extract_name(raw_text),
+        'idNumber': extract_id_number(raw_text),
+        'dateOfBirth': extract_date_of_birth(raw_text)
+    }
+    ocr_cache.put(cache_key, extracted_data)
+    return extracted_data
+
+def _read_batch_path(path):
+    """Read a manifest entry, refusing anything that resolves outside OCR_BATCH_ROOT"""
+    root = os.path.realpath(OCR_BATCH_ROOT)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError('Path is outside the batch root')
+    with open(full_path, 'rb') as f:
+        return f.read()
+
+def _extract_text_batch_item(image_data, path):
+    """One /extract-text/batch image (executed on an OCR pool worker, so OCR runs in place)"""
     try:
-        id_image_data = base64.b64decode(id_image_base64)
-        selfie_image_data = base64.b64decode(selfie_image_base64)
-        
-        id_np = np.frombuffer(id_image_data, np.uint8)
-        selfie_np = np.frombuffer(selfie_image_data, np.uint8)
+        if image_data is None:
+            image_data = _read_batch_path(path)
+        return _extract_text_result(image_data, run_ocr=lambda image: _ocr_pass(image, ''))
+    except Exception as e:
+        return {'error': str(e)}
+
+def get_faces(contexts, model_name=FACE_MODEL_NAME):
+    """
+    Faces (bbox, kps, det_score, embedding) in the face view of each ImageContext, detected and
+    embedded on the face executor. Results are cached by image content, face view rotation and
+    model settings, so a selfie retry, or /compare-faces followed by /validate-id with the same
+    photos, does not detect and embed the same image again.
+    """
+    results = [None] * len(contexts)
+    keys = []
+    for i, ctx in enumerate(contexts):
+        rotation = ctx.text_orientation['rotation'] if ctx.orientation_known else 0
+        keys.append(make_key(ctx.data, f'{face_profile(model_name)}:{rotation}'))
+        cached = face_cache.get(keys[i])
+        if cached is not None:
+            # Fresh Face objects, so callers cannot change the cached entry
+            results[i] = [Face(face) for face in cached]
+    missing = [i for i, faces in enumerate(results) if faces is None]
+    if missing:
+        detected = get_face_executor(model_name).get_many([contexts[i].face_bgr() for i in missing])
+        for i, faces in zip(missing, detected):
+            face_cache.put(keys[i], [dict(face) for face in faces])
+            results[i] = faces
+    return results
+
+face_tiers = Counter()  # model tier -> comparisons it decided
+_face_tiers_lock = threading.Lock()
+
+def _usable_face(faces):
+    """Exactly one face that passes the endpoints' detection score and size checks"""
+    return len(faces) == 1 and faces[0].det_score >= 0.6 and faces[0].bbox[2] - faces[0].bbox[0] >= 100
+
+def get_pair_faces(id_ctx, selfie_ctx):
+    """
+    Faces of an ID / selfie pair and the model tier ('fast' or 'full') whose faces decide it.
+    With FACE_FAST_MODEL_NAME set the light pack scores the pair first; its faces are used when both
+    images have one usable face and the light similarity lies outside the uncertainty band (which
+    contains the 0.12 threshold). Otherwise the full pack runs and its checks and similarity decide.
+    """
+    tier = 'full'
+    if FACE_FAST_MODEL_NAME:
+        id_faces, selfie_faces = get_faces([id_ctx, selfie_ctx], FACE_FAST_MODEL_NAME)
+        if _usable_face(id_faces) and _usable_face(selfie_faces):
+            similarity = float(np.dot(id_faces[0].normed_embedding, selfie_faces[0].normed_embedding))
+            if not FACE_TIER_BAND_LOW <= similarity < FACE_TIER_BAND_HIGH:
+                tier = 'fast'
+    if tier == 'full':
+        id_faces, selfie_faces = get_faces([id_ctx, selfie_ctx])
+    with _face_tiers_lock:
+        face_tiers[tier] += 1
+    return id_faces, selfie_faces, tier
+
+def compare_faces_internal(id_image, selfie_image):
+    """
+    Internal function to compare faces using InsightFace (correct implementation)
+    id_image / selfie_image: ImageContext or base64 string
+    """
+    try:
+        id_ctx = ImageContext.wrap(id_image)
+        selfie_ctx = ImageContext.wrap(selfie_image)
         
-        id_cv = cv2.imdecode(id_np, cv2.IMREAD_COLOR)
-        selfie_cv = cv2.imdecode(selfie_np, cv2.IMREAD_COLOR)
+        # Decoded with EXIF orientation applied; the ID is also text-upright when OCR already ran
+        id_cv = id_ctx.face_bgr()
+        selfie_cv = selfie_ctx.face_bgr()
         
         if id_cv is None or selfie_cv is None:
             return {'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': 'Failed to decode images'}
         
-        id_faces = face_model.get(id_cv)
-        selfie_faces = face_model.get(selfie_cv)
+        id_faces, selfie_faces, tier = get_pair_faces(id_ctx, selfie_ctx)
+        id_ctx.faces, selfie_ctx.faces = id_faces, selfie_faces
         
         # Enforce exactly one face per image
         if len(id_faces) == 0:
@@ -843,102 +1395,12 @@ def compare_faces_internal(id_image_base64, selfie_image_base64):
             'isMatch': is_match,
             'confidence': float(similarity),
             'similarity': float(similarity),
-            'message': 'Face match confirmed' if is_match else f'Face does not match (similarity: {similarity:.2f}, required: {threshold})'
+            'message': 'Face match confirmed' if is_match else f'Face does not match (similarity: {similarity:.2f}, required: {threshold})',
+            'modelTier': tier
         }
     except Exception as e:
         return {'isMatch': False, 'confidence': 0.0, 'similarity': 0.0, 'message': f'Error: {str(e)}'}
 
-def extract_name(text):
-    """Extract name from OCR text"""
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    for line in lines[:5]:
-        if len(line) >= 3 and len(line) <= 40:
-            words = line.split()
-            if 2 <= len(words) <= 4:
-                if all(word.replace('-', '').replace("'", '').isalpha() for word in words):
-                    return line
-    return None
-
-def extract_id_number(text):
-    """Extract ID number from OCR text (handles vertical columns and prefixes like S)"""
-    import re
-    
-    # Pattern 1: Standard ID numbers (6-15 digits)
-    id_pattern1 = re.compile(r'\b\d{6,15}\b')
-    matches1 = id_pattern1.findall(text)
-    
-    # Pattern 2: ID with prefix (e.g., S548025, *S548025*)
-    id_pattern2 = re.compile(r'[S*]\s*\d{4,15}\s*[*]?', re.IGNORECASE)
-    matches2 = id_pattern2.findall(text)
-    
-    # Pattern 3: Vertical column format (digits separated by spaces/newlines)
-    # Extract all digits and try to find sequences
-    all_digits = re.findall(r'\d', text)
-    digit_sequence = ''.join(all_digits)
-    
-    # Try to find ID number patterns in digit sequence
-    id_pattern3 = re.compile(r'\d{6,15}')
-    matches3 = id_pattern3.findall(digit_sequence)
-    
-    # Combine all matches
-    all_matches = matches1 + [re.sub(r'[^\d]', '', m) for m in matches2] + matches3
-    
-    if all_matches:
-        # Return the longest match (most likely to be ID number)
-        return max(all_matches, key=len)
-    
-    return None
-
-def extract_date_of_birth(text):
-    """Extract date of birth from OCR text"""
-    import re
-    date_patterns = [
-        re.compile(r'\b\d{2}[/-]\d{2}[/-]\d{4}\b'),
-        re.compile(r'\b\d{4}[/-]\d{2}[/-]\d{2}\b'),
-        re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'),
-    ]
-    for pattern in date_patterns:
-        match = pattern.search(text)
-        if match:
-            return match.group(0)
-    return None
-
-def detect_id_type(text):
-    """Detect if ID is government-issued or student ID"""
-    text_lower = text.lower()
-    
-    government_indicators = [
-        'driver', 'driving', 'license', 'dl', 'd.l.',
-        'national id', 'national identification', 'nid', 'national identity',
-        'passport', 'passport no', 'passport number',
-        'department of motor vehicles', 'dmv', 'd.m.v.',
-        'department of state', 'ministry of', 'government',
-        'republic of', 'federal', 'state id', 'state identification',
-        'official', 'authorized', 'issued by', 'government issued',
-        'valid until', 'expires', 'expiration date',
-    ]
-    
-    student_indicators = [
-        'student', 'student id', 'student identification',
-        'university', 'college', 'school', 'academic',
-        'student number', 'matriculation', 'enrollment',
-        'campus', 'institution', 'educational',
-    ]
-    
-    gov_matches = sum(1 for indicator in government_indicators if indicator in text_lower)
-    student_matches = sum(1 for indicator in student_indicators if indicator in text_lower)
-    
-    if gov_matches >= 2:
-        return 'government'
-    elif student_matches >= 2:
-        return 'student'
-    elif gov_matches > 0:
-        return 'government'
-    elif student_matches > 0:
-        return 'student'
-    else:
-        return 'unknown'
-
 def validate_text(extracted_data, user_input_id_number, user_input_first_name, 
                   user_input_last_name, user_input_birthday):
     """Validate extracted text against user input using fuzzy matching"""
@@ -979,6 +1441,25 @@ def validate_text(extracted_data, user_input_id_number, user_input_first_name,
         'birthdayMatch': birthday_valid
     }
 
+def _warm_up_ocr():
+    """One dummy Tesseract pass per OCR worker (engine handles and traineddata are loaded on first use)"""
+    blank = Image.new('L', (200, 60), 255)
+    results = get_ocr_pool().map(_ocr_pass, [(blank, '--psm 6')] * get_ocr_pool().workers)
+    if any(text is None for text in results):
+        raise RuntimeError('OCR warm-up pass failed')
+
+# Warm-up: load and exercise every model before /ready reports the worker as routable
+readiness = Readiness()
+readiness.step('faceProviders', face_providers)
+readiness.step('faceModels', get_face_executor)
+readiness.step('faceWarmup', lambda: get_face_executor().warm_up())
+if FACE_FAST_MODEL_NAME:
+    readiness.step('fastFaceModels', lambda: get_face_executor(FACE_FAST_MODEL_NAME).warm_up())
+readiness.step('faceIndex', get_face_index)
+readiness.step('ocrWarmup', _warm_up_ocr)
+if WARMUP_ON_START:
+    readiness.start()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
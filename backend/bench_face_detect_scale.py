@@ -0,0 +1,115 @@
+"""
+Benchmark: fixed 640x640 detection vs adaptive detection resolution (FACE_ADAPTIVE_DET)
+Every image is also tested resized to several long-side lengths (thumbnails to large camera shots).
+For each, both paths detect faces; embeddings are always computed from the original pixels.
+Reports median detection latency and, per matched face, box IoU, det_score difference, embedding
+cosine similarity and whether the compare endpoints' face checks (det_score >= 0.6, width >= 100 px)
+reach the same verdict.
+Usage: python bench_face_detect_scale.py [images ...] [--sizes 320 640 1280 2560 4000] [--repeat N]
+(without images the InsightFace sample images are used)
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from face_executor import FaceModels, allowed_modules, session_options
+
+
+def median_ms(func, repeat):
+    func()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def iou(a, b):
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, right - left) * max(0.0, bottom - top)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def passes_checks(box, score):
+    return score >= 0.6 and box[2] - box[0] >= 100
+
+
+def embedding(models, img, kps):
+    from insightface.app.common import Face
+    face = Face(bbox=None, kps=kps, det_score=None)
+    models.models['recognition'].get(img, face)
+    return face.normed_embedding
+
+
+def load_images(paths):
+    if paths:
+        return [(path, cv2.imread(path)) for path in paths]
+    from insightface.data import get_image
+    return [(name, get_image(name)) for name in ('t1', 'Tom_Hanks_54745', 'mask_white')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='face images')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[320, 640, 1280, 2560, 4000],
+                        help='long-side lengths to resize every image to')
+    parser.add_argument('--repeat', type=int, default=10, help='timed calls per measurement (median is reported)')
+    args = parser.parse_args()
+
+    models = FaceModels(modules=allowed_modules(), options=session_options())
+    models.prepare(ctx_id=0, det_size=(640, 640))
+
+    print(f'{"image":24}{"size":>10}{"fixed ms":>10}{"adapt ms":>10}{"faces":>8}{"IoU":>7}'
+          f'{"dScore":>8}{"cosine":>8}{"verdict":>9}')
+    totals = {'fixed': 0.0, 'adaptive': 0.0, 'faces': 0, 'agree': 0, 'cosines': []}
+    for name, image in load_images(args.images):
+        if image is None:
+            print(f'{name}: unreadable, skipped')
+            continue
+        for size in args.sizes:
+            scale = size / max(image.shape[:2])
+            img = cv2.resize(image, None, fx=scale, fy=scale,
+                             interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+            fixed_ms = median_ms(lambda: models.detect_boxes(img, adaptive=False), args.repeat)
+            adaptive_ms = median_ms(lambda: models.detect_boxes(img, adaptive=True), args.repeat)
+            fixed_boxes, fixed_kps = models.detect_boxes(img, adaptive=False)
+            adaptive_boxes, adaptive_kps = models.detect_boxes(img, adaptive=True)
+            totals['fixed'] += fixed_ms
+            totals['adaptive'] += adaptive_ms
+
+            # Match every fixed-path face to its best adaptive-path face
+            ious, score_deltas, cosines, agree = [], [], [], 0
+            for i, box in enumerate(fixed_boxes):
+                best = max(range(len(adaptive_boxes)), key=lambda j: iou(box, adaptive_boxes[j]), default=None)
+                if best is None or iou(box, adaptive_boxes[best]) == 0:
+                    continue
+                other = adaptive_boxes[best]
+                ious.append(iou(box, other))
+                score_deltas.append(abs(box[4] - other[4]))
+                if 'recognition' in models.models and fixed_kps is not None:
+                    cosines.append(float(np.dot(embedding(models, img, fixed_kps[i]),
+                                                embedding(models, img, adaptive_kps[best]))))
+                agree += passes_checks(box, box[4]) == passes_checks(other, other[4])
+            totals['faces'] += len(fixed_boxes)
+            totals['agree'] += agree
+            totals['cosines'] += cosines
+            faces = f'{len(fixed_boxes)}/{len(adaptive_boxes)}'
+            print(f'{name[:23]:24}{f"{img.shape[1]}x{img.shape[0]}":>10}{fixed_ms:10.1f}{adaptive_ms:10.1f}{faces:>8}'
+                  f'{np.mean(ious) if ious else 0:7.3f}{np.mean(score_deltas) if score_deltas else 0:8.3f}'
+                  f'{np.mean(cosines) if cosines else 0:8.3f}{f"{agree}/{len(fixed_boxes)}":>9}')
+
+    print(f'\ntotal detection time: fixed {totals["fixed"]:.1f} ms, adaptive {totals["adaptive"]:.1f} ms '
+          f'({totals["fixed"] / totals["adaptive"] if totals["adaptive"] else 0:.2f}x)')
+    if totals['cosines']:
+        print(f'embedding cosine fixed vs adaptive: mean {np.mean(totals["cosines"]):.4f}, '
+              f'min {np.min(totals["cosines"]):.4f}')
+    print(f'face check verdicts agree: {totals["agree"]}/{totals["faces"]}')
+
+
+if __name__ == '__main__':
+    main()
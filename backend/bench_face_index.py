@@ -0,0 +1,85 @@
+"""
+Benchmark: face index top-k search at 10k / 100k / 1M stored faces
+Synthetic 512-d embeddings are clustered like real ones (several ID photos per person around an
+identity vector). For every size: load time, matrix memory, median exact search latency, and IVF
+search latency with its recall of the exact matches at or above the duplicate threshold (what gets flagged) and
+its top-1 agreement with exact search.
+Usage: python bench_face_index.py [--sizes 10000 100000 1000000] [--queries N] [--k N] [--nprobe N]
+(1M faces need about 2 GB for the float32 matrix)
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_index import FACE_DUPLICATE_THRESHOLD, FACE_INDEX_NPROBE, FaceIndex
+
+
+def synthetic_chunks(count: int, dim: int, rng: np.random.Generator, chunk: int = 50000):
+    """Unit vectors in chunks: about four noisy samples around each random identity"""
+    identities = rng.standard_normal((max(1, count // 4), dim), dtype=np.float32)
+    for start in range(0, count, chunk):
+        size = min(chunk, count - start)
+        embeddings = identities[rng.integers(0, len(identities), size)]
+        embeddings += rng.standard_normal((size, dim), dtype=np.float32) * 0.8
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        yield start, embeddings
+
+
+def median_ms(func, queries):
+    samples = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=FACE_INDEX_NPROBE)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--threshold', type=float, default=FACE_DUPLICATE_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"faces":>9}{"load s":>9}{"MB":>8}{"exact ms":>10}{"IVF build s":>13}{"IVF ms":>9}'
+          f'{"clusters":>10}{"dup recall":>12}{"top-1":>8}')
+    for size in args.sizes:
+        index = FaceIndex(dim=args.dim, ivf_min=0, nprobe=args.nprobe)
+        start = time.perf_counter()
+        for offset, embeddings in synthetic_chunks(size, args.dim, rng):
+            index.add_many((f'user{offset + i}', f'hash{offset + i}', vector) for i, vector in enumerate(embeddings))
+        load_s = time.perf_counter() - start
+        del embeddings
+
+        # Queries: new photos of stored identities, like a second account with the same face
+        # (noise of norm ~0.5 on a unit vector: cosine ~0.9 to the stored photo)
+        queries = index._matrix[rng.integers(0, size, args.queries)] + rng.standard_normal(
+            (args.queries, args.dim), dtype=np.float32) * (0.5 / np.sqrt(args.dim))
+
+        exact_ms, exact = median_ms(lambda q: index.search(q, k=args.k), queries)
+
+        start = time.perf_counter()
+        index.build_clusters()
+        build_s = time.perf_counter() - start
+        ivf_ms, approximate = median_ms(lambda q: index.search(q, k=args.k), queries)
+
+        found = relevant = 0
+        for a, e in zip(approximate, exact):
+            wanted = {m.user_id for m in e if m.similarity >= args.threshold}
+            relevant += len(wanted)
+            found += len(wanted & {m.user_id for m in a})
+        recall = found / relevant if relevant else 1.0
+        top1 = np.mean([bool(a) and a[0].user_id == e[0].user_id for a, e in zip(approximate, exact)])
+        stats = index.stats()
+        print(f'{size:9d}{load_s:9.2f}{size * args.dim * 4 / 2 ** 20:8.0f}{exact_ms:10.2f}{build_s:13.2f}'
+              f'{ivf_ms:9.2f}{stats["clusters"]:10d}{recall:12.3f}{top1:8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: InsightFace module set (FACE_MODULES) vs latency and resident memory
+Each module set is measured in a fresh process that imports app.py with FACE_MODULES set and loads the
+face models, so the resident memory of the loaded models is comparable. Per-image executor get() latency and the
+latency of /compare-face, /compare-faces and /validate-id (through the Flask test client) are timed.
+Usage: python bench_face_modules.py --id id.jpg --selfie selfie.jpg [--repeat N] [--modules all detection,recognition]
+(without --id / --selfie the InsightFace sample image 't1' is used for both)
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (Linux /proc, falls back to peak RSS elsewhere)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def load_images(args):
+    if args.id and args.selfie:
+        with open(args.id, 'rb') as f:
+            id_bytes = f.read()
+        with open(args.selfie, 'rb') as f:
+            selfie_bytes = f.read()
+        return id_bytes, selfie_bytes
+    import cv2
+    from insightface.data import get_image
+    ok, encoded = cv2.imencode('.jpg', get_image('t1'))
+    return encoded.tobytes(), encoded.tobytes()
+
+
+def timed(func, repeat) -> float:
+    """Median milliseconds per call"""
+    func()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def worker(args):
+    """Runs in the child process: import app with the module set and measure"""
+    import io
+    import cv2
+    import numpy as np
+
+    baseline = rss_mb()
+    import app as backend
+    executor = backend.get_face_executor()
+    loaded = rss_mb()
+
+    id_bytes, selfie_bytes = load_images(args)
+    id_bgr = cv2.imdecode(np.frombuffer(id_bytes, np.uint8), cv2.IMREAD_COLOR)
+    client = backend.app.test_client()
+    id_b64 = base64.b64encode(id_bytes).decode('ascii')
+    selfie_b64 = base64.b64encode(selfie_bytes).decode('ascii')
+
+    def compare_face():
+        client.post('/compare-face', content_type='multipart/form-data', data={
+            'id_image': (io.BytesIO(id_bytes), 'id.jpg'),
+            'selfie_image': (io.BytesIO(selfie_bytes), 'selfie.jpg'),
+        })
+
+    def compare_faces():
+        client.post('/compare-faces', json={'idImage': id_b64, 'selfieImage': selfie_b64})
+
+    def validate_id():
+        client.post('/validate-id', json={
+            'idImage': id_b64, 'selfieImage': selfie_b64,
+            'userInputIdNumber': '', 'userInputFirstName': '', 'userInputLastName': '',
+            'userType': 'professional',
+        })
+
+    result = {
+        'modules': backend.FACE_MODULES,
+        'loaded': sorted(executor.models),
+        'rssModelsMb': loaded - baseline,
+        'faceGetMs': timed(lambda: executor.get(id_bgr), args.repeat),
+        'compareFaceMs': timed(compare_face, args.repeat),
+        'compareFacesMs': timed(compare_faces, args.repeat),
+        'validateIdMs': timed(validate_id, args.repeat),
+    }
+    result['rssPeakMb'] = rss_mb()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--id', help='ID card image')
+    parser.add_argument('--selfie', help='selfie image')
+    parser.add_argument('--repeat', type=int, default=10, help='timed calls per measurement (median is reported)')
+    parser.add_argument('--modules', nargs='+', default=['all', 'detection,recognition'],
+                        help='FACE_MODULES values to compare')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    rows = []
+    for modules in args.modules:
+        env = dict(os.environ, FACE_MODULES=modules, WARMUP_ON_START='0')
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--repeat', str(args.repeat)]
+        if args.id and args.selfie:
+            command += ['--id', args.id, '--selfie', args.selfie]
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = [('rssModelsMb', 'models MB'), ('rssPeakMb', 'peak RSS MB'), ('faceGetMs', 'get() ms'),
+               ('compareFaceMs', '/compare-face'), ('compareFacesMs', '/compare-faces'), ('validateIdMs', '/validate-id')]
+    print(f'{"FACE_MODULES":26}' + ''.join(f'{title:>16}' for _, title in columns))
+    for row in rows:
+        print(f'{row["modules"]:26}' + ''.join(f'{row[key]:16.1f}' for key, _ in columns))
+        print(f'{"":26}loaded: {", ".join(row["loaded"])}')
+    if len(rows) > 1:
+        base = rows[0]
+        for row in rows[1:]:
+            print(f'\n{row["modules"]} vs {base["modules"]}:')
+            for key, title in columns:
+                saved = base[key] - row[key]
+                print(f'  {title:16} {saved:+10.1f} saved ({saved / base[key] * 100 if base[key] else 0:.0f}%)')
+
+
+if __name__ == '__main__':
+    main()
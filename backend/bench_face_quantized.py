@@ -0,0 +1,157 @@
+"""
+Report: FP32 vs INT8 face models on a labeled pair set
+pairs.csv rows are id_image,selfie_image,same (1 = same person, 0 = different; paths relative to the
+CSV). Every pair goes through the compare endpoints' checks (one face per image, det_score >= 0.6,
+width >= 100 px) and their cosine similarity, once with each model pack. The report gives:
+- genuine and impostor similarity percentiles
+- accept rates at the unchanged threshold (0.12)
+- verdict agreement and the per-pair similarity change between FP32 and INT8
+- FP32-vs-INT8 embedding cosine of the same images
+- median detection and recognition latency, and model sizes
+Usage: python bench_face_quantized.py pairs.csv [--int8-dir DIR] [--threshold 0.12] [--repeat N] [--output report.md]
+"""
+import argparse
+import csv
+import os
+import time
+
+import cv2
+import numpy as np
+
+from face_executor import FACE_MODEL_NAME, FaceModels, allowed_modules, model_dir, session_options
+
+FACE_THRESHOLD = 0.12  # compare_face / compare_faces / validate_id
+
+
+def load_pairs(path):
+    root = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#') or row[0] == 'id_image':
+                continue
+            pairs.append((os.path.join(root, row[0]), os.path.join(root, row[1]), row[2].strip() == '1'))
+    return pairs
+
+
+def single_face(models, img):
+    """The one usable face of img, or None when the compare endpoints would reject it"""
+    faces = models.get(img)
+    if len(faces) != 1:
+        return None
+    face = faces[0]
+    if face.det_score < 0.6 or face.bbox[2] - face.bbox[0] < 100:
+        return None
+    return face
+
+
+def evaluate(models, pairs, images):
+    """Similarity per pair (None when a check fails) and the embedding of every usable image"""
+    embeddings = {}
+    for path in {path for pair in pairs for path in pair[:2]}:
+        face = single_face(models, images[path]) if images[path] is not None else None
+        embeddings[path] = face.normed_embedding if face is not None else None
+    similarities = []
+    for id_path, selfie_path, _ in pairs:
+        a, b = embeddings[id_path], embeddings[selfie_path]
+        similarities.append(float(np.dot(a, b)) if a is not None and b is not None else None)
+    return similarities, embeddings
+
+
+def latency(models, images, repeat):
+    """Median ms of detection per image and of recognition per face crop"""
+    from insightface.utils import face_align
+    recognition = models.models['recognition']
+    detect, embed = [], []
+    for img in images:
+        models.detect_boxes(img)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bboxes, kpss = models.detect_boxes(img)
+            detect.append((time.perf_counter() - start) * 1000)
+        if kpss is None or not len(kpss):
+            continue
+        crop = face_align.norm_crop(img, landmark=kpss[0], image_size=recognition.input_size[0])
+        for _ in range(repeat):
+            start = time.perf_counter()
+            models.embed([crop])
+            embed.append((time.perf_counter() - start) * 1000)
+    return float(np.median(detect)) if detect else 0.0, float(np.median(embed)) if embed else 0.0
+
+
+def distribution(values):
+    if not values:
+        return 'n/a'
+    p = np.percentile(values, [0, 5, 50, 95, 100])
+    return ' / '.join(f'{v:.3f}' for v in p)
+
+
+def rate(values, threshold):
+    return f'{sum(v >= threshold for v in values)}/{len(values)}' if values else 'n/a'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pairs', help='CSV of id_image,selfie_image,same')
+    parser.add_argument('--name', default=FACE_MODEL_NAME)
+    parser.add_argument('--int8-dir', help='quantized pack (default: ~/.insightface/models/<name>_int8)')
+    parser.add_argument('--threshold', type=float, default=FACE_THRESHOLD)
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per image (median is reported)')
+    parser.add_argument('--output', help='also write the report to this markdown file')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs)
+    images = {path: cv2.imread(path) for pair in pairs for path in pair[:2]}
+    packs = {'fp32': model_dir(args.name, 'fp32'), 'int8': args.int8_dir or model_dir(args.name, 'int8')}
+
+    results = {}
+    for precision, directory in packs.items():
+        models = FaceModels(args.name, modules=allowed_modules(), options=session_options(), directory=directory)
+        models.prepare(ctx_id=0, det_size=(640, 640))
+        similarities, embeddings = evaluate(models, pairs, images)
+        detect_ms, embed_ms = latency(models, [img for img in images.values() if img is not None], args.repeat)
+        size_mb = sum(os.path.getsize(model.model_file) for model in models.models.values()) / 2 ** 20
+        results[precision] = (similarities, embeddings, detect_ms, embed_ms, size_mb, models.manifest)
+
+    lines = [f'# FP32 vs INT8 face models ({len(pairs)} pairs, threshold {args.threshold})', '']
+    manifest = results['int8'][5]
+    if manifest:
+        lines += [f'INT8 pack: {packs["int8"]} ({manifest.get("mode")} quantization, '
+                  f'{manifest.get("method")} calibration on {manifest.get("calibrationImages")} images, '
+                  f'onnxruntime {manifest.get("onnxruntime")})', '']
+    lines += ['| | FP32 | INT8 |', '|---|---|---|']
+    rows = {}
+    for precision, (similarities, _, detect_ms, embed_ms, size_mb, _) in results.items():
+        genuine = [s for s, pair in zip(similarities, pairs) if s is not None and pair[2]]
+        impostor = [s for s, pair in zip(similarities, pairs) if s is not None and not pair[2]]
+        rows.setdefault('genuine similarity min / p5 / p50 / p95 / max', []).append(distribution(genuine))
+        rows.setdefault('impostor similarity min / p5 / p50 / p95 / max', []).append(distribution(impostor))
+        rows.setdefault('genuine accepted', []).append(rate(genuine, args.threshold))
+        rows.setdefault('impostors accepted', []).append(rate(impostor, args.threshold))
+        rows.setdefault('pairs failing face checks', []).append(str(sum(s is None for s in similarities)))
+        rows.setdefault('detection ms (median per image)', []).append(f'{detect_ms:.1f}')
+        rows.setdefault('recognition ms (median per face)', []).append(f'{embed_ms:.1f}')
+        rows.setdefault('model size MB', []).append(f'{size_mb:.1f}')
+    lines += [f'| {label} | {values[0]} | {values[1]} |' for label, values in rows.items()]
+
+    fp32, int8 = results['fp32'][0], results['int8'][0]
+    both = [(a, b) for a, b in zip(fp32, int8) if a is not None and b is not None]
+    verdicts = sum((a is not None and a >= args.threshold) == (b is not None and b >= args.threshold)
+                   for a, b in zip(fp32, int8))
+    deltas = [abs(a - b) for a, b in both]
+    cosines = [float(np.dot(results['fp32'][1][path], results['int8'][1][path])) for path in images
+               if results['fp32'][1].get(path) is not None and results['int8'][1].get(path) is not None]
+    lines += ['', f'- verdicts agree: {verdicts}/{len(pairs)}',
+              f'- |similarity change|: mean {np.mean(deltas) if deltas else 0:.4f}, max {max(deltas, default=0):.4f}',
+              f'- FP32 vs INT8 embedding cosine per image: mean {np.mean(cosines) if cosines else 0:.4f}, '
+              f'min {min(cosines, default=0):.4f}']
+
+    report = '\n'.join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Microbenchmark: field_extraction engine vs the original per-call regex helpers
+Checks that both return identical results on a corpus of OCR outputs, then times them.
+Usage: python bench_field_extraction.py [--texts N] [--repeat N] [--corpus file.jsonl]
+(--corpus: one JSON string or {"text": "..."} per line, e.g. rawText values from /validate-id responses)
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import field_extraction
+
+
+# ---- Original helpers (as they were in app.py), kept here as the baseline ----
+
+def legacy_extract_name(text):
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    for line in lines[:5]:
+        if len(line) >= 3 and len(line) <= 40:
+            words = line.split()
+            if 2 <= len(words) <= 4:
+                if all(word.replace('-', '').replace("'", '').isalpha() for word in words):
+                    return line
+    return None
+
+
+def legacy_extract_id_number(text):
+    import re
+    id_pattern1 = re.compile(r'\b\d{6,15}\b')
+    matches1 = id_pattern1.findall(text)
+    id_pattern2 = re.compile(r'[S*]\s*\d{4,15}\s*[*]?', re.IGNORECASE)
+    matches2 = id_pattern2.findall(text)
+    all_digits = re.findall(r'\d', text)
+    digit_sequence = ''.join(all_digits)
+    id_pattern3 = re.compile(r'\d{6,15}')
+    matches3 = id_pattern3.findall(digit_sequence)
+    all_matches = matches1 + [re.sub(r'[^\d]', '', m) for m in matches2] + matches3
+    if all_matches:
+        return max(all_matches, key=len)
+    return None
+
+
+def legacy_extract_date_of_birth(text):
+    import re
+    date_patterns = [
+        re.compile(r'\b\d{2}[/-]\d{2}[/-]\d{4}\b'),
+        re.compile(r'\b\d{4}[/-]\d{2}[/-]\d{2}\b'),
+        re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'),
+    ]
+    for pattern in date_patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def legacy_detect_id_type(text):
+    text_lower = text.lower()
+    government_indicators = [
+        'driver', 'driving', 'license', 'dl', 'd.l.',
+        'national id', 'national identification', 'nid', 'national identity',
+        'passport', 'passport no', 'passport number',
+        'department of motor vehicles', 'dmv', 'd.m.v.',
+        'department of state', 'ministry of', 'government',
+        'republic of', 'federal', 'state id', 'state identification',
+        'official', 'authorized', 'issued by', 'government issued',
+        'valid until', 'expires', 'expiration date',
+    ]
+    student_indicators = [
+        'student', 'student id', 'student identification',
+        'university', 'college', 'school', 'academic',
+        'student number', 'matriculation', 'enrollment',
+        'campus', 'institution', 'educational',
+    ]
+    gov_matches = sum(1 for indicator in government_indicators if indicator in text_lower)
+    student_matches = sum(1 for indicator in student_indicators if indicator in text_lower)
+    if gov_matches >= 2:
+        return 'government'
+    elif student_matches >= 2:
+        return 'student'
+    elif gov_matches > 0:
+        return 'government'
+    elif student_matches > 0:
+        return 'student'
+    else:
+        return 'unknown'
+
+
+def legacy_all(text):
+    return (legacy_extract_name(text), legacy_extract_id_number(text),
+            legacy_extract_date_of_birth(text), legacy_detect_id_type(text))
+
+
+def engine_all(text):
+    # Uncached scan so the timing is one full extraction per text
+    result = field_extraction.FieldScan(text)
+    return result.name, result.id_number, result.date_of_birth, result.id_type
+
+
+# ---- Corpus ----
+
+SAMPLES = [
+    "REPUBLIKA NG PILIPINAS\nRepublic of the Philippines\nPAMBANSANG PAGKAKAKILANLAN\n"
+    "Philippine Identification Card\n1234-5678-9012-3456\nDELA CRUZ\nJUAN\nSANTOS\nJANUARY 01, 1990",
+    "REPUBLIC OF THE PHILIPPINES\nDEPARTMENT OF TRANSPORTATION\nLAND TRANSPORTATION OFFICE\n"
+    "NON-PROFESSIONAL DRIVER'S LICENSE\nDELA CRUZ, JUAN SANTOS\nPHL 1990/01/01 M\nN01-12-345678\n"
+    "Expiration Date 2027/01/01",
+    "JUAN DELA CRUZ\nUNIVERSITY OF THE PHILIPPINES\nCOLLEGE OF ENGINEERING\nSTUDENT NUMBER 2019-01234\n"
+    "*S548025*\nValid until 05/31/2025",
+    "Maria Clara\nSt. Mary's Academy\nStudent ID\n2 0 2 1\n0 0 4 5\n6 7\n03-15-2002",
+    "PASAPORTE PASSPORT\nP1234567A\nDELA CRUZ\nJUAN\n01 JAN 1990\nP<PHLDELA<CRUZ<<JUAN<<<<<<<<<<<<<<<<<<<<<",
+    "UNIFIED MULTI-PURPOSE ID\nCRN-0111-2345678-9\nSURNAME DELA CRUZ\nGIVEN NAME JUAN\n1990/01/01",
+    "",
+    "|||| ;;; ~~\n@@ 1 2 3\n",
+]
+
+_WORDS = ['REPUBLIC', 'OF', 'THE', 'PHILIPPINES', 'JUAN', 'DELA', 'CRUZ', 'MARIA', 'SANTOS', 'STUDENT',
+          'UNIVERSITY', 'COLLEGE', 'LICENSE', 'DRIVER', 'Name', 'Address', 'Sex', 'M', 'F', 'Blood',
+          'Type', 'O+', 'Signature', 'valid', 'until', 'issued', 'by', 'government', 'campus', 'ID']
+_NOISE = '|;:~_.,\'"`!-=*'
+
+
+def synthetic_text(rng: random.Random) -> str:
+    """Noisy multi-pass OCR output: real-ish lines, digit columns, dates and garbage"""
+    lines = []
+    for _ in range(rng.randint(5, 40)):
+        kind = rng.random()
+        if kind < 0.5:
+            lines.append(' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 6))))
+        elif kind < 0.65:
+            lines.append(str(rng.randint(10 ** 5, 10 ** 12)))
+        elif kind < 0.75:
+            lines.append(f'{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1950, 2010)}')
+        elif kind < 0.85:
+            lines.append(' '.join(str(rng.randint(0, 9)) for _ in range(rng.randint(1, 4))))
+        else:
+            lines.append(''.join(rng.choice(_NOISE + 'abcXYZ019') for _ in range(rng.randint(1, 30))))
+    return '\n'.join(lines)
+
+
+def load_corpus(args) -> list:
+    texts = list(SAMPLES)
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    item = json.loads(line)
+                    texts.append(item['text'] if isinstance(item, dict) else item)
+    rng = random.Random(1234)
+    texts.extend(synthetic_text(rng) for _ in range(args.texts))
+    return texts
+
+
+def timed(func, texts, repeat) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', type=int, default=2000, help='synthetic OCR outputs to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='timing repetitions (best is reported)')
+    parser.add_argument('--corpus', help='JSONL file of real OCR outputs to include')
+    args = parser.parse_args()
+
+    texts = load_corpus(args)
+    mismatches = [text for text in texts if legacy_all(text) != engine_all(text)]
+    if mismatches:
+        print(f'{len(mismatches)} of {len(texts)} texts differ, first one:')
+        print(repr(mismatches[0]))
+        print('legacy:', legacy_all(mismatches[0]))
+        print('engine:', engine_all(mismatches[0]))
+        sys.exit(1)
+
+    total_chars = sum(len(text) for text in texts)
+    legacy_time = timed(legacy_all, texts, args.repeat)
+    engine_time = timed(engine_all, texts, args.repeat)
+    print(f'corpus: {len(texts)} texts, {total_chars / len(texts):.0f} chars avg, results identical')
+    print(f'{"":10}{"total ms":>12}{"us/text":>12}')
+    for name, elapsed in (('legacy', legacy_time), ('engine', engine_time)):
+        print(f'{name:10}{elapsed * 1000:12.1f}{elapsed / len(texts) * 1e6:12.1f}')
+    print(f'speedup: {legacy_time / engine_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Calibration: uncertainty band of the fast face model tier (FACE_TIER_BAND_LOW / FACE_TIER_BAND_HIGH)
+Scores a labeled pair set with the light pack and the full pack (same checks as the endpoints) and
+picks the band around the 0.12 threshold. The band is as narrow as possible while the light pack's
+decisions outside it disagree with the full pack's on at most --max-disagreement of the pairs
+(half the budget on each side), then widened by --margin. Reports how many pairs the fast tier
+would decide, its disagreements with the full pack, error rates against the labels for full-only
+and tiered, and the expected comparison latency.
+pairs.csv rows: id_image,selfie_image,same (1 = same person, 0 = different; paths relative to the CSV)
+Usage: python calibrate_face_tiers.py pairs.csv [--fast buffalo_s] [--max-disagreement 0.0] [--margin 0.02]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from bench_face_quantized import FACE_THRESHOLD, evaluate, load_pairs
+from face_executor import FACE_FAST_MODEL_NAME, FACE_MODEL_NAME, FaceModels, allowed_modules, session_options
+
+
+def score(name, pairs, images):
+    """Similarity per pair (None when a check fails) and milliseconds per image"""
+    models = FaceModels(name, modules=allowed_modules(), options=session_options())
+    models.prepare(ctx_id=0, det_size=(640, 640))
+    evaluate(models, pairs[:1], images)  # warm-up
+    start = time.perf_counter()
+    similarities, _ = evaluate(models, pairs, images)
+    return similarities, (time.perf_counter() - start) * 1000 / max(1, len(images))
+
+
+def pick_band(fast, full, threshold, max_disagreement, margin):
+    """(low, high) with low <= threshold <= high"""
+    allowed = int(max_disagreement * len(fast) / 2)
+    decided = [(f, h is not None and h >= threshold) for f, h in zip(fast, full) if f is not None]
+    # Below low the fast tier rejects: the full pack's accepts there are disagreements
+    accepts = sorted(f for f, accept in decided if accept and f < threshold)
+    low = accepts[allowed] if len(accepts) > allowed else threshold
+    # At or above high the fast tier accepts: the full pack's rejects there are disagreements
+    rejects = sorted((f for f, accept in decided if not accept and f >= threshold), reverse=True)
+    high = float(np.nextafter(rejects[allowed], np.inf)) if len(rejects) > allowed else threshold
+    return min(low, threshold) - margin, max(high, threshold) + margin
+
+
+def tiered(fast, full, low, high):
+    """Similarity that decides each pair and whether the fast tier decided it"""
+    results = []
+    for f, h in zip(fast, full):
+        if f is not None and not low <= f < high:
+            results.append((f, True))
+        else:
+            results.append((h, False))
+    return results
+
+
+def error_rates(similarities, pairs, threshold):
+    genuine = [s is not None and s >= threshold for s, pair in zip(similarities, pairs) if pair[2]]
+    impostor = [s is not None and s >= threshold for s, pair in zip(similarities, pairs) if not pair[2]]
+    false_reject = genuine.count(False) / len(genuine) if genuine else 0.0
+    false_accept = impostor.count(True) / len(impostor) if impostor else 0.0
+    return false_reject, false_accept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pairs', help='CSV of id_image,selfie_image,same')
+    parser.add_argument('--fast', default=FACE_FAST_MODEL_NAME or 'buffalo_s', help='light model pack')
+    parser.add_argument('--full', default=FACE_MODEL_NAME, help='full model pack')
+    parser.add_argument('--threshold', type=float, default=FACE_THRESHOLD)
+    parser.add_argument('--max-disagreement', type=float, default=0.0,
+                        help='share of pairs the fast tier may decide differently from the full pack')
+    parser.add_argument('--margin', type=float, default=0.02, help='added on both sides of the fitted band')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs)
+    images = {path: cv2.imread(path) for pair in pairs for path in pair[:2]}
+    fast, fast_ms = score(args.fast, pairs, images)
+    full, full_ms = score(args.full, pairs, images)
+
+    low, high = pick_band(fast, full, args.threshold, args.max_disagreement, args.margin)
+    decisions = tiered(fast, full, low, high)
+    by_fast = sum(decided_fast for _, decided_fast in decisions)
+    disagreements = sum((s is not None and s >= args.threshold) != (h is not None and h >= args.threshold)
+                        for (s, decided_fast), h in zip(decisions, full) if decided_fast)
+    full_frr, full_far = error_rates(full, pairs, args.threshold)
+    tier_frr, tier_far = error_rates([s for s, _ in decisions], pairs, args.threshold)
+    escalated = 1 - by_fast / len(pairs) if pairs else 0.0
+    # Per comparison: two images with the light pack, plus two with the full pack when escalated
+    tiered_ms = 2 * fast_ms + escalated * 2 * full_ms
+
+    print(f'{len(pairs)} pairs, threshold {args.threshold}, fast {args.fast}, full {args.full}')
+    print(f'band: [{low:.4f}, {high:.4f})')
+    print(f'decided by the fast tier: {by_fast}/{len(pairs)} ({by_fast / len(pairs) * 100 if pairs else 0:.1f}%), '
+          f'{disagreements} disagree with {args.full}')
+    print(f'false reject / false accept vs labels: full only {full_frr:.4f} / {full_far:.4f}, '
+          f'tiered {tier_frr:.4f} / {tier_far:.4f}')
+    print(f'face inference per comparison: full only {2 * full_ms:.1f} ms, tiered {tiered_ms:.1f} ms '
+          f'({args.fast} {fast_ms:.1f} ms, {args.full} {full_ms:.1f} ms per image)')
+    print(f'\nFACE_FAST_MODEL_NAME={args.fast} FACE_TIER_BAND_LOW={low:.4f} FACE_TIER_BAND_HIGH={high:.4f}')
+
+
+if __name__ == '__main__':
+    main()
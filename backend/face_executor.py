@@ -0,0 +1,523 @@
+"""
+Face inference executor
+Owns N independently configured copies of the InsightFace models (one set of ONNX Runtime sessions
+each, with explicit intra-op / inter-op thread counts) and one worker thread per copy.
+Requests are queued on the least-loaded session, so parallel verifications run side by side on
+separate cores instead of oversubscribing one shared model. Recognition of the aligned face crops
+is micro-batched across concurrent requests.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import ensure_available, face_align
+
+from graph_cache import LEVEL_NAMES, load_model
+from graph_cache import stats as graph_cache_stats
+
+# Model pack and the modules to load from it. The compare endpoints only use bbox, det_score
+# and normed_embedding, so landmarks and gender/age are skipped unless asked for
+# (comma-separated module names, or "all")
+FACE_MODEL_NAME = os.environ.get('FACE_MODEL_NAME', 'buffalo_l')
+FACE_MODULES = os.environ.get('FACE_MODULES', 'detection,recognition')
+# Model precision: 'fp32' (the pack as downloaded) or 'int8' (produced offline by
+# quantize_face_models.py into ~/.insightface/models/<name>_int8); FACE_MODEL_DIR overrides the directory
+FACE_MODEL_PRECISION = os.environ.get('FACE_MODEL_PRECISION', 'fp32')
+FACE_MODEL_DIR = os.environ.get('FACE_MODEL_DIR', '')
+# Model tiers: a light pack (e.g. buffalo_s) scores every pair first and FACE_MODEL_NAME only runs
+# when the light similarity falls inside [FACE_TIER_BAND_LOW, FACE_TIER_BAND_HIGH) ('' = one tier).
+# The band must contain the 0.12 match threshold; calibrate_face_tiers.py picks it
+FACE_FAST_MODEL_NAME = os.environ.get('FACE_FAST_MODEL_NAME', '')
+FACE_TIER_BAND_LOW = float(os.environ.get('FACE_TIER_BAND_LOW', 0.0))
+FACE_TIER_BAND_HIGH = float(os.environ.get('FACE_TIER_BAND_HIGH', 0.35))
+FACE_DET_SIZE = int(os.environ.get('FACE_DET_SIZE', 640))
+# Detect on a reduced copy of large images and at native size for small ones (boxes are mapped
+# back, alignment and embedding use the original pixels); 0 = always detect at FACE_DET_SIZE
+FACE_ADAPTIVE_DET = os.environ.get('FACE_ADAPTIVE_DET', '1') == '1'
+FACE_PROVIDERS = ['CPUExecutionProvider']  # reference provider, and fallback for unsupported operators
+# Execution providers of the serving sessions: 'auto' benchmarks the installed CPU providers at startup
+# and keeps the fastest whose embeddings match the default CPU provider's (cosine >= FACE_PROVIDER_MIN_COSINE);
+# anything else pins a comma-separated list, e.g. OpenVINOExecutionProvider,CPUExecutionProvider
+# (or CUDAExecutionProvider,CPUExecutionProvider if GPU available)
+FACE_PROVIDER = os.environ.get('FACE_PROVIDER', 'auto')
+FACE_PROVIDER_MIN_COSINE = float(os.environ.get('FACE_PROVIDER_MIN_COSINE', 0.999))
+FACE_PROVIDER_BENCH_RUNS = int(os.environ.get('FACE_PROVIDER_BENCH_RUNS', 5))
+# Accelerated CPU providers tried by 'auto', besides the default one
+CPU_PROVIDERS = ('OpenVINOExecutionProvider', 'DnnlExecutionProvider', 'XnnpackExecutionProvider')
+# Model copies serving requests side by side. Every session is a full copy of the loaded modules
+# (roughly the pack's ONNX size resident, ~200 MB for buffalo_l detection + recognition, plus the
+# memory arena), and the fast tier (FACE_FAST_MODEL_NAME) builds as many again, so raise it only
+# when there is memory to spare and one session cannot keep the cores busy
+FACE_SESSIONS = int(os.environ.get('FACE_SESSIONS', 1))
+# Threads per session (default: the cores split between the sessions); sessions x intra-op threads
+# should not exceed the cores
+FACE_INTRA_OP_THREADS = int(os.environ.get('FACE_INTRA_OP_THREADS', max(1, (os.cpu_count() or 1) // max(1, FACE_SESSIONS))))
+FACE_INTER_OP_THREADS = int(os.environ.get('FACE_INTER_OP_THREADS', 1))
+# Graph optimization level (disabled | basic | extended | all); optimized graphs are saved and
+# reused across starts (see graph_cache.py)
+FACE_GRAPH_OPT_LEVEL = os.environ.get('FACE_GRAPH_OPT_LEVEL', 'all')
+# CPU memory arena and memory pattern planning (0 = off: lower resident memory per session,
+# at the cost of allocating on every inference)
+FACE_MEM_ARENA = os.environ.get('FACE_MEM_ARENA', '1') == '1'
+FACE_MEM_PATTERN = os.environ.get('FACE_MEM_PATTERN', '1') == '1'
+# Recognition micro-batching: aligned crops from concurrent requests are embedded together,
+# waiting at most FACE_BATCH_WAIT_MS after the first crop or until FACE_BATCH_SIZE crops (1 = off)
+FACE_BATCH_SIZE = int(os.environ.get('FACE_BATCH_SIZE', 16))
+FACE_BATCH_WAIT_MS = float(os.environ.get('FACE_BATCH_WAIT_MS', 3))
+
+
+def model_dir(name: str = FACE_MODEL_NAME, precision: str = FACE_MODEL_PRECISION) -> str:
+    """Directory holding the ONNX files of the model pack at this precision"""
+    if FACE_MODEL_DIR and name == FACE_MODEL_NAME:
+        return os.path.expanduser(FACE_MODEL_DIR)
+    if precision == 'fp32':
+        return ensure_available('models', name, root='~/.insightface')
+    return os.path.join(os.path.expanduser('~/.insightface'), 'models', f'{name}_{precision}')
+
+
+def read_manifest(directory: str) -> Dict:
+    """quantization.json written next to quantized models ({} for an FP32 pack)"""
+    path = os.path.join(directory, 'quantization.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def face_profile(name: str = FACE_MODEL_NAME) -> str:
+    """Everything besides the image that affects detected faces and embeddings (for cache keys)"""
+    return (f'faces:{name}:{FACE_MODEL_PRECISION}:{FACE_MODEL_DIR if name == FACE_MODEL_NAME else ""}:'
+            f'{FACE_MODULES}:{FACE_DET_SIZE}:{int(FACE_ADAPTIVE_DET)}')
+
+
+def allowed_modules() -> Optional[List[str]]:
+    if FACE_MODULES == 'all':
+        return None
+    return [module.strip() for module in FACE_MODULES.split(',') if module.strip()]
+
+
+def detection_frame(img: np.ndarray, det_size: int = FACE_DET_SIZE):
+    """
+    Image and detector input size to detect on, plus the (x, y) factors mapping its coordinates
+    back to img. Large images are reduced by the largest power of two that keeps their long side
+    at or above det_size (the detector then only resizes by less than 2x); images smaller than
+    det_size are detected at native size instead of being upscaled.
+    """
+    height, width = img.shape[:2]
+    long_side = max(height, width)
+    factor = 1
+    while long_side / (factor * 2) >= det_size:
+        factor *= 2
+    if factor > 1:
+        frame = cv2.resize(img, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+        return frame, None, (width / frame.shape[1], height / frame.shape[0])
+    if long_side < det_size:
+        input_size = (-(-width // 32) * 32, -(-height // 32) * 32)
+        return img, input_size, (1.0, 1.0)
+    return img, None, (1.0, 1.0)
+
+
+def session_options(intra_op_threads: int = FACE_INTRA_OP_THREADS,
+                    inter_op_threads: int = FACE_INTER_OP_THREADS) -> onnxruntime.SessionOptions:
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    levels = {name: level for level, name in LEVEL_NAMES.items()}
+    if FACE_GRAPH_OPT_LEVEL not in levels:
+        raise ValueError(f'FACE_GRAPH_OPT_LEVEL must be one of {", ".join(levels)}')
+    options.graph_optimization_level = levels[FACE_GRAPH_OPT_LEVEL]
+    options.enable_cpu_mem_arena = FACE_MEM_ARENA
+    options.enable_mem_pattern = FACE_MEM_PATTERN
+    return options
+
+
+class FaceModels(FaceAnalysis):
+    """FaceAnalysis whose ONNX Runtime sessions are built with the given session options"""
+
+    def __init__(self, name: str = FACE_MODEL_NAME, modules: Optional[List[str]] = None,
+                 options: Optional[onnxruntime.SessionOptions] = None, providers: List[str] = FACE_PROVIDERS,
+                 directory: Optional[str] = None):
+        onnxruntime.set_default_logger_severity(3)
+        self.models = {}
+        self.model_dir = directory or model_dir(name)
+        onnx_files = sorted(glob.glob(os.path.join(self.model_dir, '*.onnx')))
+        if not onnx_files:
+            raise FileNotFoundError(f'No ONNX models in {self.model_dir} '
+                                    f'(quantized packs are built with quantize_face_models.py)')
+        self.manifest = read_manifest(self.model_dir)
+        for onnx_file in onnx_files:
+            model = load_model(onnx_file, options, providers)
+            if model is None or (modules is not None and model.taskname not in modules):
+                continue
+            # ArcFaceONNX guesses its input normalization from the first graph node names, which
+            # quantization rewrites; use the values the FP32 model was loaded with
+            normalization = self.manifest.get('models', {}).get(os.path.basename(onnx_file), {})
+            if 'input_mean' in normalization:
+                model.input_mean = normalization['input_mean']
+                model.input_std = normalization['input_std']
+            self.models.setdefault(model.taskname, model)
+        assert 'detection' in self.models
+        self.det_model = self.models['detection']
+
+    def detect_boxes(self, img, adaptive: bool = FACE_ADAPTIVE_DET):
+        """Boxes (with scores) and keypoints in img coordinates"""
+        if not adaptive:
+            return self.det_model.detect(img, max_num=0, metric='default')
+        frame, input_size, (scale_x, scale_y) = detection_frame(img, self.det_size[0])
+        bboxes, kpss = self.det_model.detect(frame, input_size=input_size, max_num=0, metric='default')
+        if frame is not img:
+            bboxes[:, [0, 2]] *= scale_x
+            bboxes[:, [1, 3]] *= scale_y
+            if kpss is not None:
+                kpss[..., 0] *= scale_x
+                kpss[..., 1] *= scale_y
+        return bboxes, kpss
+
+    def detect(self, img) -> List[Any]:
+        """FaceAnalysis.get without the recognition model (embeddings are computed in batches)"""
+        bboxes, kpss = self.detect_boxes(img)
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            for taskname, model in self.models.items():
+                if taskname not in ('detection', 'recognition'):
+                    model.get(img, face)
+            faces.append(face)
+        return faces
+
+    def get(self, img, max_num=0) -> List[Any]:
+        """FaceAnalysis.get with the detection resolution chosen per image"""
+        faces = self.detect(img)
+        if 'recognition' in self.models:
+            for face in faces:
+                self.models['recognition'].get(img, face)
+        return faces
+
+    def embed(self, crops: List) -> Any:
+        """Embeddings (one row per aligned crop) in a single recognition call"""
+        return self.models['recognition'].get_feat(crops)
+
+    def warm_up(self):
+        """Dummy detection and recognition so ONNX Runtime's first-run initialization is paid up front"""
+        self.detect_boxes(np.zeros((self.det_size[1], self.det_size[0], 3), dtype=np.uint8), adaptive=False)
+        if 'recognition' in self.models:
+            size = self.models['recognition'].input_size
+            self.embed([np.zeros((size[1], size[0], 3), dtype=np.uint8)])
+
+
+class FaceSession:
+    """One model copy with its own queue, served by a dedicated worker thread"""
+
+    def __init__(self, index: int, models: FaceModels):
+        self.index = index
+        self.models = models
+        self.queue: deque = deque()
+        self.busy_seconds = 0.0
+        self.completed = 0
+        self.running = False
+
+    def stats(self) -> Dict:
+        return {
+            'session': self.index,
+            'queueDepth': len(self.queue) + int(self.running),
+            'busySeconds': round(self.busy_seconds, 3),
+            'completed': self.completed,
+        }
+
+
+class RecognitionBatcher:
+    """Collects aligned face crops from concurrent requests and embeds them in batches"""
+
+    def __init__(self, executor: 'FaceExecutor', max_batch: int = FACE_BATCH_SIZE,
+                 max_wait_ms: float = FACE_BATCH_WAIT_MS):
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._cond = threading.Condition()
+        # (crop, future, arrival time)
+        self._pending: deque = deque()
+        self.histogram: Counter = Counter()
+        threading.Thread(target=self._collector, name='face-batcher', daemon=True).start()
+
+    def embed(self, crop) -> Future:
+        """Queue one aligned crop; the future resolves to its embedding"""
+        future = Future()
+        with self._cond:
+            self._pending.append((crop, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def _collector(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Wait for more crops until the first one has waited long enough or the batch is full
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                self.histogram[len(batch)] += 1
+
+            futures = [future for _, future, _ in batch]
+            result = self.executor.submit(FaceModels.embed, [crop for crop, _, _ in batch])
+            result.add_done_callback(lambda done, futures=futures: self._distribute(done, futures))
+
+    @staticmethod
+    def _distribute(done: Future, futures: List[Future]):
+        try:
+            embeddings = done.result()
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, embedding in zip(futures, embeddings):
+            future.set_result(embedding)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            histogram = dict(sorted(self.histogram.items()))
+        batches = sum(histogram.values())
+        crops = sum(size * count for size, count in histogram.items())
+        return {
+            'maxBatch': self.max_batch,
+            'maxWaitMs': self.max_wait * 1000,
+            'batches': batches,
+            'meanBatchSize': crops / batches if batches else 0.0,
+            'histogram': {str(size): count for size, count in histogram.items()},
+        }
+
+
+class FaceExecutor:
+    """Pool of face model sessions; work goes to the session with the shortest queue"""
+
+    def __init__(self, sessions: int = FACE_SESSIONS, det_size: int = FACE_DET_SIZE, name: str = FACE_MODEL_NAME,
+                 providers: List[str] = FACE_PROVIDERS):
+        self.name = name
+        self.providers = providers
+        self._cond = threading.Condition()
+        self.sessions: List[FaceSession] = []
+        self._started = time.monotonic()
+        for i in range(max(1, sessions)):
+            models = FaceModels(name, modules=allowed_modules(), options=session_options(), providers=providers)
+            models.prepare(ctx_id=0, det_size=(det_size, det_size))
+            session = FaceSession(i, models)
+            self.sessions.append(session)
+            threading.Thread(target=self._worker, args=(session,), name=f'face-{name}-{i}', daemon=True).start()
+        self.batcher = RecognitionBatcher(self) if FACE_BATCH_SIZE > 1 and 'recognition' in self.models else None
+
+    @property
+    def models(self) -> Dict:
+        """Loaded models by task name (the same set in every session)"""
+        return self.sessions[0].models.models
+
+    def _worker(self, session: FaceSession):
+        while True:
+            with self._cond:
+                while not session.queue:
+                    self._cond.wait()
+                func, args, future = session.queue.popleft()
+                session.running = True
+
+            if future.set_running_or_notify_cancel():
+                start = time.monotonic()
+                try:
+                    future.set_result(func(session.models, *args))
+                except BaseException as e:
+                    future.set_exception(e)
+                elapsed = time.monotonic() - start
+            else:
+                elapsed = 0.0
+
+            with self._cond:
+                session.running = False
+                session.busy_seconds += elapsed
+                session.completed += 1
+
+    def submit(self, func: Callable, *args) -> Future:
+        """Run func(models, *args) on the least-loaded session"""
+        future = Future()
+        with self._cond:
+            session = min(self.sessions, key=lambda s: (len(s.queue) + int(s.running), s.busy_seconds))
+            session.queue.append((func, args, future))
+            self._cond.notify_all()
+        return future
+
+    def warm_up(self):
+        """Run FaceModels.warm_up on every session (not just the least loaded) and wait for all of them"""
+        futures = []
+        with self._cond:
+            for session in self.sessions:
+                future = Future()
+                session.queue.append((FaceModels.warm_up, (), future))
+                futures.append(future)
+            self._cond.notify_all()
+        for future in futures:
+            future.result()
+
+    def get(self, img) -> List[Any]:
+        """Detect faces and compute their embeddings (same result as FaceAnalysis.get)"""
+        return self.get_many([img])[0]
+
+    def get_many(self, imgs: Sequence) -> List[List[Any]]:
+        """FaceAnalysis.get for several images: detection in parallel, recognition batched"""
+        if self.batcher is None:
+            futures = [self.submit(FaceModels.get, img) for img in imgs]
+            return [future.result() for future in futures]
+
+        detections = [self.submit(FaceModels.detect, img) for img in imgs]
+        results = []
+        pending = []
+        image_size = self.models['recognition'].input_size[0]
+        for img, detection in zip(imgs, detections):
+            faces = detection.result()
+            for face in faces:
+                crop = face_align.norm_crop(img, landmark=face.kps, image_size=image_size)
+                pending.append((face, self.batcher.embed(crop)))
+            results.append(faces)
+        for face, embedding in pending:
+            face.embedding = embedding.result().flatten()
+        return results
+
+    def stats(self) -> Dict:
+        with self._cond:
+            uptime = time.monotonic() - self._started
+            sessions = [session.stats() for session in self.sessions]
+        for session in sessions:
+            session['utilization'] = round(session['busySeconds'] / uptime, 3) if uptime else 0.0
+        return {
+            'model': self.name,
+            'providers': self.providers,
+            'sessions': sessions,
+            'intraOpThreads': FACE_INTRA_OP_THREADS,
+            'interOpThreads': FACE_INTER_OP_THREADS,
+            'graphOptLevel': FACE_GRAPH_OPT_LEVEL,
+            'memArena': FACE_MEM_ARENA,
+            'memPattern': FACE_MEM_PATTERN,
+            'graphCache': graph_cache_stats(),
+            'modules': sorted(self.models),
+            'precision': self.sessions[0].models.manifest.get('precision', 'fp32'),
+            'modelDir': self.sessions[0].models.model_dir,
+            'recognitionBatches': self.batcher.stats() if self.batcher is not None else None,
+        }
+
+
+def benchmark_providers(providers: List[str], image: np.ndarray, crop: Optional[np.ndarray] = None,
+                        runs: int = FACE_PROVIDER_BENCH_RUNS) -> Dict:
+    """
+    Load the serving model pack on providers and time detection of image and recognition of one
+    aligned face crop (median ms). Without crop, the crop is aligned from this run's first detection
+    """
+    models = FaceModels(FACE_MODEL_NAME, modules=allowed_modules(), options=session_options(), providers=providers)
+    models.prepare(ctx_id=0, det_size=(FACE_DET_SIZE, FACE_DET_SIZE))
+    models.warm_up()
+    detect = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        bboxes, kpss = models.detect_boxes(image)
+        detect.append((time.perf_counter() - start) * 1000)
+    result = {'providers': providers, 'faces': int(len(bboxes)), 'detectMs': round(float(np.median(detect)), 2),
+              'embedMs': 0.0, 'crop': crop, 'embedding': None}
+    if 'recognition' in models.models:
+        size = models.models['recognition'].input_size[0]
+        if crop is None:
+            crop = (face_align.norm_crop(image, landmark=kpss[0], image_size=size) if kpss is not None and len(kpss)
+                    else cv2.resize(image, (size, size)))
+        embed = []
+        for _ in range(max(1, runs)):
+            start = time.perf_counter()
+            embedding = models.embed([crop])[0]
+            embed.append((time.perf_counter() - start) * 1000)
+        result.update({'embedMs': round(float(np.median(embed)), 2), 'crop': crop,
+                       'embedding': embedding / np.linalg.norm(embedding)})
+    return result
+
+
+def select_providers() -> Dict:
+    """
+    Provider choice with the measurements behind it. Each installed accelerated CPU provider runs the
+    serving pack on InsightFace's sample group photo next to the default CPU provider; the fastest
+    (detection + recognition) that finds the same faces and gives a matching embedding is kept
+    """
+    if FACE_PROVIDER != 'auto':
+        return {'mode': 'pinned', 'providers': [p.strip() for p in FACE_PROVIDER.split(',') if p.strip()]}
+    available = onnxruntime.get_available_providers()
+    candidates = [provider for provider in CPU_PROVIDERS if provider in available]
+    if not candidates:
+        return {'mode': 'auto', 'providers': FACE_PROVIDERS, 'available': available}
+
+    from insightface.data import get_image
+    start = time.monotonic()
+    image = get_image('t1')
+    reference = benchmark_providers(FACE_PROVIDERS, image)
+    reference.update({'cosine': 1.0, 'consistent': True})
+    results = [reference]
+    for provider in candidates:
+        providers = [provider] + FACE_PROVIDERS
+        try:
+            result = benchmark_providers(providers, image, reference['crop'])
+        except Exception as e:
+            results.append({'providers': providers, 'consistent': False, 'error': str(e)})
+            continue
+        cosine = (float(np.dot(result['embedding'], reference['embedding']))
+                  if reference['embedding'] is not None else None)
+        result['cosine'] = round(cosine, 6) if cosine is not None else None
+        result['consistent'] = (result['faces'] == reference['faces']
+                                and (cosine is None or cosine >= FACE_PROVIDER_MIN_COSINE))
+        results.append(result)
+    best = min((r for r in results if r['consistent']), key=lambda r: r['detectMs'] + r['embedMs'])
+    return {
+        'mode': 'auto',
+        'providers': best['providers'],
+        'available': available,
+        'seconds': round(time.monotonic() - start, 3),
+        'candidates': [{key: value for key, value in r.items() if key not in ('crop', 'embedding')} for r in results],
+    }
+
+
+_provider_selection: Optional[Dict] = None
+_provider_lock = threading.Lock()
+
+
+def face_providers() -> List[str]:
+    """Execution providers of the serving sessions (selected on first use, see FACE_PROVIDER)"""
+    global _provider_selection
+    if _provider_selection is None:
+        with _provider_lock:
+            if _provider_selection is None:
+                _provider_selection = select_providers()
+    return _provider_selection['providers']
+
+
+def provider_selection() -> Optional[Dict]:
+    """How face_providers() chose (None until it has run)"""
+    return _provider_selection
+
+
+_executors: Dict[str, FaceExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def get_face_executor(name: str = FACE_MODEL_NAME) -> FaceExecutor:
+    """Return the shared process-wide face executor of a model pack, creating it on first use"""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = FaceExecutor(name=name, providers=face_providers())
+    return executor
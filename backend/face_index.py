@@ -0,0 +1,310 @@
+"""
+Face index for duplicate-identity search
+All verified ID face embeddings live in one contiguous float32 matrix (rows are unit vectors), so a
+top-k cosine search is a single matrix-vector product. Large indexes can be partitioned into
+IVF-style clusters (spherical k-means) and only the clusters nearest the query are scanned.
+StoreFaceIndex keeps a process's index in step with the face store that every worker process writes to.
+"""
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+# Similarity at or above which a face registered to another user is flagged as the same person
+FACE_DUPLICATE_THRESHOLD = float(os.environ.get('FACE_DUPLICATE_THRESHOLD', 0.5))
+# Run the duplicate search in /validate-id (requests can also ask with "checkDuplicates": true)
+FACE_DUPLICATE_CHECK = os.environ.get('FACE_DUPLICATE_CHECK', '0') == '1'
+# Build IVF clusters once the index holds this many faces (0 = always exact search)
+FACE_INDEX_IVF_MIN = int(os.environ.get('FACE_INDEX_IVF_MIN', 200000))
+# Clusters scanned per query
+FACE_INDEX_NPROBE = int(os.environ.get('FACE_INDEX_NPROBE', 32))
+
+
+class FaceMatch(NamedTuple):
+    user_id: str
+    image_hash: str
+    similarity: float
+
+    def to_dict(self) -> Dict:
+        return {'userId': self.user_id, 'idImageHash': self.image_hash, 'similarity': round(self.similarity, 4)}
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class _Clusters(NamedTuple):
+    """IVF layout: rows [0, size) are grouped by cluster, cluster c is rows offsets[c]:offsets[c + 1]"""
+    centroids: np.ndarray
+    offsets: np.ndarray
+    size: int
+
+
+def _spherical_kmeans(data: np.ndarray, nlist: int, iterations: int = 10, sample: int = 100000, seed: int = 0):
+    """Unit centroids trained on a sample of the rows, and the nearest centroid of every row"""
+    rng = np.random.default_rng(seed)
+    training = data[np.sort(rng.choice(len(data), min(sample, len(data)), replace=False))]
+    centroids = training[rng.choice(len(training), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(training @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, training)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    # Assign in chunks so the score matrix stays small
+    assignments = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), 65536):
+        assignments[start:start + 65536] = np.argmax(data[start:start + 65536] @ centroids.T, axis=1)
+    return centroids.astype(np.float32), assignments
+
+
+def _permute_rows(matrix: np.ndarray, order: List[int]):
+    """matrix[i] = old matrix[order[i]] for every i, in place (one spare row instead of a second matrix)"""
+    done = bytearray(len(order))
+    for start, source in enumerate(order):
+        if done[start] or source == start:
+            continue
+        saved = matrix[start].copy()
+        row = start
+        while True:
+            done[row] = 1
+            source = order[row]
+            if source == start:
+                matrix[row] = saved
+                break
+            matrix[row] = matrix[source]
+            row = source
+
+
+class FaceIndex:
+    """
+    Append-only embedding matrix with exact or IVF top-k cosine search.
+    After clustering, rows are stored grouped by cluster so each probed cluster is one contiguous
+    slice; faces added later go to an unclustered tail that is always scanned, and the clusters are
+    rebuilt in the background once the tail grows past a quarter of the clustered rows.
+    Removed faces leave an empty row that searches skip; the matrix is compacted once a quarter of
+    its rows are empty.
+    """
+
+    def __init__(self, dim: int = 512, ivf_min: int = FACE_INDEX_IVF_MIN, nprobe: int = FACE_INDEX_NPROBE):
+        self.dim = dim
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self._matrix = np.empty((1024, dim), dtype=np.float32)
+        self._count = 0
+        self._removed = 0
+        self._keys: List[Optional[tuple]] = []  # (user_id, image_hash) per row, None once removed
+        self._rows: Dict[tuple, int] = {}
+        self._user_faces: Dict[str, int] = {}
+        self._clusters: Optional[_Clusters] = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count - self._removed
+
+    def add(self, user_id: str, image_hash: str, embedding: np.ndarray):
+        """Add (or replace) the face of user_id for this ID image"""
+        self.add_many([(user_id, image_hash, embedding)])
+
+    def add_many(self, records):
+        """Add (user_id, image_hash, embedding) records with one normalization and one copy"""
+        keys, vectors = [], []
+        for user_id, image_hash, embedding in records:
+            keys.append((user_id, image_hash))
+            vectors.append(np.asarray(embedding, dtype=np.float32).reshape(-1))
+        if not keys:
+            return
+        block = np.vstack(vectors)
+        block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            fresh = []
+            for key, vector in zip(keys, block):
+                row = self._rows.get(key)
+                if row is None:
+                    self._rows[key] = self._count + len(fresh)
+                    self._keys.append(key)
+                    self._user_faces[key[0]] = self._user_faces.get(key[0], 0) + 1
+                    fresh.append(vector)
+                elif row >= self._count:
+                    fresh[row - self._count] = vector
+                else:
+                    self._matrix[row] = vector
+            total = self._count + len(fresh)
+            if total > len(self._matrix):
+                # Grow by doubling so adds stay amortized O(1) and the matrix stays contiguous
+                matrix = np.empty((1 << (total - 1).bit_length(), self.dim), dtype=np.float32)
+                matrix[:self._count] = self._matrix[:self._count]
+                self._matrix = matrix
+            if fresh:
+                self._matrix[self._count:total] = np.vstack(fresh)
+            self._count = total
+            self._maybe_rebuild()
+
+    def remove(self, keys) -> int:
+        """Remove the faces with these (user_id, image_hash) keys; returns the number removed"""
+        removed = 0
+        with self._lock:
+            for key in keys:
+                row = self._rows.pop(tuple(key), None)
+                if row is None:
+                    continue
+                self._keys[row] = None
+                self._matrix[row] = 0.0
+                user_faces = self._user_faces.pop(key[0]) - 1
+                if user_faces:
+                    self._user_faces[key[0]] = user_faces
+                removed += 1
+            self._removed += removed
+            if self._removed * 4 > self._count and not self._building:
+                self._compact()
+        return removed
+
+    def remove_user(self, user_id: str) -> int:
+        """Remove every face of user_id; returns the number removed"""
+        with self._lock:
+            keys = [key for key in self._rows if key[0] == user_id]
+        return self.remove(keys)
+
+    def _compact(self):
+        """Drop the empty rows (called with the lock held); the clusters are built again from scratch"""
+        live = [row for row, key in enumerate(self._keys) if key is not None]
+        self._matrix[:len(live)] = self._matrix[live]
+        self._keys = [self._keys[row] for row in live]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._count, self._removed = len(live), 0
+        self._clusters = None
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        """Start a background clustering when the index (or its unclustered tail) has grown enough"""
+        if not self.ivf_min or self._building or self._count < self.ivf_min:
+            return
+        if self._clusters is not None and self._count - self._clusters.size < self._clusters.size // 4:
+            return
+        self._building = True
+        threading.Thread(target=self._rebuild, name='face-index-ivf', daemon=True).start()
+
+    def build_clusters(self):
+        """Cluster the current rows now (blocking)"""
+        with self._lock:
+            self._building = True
+        self._rebuild()
+
+    def _rebuild(self):
+        try:
+            with self._lock:
+                matrix, size = self._matrix, self._count
+            # Train and assign outside the lock; rows below size only change by replacement
+            nlist = max(1, int(np.sqrt(size)))
+            centroids, assignments = _spherical_kmeans(matrix[:size], nlist)
+            order = np.argsort(assignments, kind='stable')
+            offsets = np.searchsorted(assignments[order], np.arange(nlist + 1)).astype(np.int64)
+            order = order.tolist()
+            with self._lock:
+                # The matrix may have grown into a new array meanwhile; rows below size are the same
+                _permute_rows(self._matrix, order)
+                self._keys = [self._keys[row] for row in order] + self._keys[size:]
+                self._rows = {key: row for row, key in enumerate(self._keys) if key is not None}
+                self._clusters = _Clusters(centroids, offsets, size)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def search(self, embedding: np.ndarray, k: int = 5, exclude_user: Optional[str] = None,
+               exact: bool = False) -> List[FaceMatch]:
+        """Top-k stored faces by cosine similarity to embedding (best first)"""
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            # Score under the lock: a rebuild reorders the rows in place
+            count, keys, clusters = self._count, self._keys, self._clusters
+            if count == 0:
+                return []
+            # Over-fetch so skipping the user's own faces and removed rows still leaves k results
+            fetch = k + self._user_faces.get(exclude_user, 0) + self._removed
+            if clusters is None or exact:
+                rows = None
+                scores = self._matrix[:count] @ query
+            else:
+                probes = _top_k(clusters.centroids @ query, min(self.nprobe, len(clusters.centroids)))
+                spans = [(int(clusters.offsets[c]), int(clusters.offsets[c + 1])) for c in probes]
+                spans.append((clusters.size, count))
+                scores = np.concatenate([self._matrix[start:end] @ query for start, end in spans])
+                rows = np.concatenate([np.arange(start, end) for start, end in spans])
+        matches = []
+        for position in _top_k(scores, fetch):
+            row = int(rows[position]) if rows is not None else int(position)
+            if keys[row] is None:
+                continue
+            user_id, image_hash = keys[row]
+            if user_id == exclude_user:
+                continue
+            matches.append(FaceMatch(user_id, image_hash, float(scores[position])))
+            if len(matches) == k:
+                break
+        return matches
+
+    def stats(self) -> Dict:
+        with self._lock:
+            clusters = self._clusters
+            return {
+                'faces': self._count - self._removed,
+                'removed': self._removed,
+                'ivf': clusters is not None,
+                'clusters': len(clusters.centroids) if clusters is not None else 0,
+                'unclustered': self._count - clusters.size if clusters is not None else self._count - self._removed,
+                'nprobe': self.nprobe,
+                'building': self._building,
+            }
+
+
+class StoreFaceIndex:
+    """
+    FaceIndex over every face of a FaceStore shared by several worker processes. The store's change
+    counter is checked before each use and the index is reloaded when another process (or a write not
+    applied here) changed the store; this process's own writes are applied to the index in place.
+    """
+
+    def __init__(self, store, factory: Callable[[], FaceIndex] = FaceIndex):
+        self.store = store
+        self.factory = factory
+        self.reloads = 0
+        self._index: Optional[FaceIndex] = None
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> Optional[FaceIndex]:
+        """The index as it is, without checking the store (None before the first load)"""
+        return self._index
+
+    def get(self) -> FaceIndex:
+        """The index, reloaded first if the store changed since it was loaded"""
+        generation = self.store.generation()
+        if self._index is None or generation != self._generation:
+            with self._lock:
+                # Read the counter before the rows: a write in between only causes one more reload
+                generation = self.store.generation()
+                if self._index is None or generation != self._generation:
+                    index = self.factory()
+                    index.add_many(self.store.all())
+                    self._index, self._generation = index, generation
+                    self.reloads += 1
+        return self._index
+
+    def apply(self, change: Callable[[FaceIndex], object]) -> None:
+        """
+        Apply this thread's last store write to the index (e.g. lambda index: index.add(...)); when
+        another write came in between, the index is left stale and get() reloads it instead
+        """
+        with self._lock:
+            if self._index is not None and self.store.written_generation == self._generation + 1:
+                change(self._index)
+                self._generation += 1
@@ -0,0 +1,138 @@
+"""
+Per-user ID face embedding store
+Keeps the normed embedding (float16) and detection metadata of each user's verified ID face, keyed by
+user ID and ID-image hash, so a selfie can be re-verified without the ID photo being uploaded,
+detected and embedded again. SQLite on disk, shared by every worker process using the same file;
+every write advances a change counter (generation) so the processes can tell their copies are stale.
+Faces are kept for FACE_STORE_RETENTION_DAYS after their verification and then pruned.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+FACE_STORE_PATH = os.environ.get('FACE_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'face_store.sqlite3'))
+# Days a verified ID face is kept (0 = until the user is deleted), and seconds between prunes
+FACE_STORE_RETENTION_DAYS = float(os.environ.get('FACE_STORE_RETENTION_DAYS', 365))
+FACE_STORE_PRUNE_INTERVAL = float(os.environ.get('FACE_STORE_PRUNE_INTERVAL', 3600))
+
+
+def image_hash(image_data: bytes) -> str:
+    return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+class FaceRecord(NamedTuple):
+    user_id: str
+    image_hash: str
+    embedding: np.ndarray  # float32, unit length
+    det_score: float
+    bbox: List[float]
+    created: float
+
+
+class FaceStore:
+    """SQLite table of ID face embeddings (one row per user and ID image)"""
+
+    def __init__(self, path: str = FACE_STORE_PATH, retention_days: float = FACE_STORE_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self._local = threading.local()
+        self._last_prune = 0.0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS id_faces ('
+                         'user_id TEXT NOT NULL, image_hash TEXT NOT NULL, embedding BLOB NOT NULL, '
+                         'det_score REAL NOT NULL, bbox TEXT NOT NULL, created REAL NOT NULL, '
+                         'PRIMARY KEY (user_id, image_hash))')
+            conn.execute('CREATE INDEX IF NOT EXISTS id_faces_user_created ON id_faces (user_id, created)')
+            conn.execute('CREATE TABLE IF NOT EXISTS id_faces_generation (generation INTEGER NOT NULL)')
+            conn.execute('INSERT INTO id_faces_generation SELECT 0 '
+                         'WHERE NOT EXISTS (SELECT 1 FROM id_faces_generation)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _cutoff(self) -> float:
+        """Creation time before which faces are expired (0 when they never expire)"""
+        return time.time() - self.retention_days * 86400 if self.retention_days > 0 else 0.0
+
+    def _changed(self, conn: sqlite3.Connection) -> None:
+        """Advance the change counter inside the write's transaction; remembered per thread as written_generation"""
+        conn.execute('UPDATE id_faces_generation SET generation = generation + 1')
+        self._local.written = conn.execute('SELECT generation FROM id_faces_generation').fetchone()[0]
+
+    def generation(self) -> int:
+        """Change counter of the store, advanced by every put, delete and prune that changed rows"""
+        return self._connect().execute('SELECT generation FROM id_faces_generation').fetchone()[0]
+
+    @property
+    def written_generation(self) -> Optional[int]:
+        """Generation produced by this thread's last write that changed rows"""
+        return getattr(self._local, 'written', None)
+
+    def put(self, user_id: str, image_hash: str, embedding: np.ndarray, det_score: float, bbox) -> None:
+        """Save (or replace) the ID face of user_id for the ID image with this hash"""
+        vector = np.asarray(embedding, dtype=np.float16).tobytes()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO id_faces (user_id, image_hash, embedding, det_score, bbox, created) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (user_id, image_hash, vector, float(det_score), json.dumps([float(v) for v in bbox]), time.time()))
+            self._changed(conn)
+
+    def get(self, user_id: str, image_hash: Optional[str] = None) -> Optional[FaceRecord]:
+        """The face stored for this ID image, or the user's most recent one if no hash is given"""
+        # Expired faces are never returned, even before the next prune removes them
+        if image_hash is None:
+            row = self._connect().execute(
+                'SELECT user_id, image_hash, embedding, det_score, bbox, created FROM id_faces '
+                'WHERE user_id = ? AND created >= ? ORDER BY created DESC LIMIT 1',
+                (user_id, self._cutoff())).fetchone()
+        else:
+            row = self._connect().execute(
+                'SELECT user_id, image_hash, embedding, det_score, bbox, created FROM id_faces '
+                'WHERE user_id = ? AND image_hash = ? AND created >= ?',
+                (user_id, image_hash, self._cutoff())).fetchone()
+        if row is None:
+            return None
+        embedding = np.frombuffer(row[2], dtype=np.float16).astype(np.float32)
+        # Undo the float16 rounding of the norm
+        embedding /= np.linalg.norm(embedding) or 1.0
+        return FaceRecord(row[0], row[1], embedding, row[3], json.loads(row[4]), row[5])
+
+    def all(self) -> Iterator[Tuple[str, str, np.ndarray]]:
+        """(user_id, image_hash, float16 embedding) of every unexpired face, for building the face index"""
+        for user_id, stored_hash, embedding in self._connect().execute(
+                'SELECT user_id, image_hash, embedding FROM id_faces WHERE created >= ?', (self._cutoff(),)):
+            yield user_id, stored_hash, np.frombuffer(embedding, dtype=np.float16)
+
+    def delete(self, user_id: str) -> int:
+        """Forget every stored face of a user; returns the number of rows removed"""
+        with self._connect() as conn:
+            deleted = conn.execute('DELETE FROM id_faces WHERE user_id = ?', (user_id,)).rowcount
+            if deleted:
+                self._changed(conn)
+        return deleted
+
+    def prune(self) -> List[Tuple[str, str]]:
+        """Delete the faces older than the retention period; returns their (user_id, image_hash) keys"""
+        self._last_prune = time.time()
+        cutoff = self._cutoff()
+        if not cutoff:
+            return []
+        with self._connect() as conn:
+            expired = conn.execute('SELECT user_id, image_hash FROM id_faces WHERE created < ?', (cutoff,)).fetchall()
+            if conn.execute('DELETE FROM id_faces WHERE created < ?', (cutoff,)).rowcount:
+                self._changed(conn)
+        return [tuple(key) for key in expired]
+
+    def prune_due(self) -> bool:
+        """True once FACE_STORE_PRUNE_INTERVAL has passed since the last prune"""
+        return self.retention_days > 0 and time.time() - self._last_prune >= FACE_STORE_PRUNE_INTERVAL
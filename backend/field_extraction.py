@@ -0,0 +1,288 @@
+"""
+Field extraction engine
+Extracts the name, ID number, date of birth and ID type of an OCR text with precompiled patterns and
+an Aho-Corasick style keyword automaton. FieldScan tokenizes a text once: a single regex scan yields
+every ID number and date candidate with its position, the keyword automaton every ID type keyword, and
+each field is picked from those candidates with the original helpers' rules, so the results are exact.
+Materializing every candidate costs more than the per-field searches on short card text. Scans are
+memoized, so the extract_* / detect_id_type calls for one text share them.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from ocr_merge import field_confidence
+
+# ID numbers: standalone 6-15 digit runs, S / * prefixed numbers, and digit runs of the
+# concatenated digit sequence (vertical column layouts)
+_ID_PREFIXED = r'(?i:[s*])\s*\d{4,15}\s*[*]?'
+_ID_CHUNK = re.compile(r'\d{6,15}')
+_DIGIT_RUN = re.compile(r'\d+')
+
+# Dates, in priority order (each starts at a digit on a word boundary)
+_DATE_PATTERNS = (
+    r'\d{2}[/-]\d{2}[/-]\d{4}\b',
+    r'\d{4}[/-]\d{2}[/-]\d{2}\b',
+    r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
+)
+_STRICT_DATE = re.compile(r'\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2}')
+
+GOVERNMENT_INDICATORS = (
+    'driver', 'driving', 'license', 'dl', 'd.l.',
+    'national id', 'national identification', 'nid', 'national identity',
+    'passport', 'passport no', 'passport number',
+    'department of motor vehicles', 'dmv', 'd.m.v.',
+    'department of state', 'ministry of', 'government',
+    'republic of', 'federal', 'state id', 'state identification',
+    'official', 'authorized', 'issued by', 'government issued',
+    'valid until', 'expires', 'expiration date',
+)
+
+STUDENT_INDICATORS = (
+    'student', 'student id', 'student identification',
+    'university', 'college', 'school', 'academic',
+    'student number', 'matriculation', 'enrollment',
+    'campus', 'institution', 'educational',
+)
+
+
+def _trie_pattern(keywords: Sequence[str]) -> str:
+    """Regex for a keyword set, factored into a trie so the regex engine branches once per character"""
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional tail: a keyword that is a prefix of a longer one only matches when the longer one doesn't
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordAutomaton:
+    """
+    Multi-keyword matcher (Aho-Corasick style): one left-to-right pass reports every keyword present.
+    The keywords are compiled into a trie-shaped regex so the scan runs in C, taking the longest
+    keyword at each hit. Keywords hidden inside a hit are implied by it; keywords that start inside a
+    hit and run past its end are rare and confirmed with a substring check, so the reported set is
+    exactly the keywords that occur in the text.
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        self.keywords = list(dict.fromkeys(keywords))
+        self._pattern = re.compile(_trie_pattern(self.keywords))
+        self._contained = {
+            keyword: frozenset(other for other in self.keywords if other in keyword)
+            for keyword in self.keywords
+        }
+        # Keywords that could start inside this one and extend past its end
+        self._overlapping = {
+            keyword: tuple(
+                other for other in self.keywords
+                if any(other.startswith(keyword[offset:]) and len(other) > len(keyword) - offset
+                       for offset in range(1, len(keyword)))
+            )
+            for keyword in self.keywords
+        }
+
+    @lru_cache(maxsize=1024)
+    def _closure(self, hits: frozenset):
+        """Keywords implied by a set of hits, plus those that still need a substring check"""
+        implied = frozenset().union(*(self._contained[keyword] for keyword in hits))
+        unsure = tuple(other for keyword in hits for other in self._overlapping[keyword] if other not in implied)
+        return implied, tuple(dict.fromkeys(unsure))
+
+    def find_all(self, text: str) -> FrozenSet[str]:
+        """Every keyword present in text"""
+        implied, unsure = self._closure(frozenset(self._pattern.findall(text)))
+        if not unsure:
+            return implied
+        return implied.union(keyword for keyword in unsure if keyword in text)
+
+
+_ID_TYPE_AUTOMATON = KeywordAutomaton(GOVERNMENT_INDICATORS + STUDENT_INDICATORS)
+_GOVERNMENT_SET = frozenset(GOVERNMENT_INDICATORS)
+_STUDENT_SET = frozenset(STUDENT_INDICATORS)
+
+
+def _scanner():
+    """
+    One regex for every token an ID number or date is read from: digit runs starting on a word boundary
+    (flagging a trailing one, and the dates that start there) and S / * prefixed numbers. Dates and
+    prefixed numbers are lookaheads, so candidates that overlap a digit run or each other are all
+    reported. The leading character class lets the regex engine skip plain text without trying the
+    alternatives.
+    """
+    dates = '|'.join('(?=(?P<date%d>%s))' % (priority, pattern) for priority, pattern in enumerate(_DATE_PATTERNS))
+    return re.compile(
+        r'(?=[\d*sS\u017f])(?:'
+        r'(?<!\w)(?:(?=\d{1,4}[/-])(?:' + dates + r'))?(?P<digits>\d+)(?P<end>(?!\w))?'
+        # Only the first character is consumed, so a digit run inside the number is still read
+        r'|(?=(?P<prefixed>' + _ID_PREFIXED + r')).'
+        r')'
+    )
+
+
+_SCAN = _scanner()
+
+
+def _name_like(line: str) -> bool:
+    """2-4 alphabetic words (hyphens and apostrophes allowed) in 3-40 characters"""
+    if not 3 <= len(line) <= 40:
+        return False
+    words = line.split()
+    return 2 <= len(words) <= 4 and all(word.replace('-', '').replace("'", '').isalpha() for word in words)
+
+
+class FieldScan:
+    """
+    Every candidate field of one OCR text, with its position. The text is tokenized by a single
+    left-to-right scan (digit runs, dates, prefixed numbers) and its ID type keywords by one pass
+    of the keyword automaton; the name, ID number, date of birth and ID type are then picked from the
+    candidates with the rules of the original helpers, so they give the same results.
+
+    Positions are (start, end) character offsets into the text, except for 'digit-run' ID candidates,
+    which are offsets into the concatenated digit sequence (self.digits).
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.text_lower = text.lower()
+
+        # (digits, start, end, kind) with kind 'standalone', 'prefixed' or 'digit-run'
+        self.id_candidates: List[Tuple[str, int, int, str]] = []
+        # (value, start, end, priority), priority 0 being the strictest format
+        self.date_candidates: List[Tuple[str, int, int, int]] = []
+        prefixed: List[Tuple[str, int, int, str]] = []
+        prefixed_end = 0
+        for match in _SCAN.finditer(text):
+            *dates, value, end, prefixed_value = match.groups()
+            if value is None:
+                # Prefixed numbers don't overlap each other, like successive matches of one pattern
+                start = match.start()
+                if start >= prefixed_end:
+                    prefixed_end = start + len(prefixed_value)
+                    prefixed.append((''.join(_DIGIT_RUN.findall(prefixed_value)), start, prefixed_end, 'prefixed'))
+                continue
+            start = match.start('digits')
+            if end is not None and 6 <= len(value) <= 15:
+                self.id_candidates.append((value, start, match.end(), 'standalone'))
+            for priority, date in enumerate(dates):
+                if date:
+                    self.date_candidates.append((date, start, start + len(date), priority))
+                    break
+
+        # Vertical column layouts: runs of the concatenated digit sequence
+        self.digits = ''.join(_DIGIT_RUN.findall(text))
+        self.id_candidates.extend(prefixed)
+        self.id_candidates.extend(
+            (match.group(0), match.start(), match.end(), 'digit-run') for match in _ID_CHUNK.finditer(self.digits)
+        )
+
+        # Name: every name-like line among the first five non-empty lines, as (line, start, end)
+        self.name_candidates: List[Tuple[str, int, int]] = []
+        start = checked = 0
+        while checked < 5 and start <= len(text):
+            end = text.find('\n', start)
+            if end < 0:
+                end = len(text)
+            line = text[start:end]
+            stripped = line.strip()
+            if stripped:
+                if _name_like(stripped):
+                    offset = start + line.index(stripped)
+                    self.name_candidates.append((stripped, offset, offset + len(stripped)))
+                checked += 1
+            start = end + 1
+
+        # The first name-like line; the longest ID candidate, first one on ties; the first date of the
+        # highest-priority format
+        self.name: Optional[str] = self.name_candidates[0][0] if self.name_candidates else None
+        self.id_number: Optional[str] = (
+            max(self.id_candidates, key=lambda candidate: len(candidate[0]))[0] if self.id_candidates else None
+        )
+        self.date_of_birth: Optional[str] = (
+            min(self.date_candidates, key=lambda candidate: candidate[3])[0] if self.date_candidates else None
+        )
+
+        # ID type keywords present in the lowercased text, with the position of their first occurrence
+        self.indicators: FrozenSet[str] = _ID_TYPE_AUTOMATON.find_all(self.text_lower)
+        self.indicator_positions: Dict[str, int] = {keyword: self.text_lower.find(keyword) for keyword in self.indicators}
+        self.government_matches = len(self.indicators & _GOVERNMENT_SET)
+        self.student_matches = len(self.indicators & _STUDENT_SET)
+
+    @property
+    def id_type(self) -> str:
+        if self.government_matches >= 2:
+            return 'government'
+        elif self.student_matches >= 2:
+            return 'student'
+        elif self.government_matches > 0:
+            return 'government'
+        elif self.student_matches > 0:
+            return 'student'
+        return 'unknown'
+
+    @property
+    def id_number_standalone(self) -> bool:
+        """True if the chosen ID number appears in the text as its own digit run"""
+        if not self.id_number:
+            return False
+        return re.search(r'(?<!\d)' + self.id_number + r'(?!\d)', self.text) is not None
+
+    @property
+    def date_is_strict(self) -> bool:
+        """True if the chosen date has two-digit day/month and a four-digit year"""
+        return bool(self.date_of_birth and _STRICT_DATE.fullmatch(self.date_of_birth))
+
+
+@lru_cache(maxsize=256)
+def scan(text: str) -> FieldScan:
+    """Scan text once; repeated lookups of the same text (name, ID, date, type) reuse the scan"""
+    return FieldScan(text)
+
+
+def extract_name(text):
+    """Extract name from OCR text"""
+    return scan(text).name
+
+
+def extract_id_number(text):
+    """Extract ID number from OCR text (handles vertical columns and prefixes like S)"""
+    return scan(text).id_number
+
+
+def extract_date_of_birth(text):
+    """Extract date of birth from OCR text"""
+    return scan(text).date_of_birth
+
+
+def detect_id_type(text):
+    """Detect if ID is government-issued or student ID"""
+    return scan(text).id_type
+
+
+def score_extracted_fields(merged):
+    """
+    Extract name, ID number and date of birth from merged OCR words with a confidence (0-1) for each:
+    the Tesseract confidence of the words a field was read from, weighted by how trustworthy its pattern is
+    Returns: { "fullName": (value, confidence), "idNumber": (...), "dateOfBirth": (...) }
+    """
+    result = scan(merged.text)
+    # A number that appears as its own token is reliable; one stitched together
+    # from scattered digits (vertical column fallback) is not
+    id_weight = (1.0 if result.id_number_standalone else 0.5) if result.id_number else 0.0
+    # Full 4-digit years are reliable, 1-2 digit day/month/year variants less so
+    date_weight = (1.0 if result.date_is_strict else 0.7) if result.date_of_birth else 0.0
+    return {
+        'fullName': (result.name, field_confidence(result.name, merged.tokens)),
+        'idNumber': (result.id_number, id_weight * field_confidence(result.id_number, merged.tokens)),
+        'dateOfBirth': (result.date_of_birth, date_weight * field_confidence(result.date_of_birth, merged.tokens))
+    }
@@ -0,0 +1,168 @@
+"""
+Optimized ONNX graph cache
+ONNX Runtime rewrites every model graph (constant folding, Conv+BatchNorm fusion, layout changes)
+each time a session is created, and every worker pays that again for every model it loads. The first
+load of a model saves the optimized graph to FACE_GRAPH_CACHE_DIR; later loads, in this process or in
+any worker started afterwards, read the saved graph with graph optimization turned off.
+Saved graphs are keyed by the model file's SHA-256, the onnxruntime version (one directory per
+version), the optimization level, the execution providers and the CPU (the 'all' level inserts
+layouts specific to the CPU's vector width), so a changed model or runtime never loads a stale graph.
+"""
+import hashlib
+import json
+import os
+import platform
+import threading
+from typing import Dict, List, Optional
+
+import onnxruntime
+from insightface.model_zoo.model_zoo import ModelRouter
+
+# Save optimized graphs on first load and reuse them (0 = optimize on every load)
+FACE_GRAPH_CACHE = os.environ.get('FACE_GRAPH_CACHE', '1') == '1'
+FACE_GRAPH_CACHE_DIR = os.path.expanduser(os.environ.get('FACE_GRAPH_CACHE_DIR', '~/.insightface/ort_cache'))
+
+# Providers that run the graph node by node; compiling providers (OpenVINO, oneDNN, ...) fuse nodes
+# into kernels ONNX Runtime can't save, so their sessions are built from the original file
+SERIALIZABLE_PROVIDERS = ('CPUExecutionProvider', 'CUDAExecutionProvider')
+
+LEVEL_NAMES = {
+    onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL: 'disabled',
+    onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC: 'basic',
+    onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED: 'extended',
+    onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL: 'all',
+}
+
+_lock = threading.Lock()
+_hashes: Dict[str, Dict] = {}
+_counts = {'hits': 0, 'misses': 0, 'errors': 0}
+
+
+def _cpu_signature() -> str:
+    """Short hash of the CPU model and feature flags"""
+    text = platform.machine()
+    try:
+        with open('/proc/cpuinfo') as f:
+            lines = [line for line in f if line.startswith(('model name', 'flags'))]
+        text += ''.join(lines[:2])
+    except OSError:
+        text += platform.processor()
+    return hashlib.sha256(text.encode()).hexdigest()[:8]
+
+
+def _index_path() -> str:
+    return os.path.join(FACE_GRAPH_CACHE_DIR, 'hashes.json')
+
+
+def model_hash(path: str) -> str:
+    """
+    SHA-256 of a model file. Hashing a large model takes about as long as the optimization it saves,
+    so digests are kept in an index in the cache directory and reused while the file's size and
+    modification time are unchanged
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    with _lock:
+        if not _hashes and os.path.exists(_index_path()):
+            try:
+                with open(_index_path()) as f:
+                    _hashes.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+        entry = _hashes.get(path)
+    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+        return entry['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    with _lock:
+        _hashes[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        _write_json(_index_path(), _hashes)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, data):
+    # Several workers may start at once: write a private file and rename it into place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    scratch = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(scratch, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(scratch, path)
+
+
+def cache_path(onnx_file: str, level: str, providers: List[str]) -> str:
+    """Where the optimized graph of onnx_file is saved"""
+    key = hashlib.sha256(f'{model_hash(onnx_file)}:{level}:{",".join(providers)}:{_cpu_signature()}'.encode())
+    stem = os.path.splitext(os.path.basename(onnx_file))[0]
+    return os.path.join(FACE_GRAPH_CACHE_DIR, f'onnxruntime-{onnxruntime.__version__}',
+                        f'{stem}-{key.hexdigest()[:16]}-{level}.onnx')
+
+
+def load_model(onnx_file: str, options: Optional[onnxruntime.SessionOptions], providers: List[str]):
+    """ModelRouter(onnx_file).get_model() through the optimized graph cache"""
+    options = options or onnxruntime.SessionOptions()
+    level = LEVEL_NAMES.get(options.graph_optimization_level, 'all')
+    if not FACE_GRAPH_CACHE or level == 'disabled' or not set(providers) <= set(SERIALIZABLE_PROVIDERS):
+        return ModelRouter(onnx_file).get_model(sess_options=options, providers=providers)
+
+    cached = cache_path(onnx_file, level, providers)
+    if os.path.exists(cached + '.json'):
+        try:
+            model = _load_cached(onnx_file, cached, options, providers)
+            with _lock:
+                _counts['hits'] += 1
+            return model
+        except Exception:
+            # Unreadable or truncated graph: optimize the original again and overwrite it
+            with _lock:
+                _counts['errors'] += 1
+
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    # The extension tells ONNX Runtime to save in ONNX format
+    scratch = f'{cached}.{os.getpid()}.{threading.get_ident()}.tmp.onnx'
+    options.optimized_model_filepath = scratch
+    try:
+        model = ModelRouter(onnx_file).get_model(sess_options=options, providers=providers)
+    except Exception:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+        raise
+    finally:
+        options.optimized_model_filepath = ''
+    os.replace(scratch, cached)
+    # Written last, so its presence means the graph is complete. ArcFaceONNX guesses its input
+    # normalization from the first graph nodes, which optimization may fuse away
+    meta = {'source': os.path.realpath(onnx_file), 'level': level}
+    if model is not None and hasattr(model, 'input_mean'):
+        meta['input_mean'] = float(model.input_mean)
+        meta['input_std'] = float(model.input_std)
+    _write_json(cached + '.json', meta)
+    with _lock:
+        _counts['misses'] += 1
+    return model
+
+
+def _load_cached(onnx_file: str, cached: str, options: onnxruntime.SessionOptions, providers: List[str]):
+    with open(cached + '.json') as f:
+        meta = json.load(f)
+    level = options.graph_optimization_level
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    try:
+        model = ModelRouter(cached).get_model(sess_options=options, providers=providers)
+    finally:
+        options.graph_optimization_level = level
+    if model is not None:
+        # Report (and match quantization manifests against) the original file
+        model.model_file = onnx_file
+        if 'input_mean' in meta:
+            model.input_mean = meta['input_mean']
+            model.input_std = meta['input_std']
+    return model
+
+
+def stats() -> Dict:
+    with _lock:
+        counts = dict(_counts)
+    return {'enabled': FACE_GRAPH_CACHE, 'dir': FACE_GRAPH_CACHE_DIR, **counts}
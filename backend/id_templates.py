@@ -0,0 +1,288 @@
+"""
+Per-ID-type field zone templates
+Common Philippine IDs have fixed layouts, so once the card type is known only a few small crops
+need OCR (name, ID number, date of birth) with field-specific page segmentation and whitelists.
+Boxes are normalized (x0, y0, x1, y1) on the upright card and padded to tolerate loose framing;
+the card is located in the photo first, so a card that does not fill the frame still lands in its zones.
+"""
+import os
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from field_extraction import detect_id_type
+from ocr_cascade import OCR_CASCADE_MIN_CONFIDENCE
+from ocr_engine import OcrWord
+from ocr_merge import field_confidence, merge_words, words_to_text
+from ocr_pool import get_ocr_pool
+from quality_gate import downscale, find_card
+
+# Set to 0 to always run the full-page OCR cascade
+OCR_TEMPLATES_ENABLED = os.environ.get('OCR_TEMPLATES', '1') != '0'
+
+UPPER = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789'
+NAME_WHITELIST = UPPER + '-.,'
+DATE_WHITELIST = UPPER + DIGITS + '/-,'
+
+# Region read to identify the card (issuer / title lines)
+HEADER_BOX = (0.0, 0.0, 1.0, 0.3)
+HEADER_CONFIG = '--oem 3 --psm 6'
+
+MONTHS = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12,
+}
+_NUMERIC_DATE_MDY = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})')
+_NUMERIC_DATE_YMD = re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})')
+_MONTH_NAME_DATE = re.compile(r'([A-Z]{3})[A-Z]*\.?\s*(\d{1,2}),?\s*(\d{4})')      # JANUARY 01, 1990
+_DAY_MONTH_DATE = re.compile(r'(\d{1,2})\s*([A-Z]{3})[A-Z]*\.?\s*(\d{4})')         # 01 JAN 1990
+
+
+class FieldZone:
+    """A normalized region holding (part of) one field, with its OCR settings"""
+
+    def __init__(self, box: Tuple[float, float, float, float], psm: int = 7, whitelist: Optional[str] = None):
+        self.box = box
+        self.psm = psm
+        self.whitelist = whitelist
+
+    @property
+    def config(self) -> str:
+        config = f'--oem 3 --psm {self.psm}'
+        if self.whitelist:
+            config += f' -c tessedit_char_whitelist={self.whitelist}'
+        return config
+
+
+class IdTemplate:
+    """
+    Layout of one ID type
+    fields: field name -> zones whose texts are joined in order (e.g. given names then surname)
+    A field without zones is not printed on this card and is never required.
+    """
+
+    def __init__(self, name: str, id_type: str, keywords: Sequence[str],
+                 fields: Dict[str, List[FieldZone]], id_pattern: str,
+                 name_order: str = 'first_last'):
+        self.name = name
+        self.id_type = id_type
+        self.keywords = [keyword.lower() for keyword in keywords]
+        self.fields = fields
+        self.id_pattern = re.compile(id_pattern)
+        # 'last_first' when the name zone reads "SURNAME, GIVEN NAMES"
+        self.name_order = name_order
+
+
+TEMPLATES: Dict[str, IdTemplate] = {}
+
+
+def register_template(template: IdTemplate):
+    TEMPLATES[template.name] = template
+
+
+register_template(IdTemplate(
+    name='philsys',
+    id_type='government',
+    keywords=['pambansang pagkakakilanlan', 'philippine identification', 'philsys'],
+    fields={
+        'idNumber': [FieldZone((0.03, 0.20, 0.65, 0.33), whitelist=DIGITS + '-')],
+        'fullName': [FieldZone((0.33, 0.47, 0.98, 0.59), whitelist=NAME_WHITELIST),    # Given names
+                     FieldZone((0.33, 0.34, 0.98, 0.46), whitelist=NAME_WHITELIST)],   # Last name
+        'dateOfBirth': [FieldZone((0.33, 0.72, 0.98, 0.83), whitelist=DATE_WHITELIST)],
+    },
+    id_pattern=r'\d{4}-?\d{4}-?\d{4}-?\d{4}',
+))
+
+register_template(IdTemplate(
+    name='drivers_license',
+    id_type='government',
+    keywords=['land transportation', "driver's license", 'drivers license', 'non-professional'],
+    fields={
+        'fullName': [FieldZone((0.26, 0.28, 0.98, 0.41), whitelist=NAME_WHITELIST)],
+        'dateOfBirth': [FieldZone((0.48, 0.43, 0.75, 0.55), whitelist=DIGITS + '/-')],
+        'idNumber': [FieldZone((0.26, 0.56, 0.58, 0.68), whitelist=UPPER + DIGITS + '-')],
+    },
+    id_pattern=r'[A-Z]\d{2}-?\d{2}-?\d{6}',
+    name_order='last_first',
+))
+
+register_template(IdTemplate(
+    name='passport',
+    id_type='government',
+    keywords=['pasaporte', 'passport', 'p<phl'],
+    fields={
+        'idNumber': [FieldZone((0.68, 0.10, 0.99, 0.23), whitelist=UPPER + DIGITS)],
+        'fullName': [FieldZone((0.28, 0.31, 0.82, 0.41), whitelist=NAME_WHITELIST),    # Given names
+                     FieldZone((0.28, 0.21, 0.82, 0.31), whitelist=NAME_WHITELIST)],   # Surname
+        'dateOfBirth': [FieldZone((0.28, 0.48, 0.66, 0.59), whitelist=DATE_WHITELIST)],
+    },
+    id_pattern=r'[A-Z]{1,2}\d{7}[A-Z]?',
+))
+
+register_template(IdTemplate(
+    name='umid',
+    id_type='government',
+    keywords=['unified multi-purpose', 'multi-purpose id', 'umid'],
+    fields={
+        'idNumber': [FieldZone((0.26, 0.20, 0.78, 0.33), whitelist=UPPER + DIGITS + '-')],
+        'fullName': [FieldZone((0.26, 0.45, 0.97, 0.56), whitelist=NAME_WHITELIST),    # Given name
+                     FieldZone((0.26, 0.34, 0.97, 0.45), whitelist=NAME_WHITELIST)],   # Surname
+        'dateOfBirth': [FieldZone((0.26, 0.68, 0.62, 0.79), whitelist=DIGITS + '/-')],
+    },
+    id_pattern=r'\d{4}-?\d{7}-?\d',
+))
+
+register_template(IdTemplate(
+    name='student',
+    id_type='student',
+    keywords=['university', 'college', 'student', 'school', 'academy', 'institute'],
+    fields={
+        'fullName': [FieldZone((0.33, 0.52, 0.99, 0.68), psm=6, whitelist=NAME_WHITELIST)],
+        'idNumber': [FieldZone((0.33, 0.68, 0.99, 0.82), whitelist=UPPER + DIGITS + '-')],
+        # Student IDs usually do not print a birth date
+        'dateOfBirth': [],
+    },
+    id_pattern=r'[A-Z]?\d[\d-]{4,14}\d',
+))
+
+
+def identify_template(header_text: str) -> Optional[IdTemplate]:
+    """Pick the template whose keywords best match the header text (None if nothing matches)"""
+    text = header_text.lower()
+    best, best_hits = None, 0
+    for template in TEMPLATES.values():
+        hits = sum(1 for keyword in template.keywords if keyword in text)
+        if hits > best_hits:
+            best, best_hits = template, hits
+    return best
+
+
+def card_region(gray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x0, y0, x1, y1) of the ID card in gray's pixels (None if no card outline is found)"""
+    small, factor = downscale(gray)
+    card = find_card(small)
+    if card is None:
+        return None
+    x, y, w, h = card
+    return int(x * factor), int(y * factor), int((x + w) * factor), int((y + h) * factor)
+
+
+def crop_zone(image, box: Tuple[float, float, float, float]):
+    """Crop a normalized box out of a PIL image"""
+    width, height = image.size
+    x0, y0, x1, y1 = box
+    return image.crop((int(x0 * width), int(y0 * height), int(x1 * width), int(y1 * height)))
+
+
+def parse_date(text: str) -> Optional[str]:
+    """Normalize a printed date (numeric or with a month name) to MM/DD/YYYY"""
+    text = text.upper()
+    match = _NUMERIC_DATE_YMD.search(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = _NUMERIC_DATE_MDY.search(text)
+        if match:
+            # Philippine IDs print numeric dates month first
+            month, day, year = match.groups()
+        else:
+            match = _MONTH_NAME_DATE.search(text)
+            if match and match.group(1) in MONTHS:
+                month, day, year = MONTHS[match.group(1)], match.group(2), match.group(3)
+            else:
+                match = _DAY_MONTH_DATE.search(text)
+                if not match or match.group(2) not in MONTHS:
+                    return None
+                day, month, year = match.group(1), MONTHS[match.group(2)], match.group(3)
+    month, day = int(month), int(day)
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f'{month:02d}/{day:02d}/{year}'
+
+
+def _clean_line(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def _parse_name(texts: List[str], name_order: str) -> Optional[str]:
+    parts = [_clean_line(text).strip(' ,.-') for text in texts]
+    parts = [part for part in parts if part]
+    if not parts:
+        return None
+    if name_order == 'last_first' and len(parts) == 1 and ',' in parts[0]:
+        last, first = parts[0].split(',', 1)
+        parts = [first.strip(' ,'), last.strip(' ,')]
+    name = ' '.join(parts).replace(',', ' ')
+    name = _clean_line(name)
+    words = name.split()
+    if not 2 <= len(words) <= 6 or not all(word.replace('-', '').replace('.', '').isalpha() for word in words):
+        return None
+    return name
+
+
+def zones_confidence(value: Optional[str], zones: Sequence[Sequence[OcrWord]]) -> float:
+    """
+    Confidence of a field read from several zones: each zone's words are merged and scored in their own
+    crop's coordinates, and the field gets the lowest score of the zones it was read from
+    """
+    scores = [field_confidence(value, merge_words([words]).tokens) for words in zones]
+    scores = [score for score in scores if score > 0]
+    return min(scores) if scores else 0.0
+
+
+def extract_with_template(image, run_pass: Callable[[object, str], List[OcrWord]],
+                          required_fields: Sequence[str],
+                          min_confidence: float = OCR_CASCADE_MIN_CONFIDENCE, gray=None) -> Optional[Dict]:
+    """
+    Identify the card from its header and OCR only the template's field zones.
+    run_pass(image, config) returns the words of one pass.
+    gray: grayscale of the same (upright) photo, used to locate the card; without it, or when no card
+    outline is found, the card is assumed to fill the photo.
+    Returns None when the card is not recognized, a required field cannot be read confidently or the
+    keyword classifier (detect_id_type) disagrees with the template's ID type, in which case the caller
+    should fall back to the full-page cascade.
+    """
+    region = card_region(gray) if gray is not None else None
+    if region is not None:
+        image = image.crop(region)
+    pool = get_ocr_pool()
+    header_text = words_to_text(pool.map(run_pass, [(crop_zone(image, HEADER_BOX), HEADER_CONFIG)])[0] or [])
+    template = identify_template(header_text)
+    if template is None:
+        return None
+
+    jobs = []
+    zone_fields = []
+    for field, zones in template.fields.items():
+        for zone in zones:
+            jobs.append((crop_zone(image, zone.box), zone.config))
+            zone_fields.append(field)
+    zone_words: Dict[str, List[List[OcrWord]]] = {field: [] for field in template.fields}
+    for field, words in zip(zone_fields, pool.map(run_pass, jobs)):
+        zone_words[field].append(words or [])
+    zone_texts = {field: [words_to_text(words) for words in passes] for field, passes in zone_words.items()}
+
+    id_match = template.id_pattern.search(''.join(''.join(zone_texts.get('idNumber', [])).split()).upper())
+    fields = {
+        'fullName': _parse_name(zone_texts.get('fullName', []), template.name_order),
+        'idNumber': id_match.group(0) if id_match else None,
+        'dateOfBirth': parse_date(' '.join(zone_texts.get('dateOfBirth', []))),
+    }
+    confidence = {field: zones_confidence(fields[field], zone_words.get(field, [])) for field in fields}
+    for field in required_fields:
+        if template.fields.get(field) and confidence[field] < min_confidence:
+            return None
+
+    raw_lines = [header_text] + [text for texts in zone_texts.values() for text in texts]
+    raw_text = '\n'.join(line for line in raw_lines if line.strip())
+    # A header keyword alone must not change the ID type the classifier would give
+    if detect_id_type(raw_text) != template.id_type:
+        return None
+    return {
+        'template': template.name,
+        'idType': template.id_type,
+        'fields': fields,
+        'fieldConfidence': confidence,
+        'rawText': raw_text,
+        'passes': ['header'] + [f'zone:{field}' for field in zone_fields],
+    }
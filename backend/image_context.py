@@ -0,0 +1,99 @@
+"""
+Per-request image context
+Decodes an uploaded image once and lazily memoizes the views the OCR and face stages need
+(BGR, grayscale, upright, thresholded), so /validate-id does not decode or convert the
+same ID photo twice.
+"""
+import base64
+import io
+from functools import cached_property
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from orientation import decode_upright_cv, detect_text_rotation, exif_orientation, rotate_clockwise_cv
+
+
+class ImageContext:
+    """Decoded image plus memoized derived views (valid for one request)"""
+
+    def __init__(self, image_data: bytes):
+        self.data = image_data
+        self._text_orientation: Optional[Dict] = None
+        # Faces detected by the face stage (bbox, det_score, normed_embedding), once it has run
+        self.faces: Optional[List] = None
+
+    @classmethod
+    def from_base64(cls, image_base64: str) -> 'ImageContext':
+        return cls(base64.b64decode(image_base64))
+
+    @classmethod
+    def wrap(cls, image) -> 'ImageContext':
+        """Accept an existing context or a base64 string"""
+        return image if isinstance(image, cls) else cls.from_base64(image)
+
+    @cached_property
+    def bgr(self) -> Optional[np.ndarray]:
+        """Full image in OpenCV BGR order with EXIF orientation applied (None if undecodable)"""
+        image = decode_upright_cv(self.data)
+        if image is None:
+            # Formats OpenCV cannot decode (e.g. GIF)
+            try:
+                pil = ImageOps.exif_transpose(Image.open(io.BytesIO(self.data))).convert('RGB')
+            except Exception:
+                return None
+            image = cv2.cvtColor(np.asarray(pil), cv2.COLOR_RGB2BGR)
+        return image
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @property
+    def orientation_known(self) -> bool:
+        return self._text_orientation is not None
+
+    @property
+    def text_orientation(self) -> Dict:
+        """{ "rotation": clockwise degrees to make the text upright, "method": "..." } (detected on first use)"""
+        if self._text_orientation is None:
+            if exif_orientation(self.data) != 1:
+                # The camera recorded the orientation and bgr already applied it
+                self._text_orientation = {'rotation': 0, 'method': 'exif'}
+            else:
+                rotation, method = detect_text_rotation(Image.fromarray(self.gray))
+                self._text_orientation = {'rotation': rotation, 'method': method}
+        return self._text_orientation
+
+    def set_text_orientation(self, orientation: Dict):
+        """Reuse an orientation decided earlier (e.g. stored with a cached OCR result)"""
+        self._text_orientation = orientation
+
+    @cached_property
+    def upright_bgr(self) -> np.ndarray:
+        return rotate_clockwise_cv(self.bgr, self.text_orientation['rotation'])
+
+    @cached_property
+    def upright_gray(self) -> np.ndarray:
+        return rotate_clockwise_cv(self.gray, self.text_orientation['rotation'])
+
+    @cached_property
+    def thresholded(self) -> np.ndarray:
+        """Upright, adaptive-thresholded and cleaned grayscale for OCR"""
+        thresh = cv2.adaptiveThreshold(
+            self.upright_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, 11, 2
+        )
+        kernel = np.ones((2, 2), np.uint8)
+        return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+
+    def face_bgr(self) -> Optional[np.ndarray]:
+        """
+        View for face detection: text-upright if the orientation is already known
+        (ID cards after OCR), otherwise the EXIF-upright image (selfies)
+        """
+        if self.bgr is None:
+            return None
+        return self.upright_bgr if self.orientation_known else self.bgr
@@ -0,0 +1,84 @@
+"""
+Early-exit OCR cascade
+Passes are grouped into ordered stages. Each stage runs in parallel on the OCR pool, then the
+words read so far are merged and scored, and the cascade stops once every requested field is
+confident enough.
+"""
+import os
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from ocr_engine import OcrWord
+from ocr_merge import MergedText, merge_words
+from ocr_pool import get_ocr_pool
+
+# Minimum field confidence (0-1) needed before the cascade stops early
+OCR_CASCADE_MIN_CONFIDENCE = float(os.environ.get('OCR_CASCADE_MIN_CONFIDENCE', 0.6))
+
+ALL_FIELDS = ('fullName', 'idNumber', 'dateOfBirth')
+
+
+class OcrPass:
+    """A single Tesseract pass: config string plus an optional rotation of the input"""
+
+    def __init__(self, name: str, config: str, rotate: int = 0):
+        self.name = name
+        self.config = config
+        self.rotate = rotate
+
+    def __repr__(self):
+        return f'OcrPass({self.name!r})'
+
+
+# Cheapest / most likely to succeed first
+DEFAULT_CASCADE: List[List[OcrPass]] = [
+    [OcrPass('psm6', '--oem 3 --psm 6')],                       # Uniform block of text
+    [OcrPass('psm4', '--oem 3 --psm 4'),                        # Single column (vertical text)
+     OcrPass('psm11', '--oem 3 --psm 11')],                     # Sparse text
+    [OcrPass('psm6-digits', '--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789*S'),
+     OcrPass('psm7', '--oem 3 --psm 7'),                        # Single line (ID numbers)
+     OcrPass('psm8', '--oem 3 --psm 8')],                       # Single word (vertical digits)
+    # The orientation stage already made the image upright; this only catches an
+    # upside-down card that the text-line estimate cannot tell apart from upright
+    [OcrPass('rot180', '--oem 3 --psm 6', rotate=180)],
+]
+
+
+def merge_frames(frames: Dict[int, List[List[OcrWord]]]) -> MergedText:
+    """
+    Merge pass words per rotation (passes on the same rotation share a coordinate frame),
+    then append the frames in the order they were first run
+    """
+    merged = MergedText([])
+    for passes in frames.values():
+        merged = merged + merge_words(passes)
+    return merged
+
+
+def fields_complete(scores: Dict[str, Tuple[object, float]], required_fields: Sequence[str],
+                    min_confidence: float) -> bool:
+    return all(scores.get(field, (None, 0.0))[1] >= min_confidence for field in required_fields)
+
+
+def run_cascade(image, run_pass: Callable[[object, str], List[OcrWord]],
+                score_fields: Callable[[MergedText], Dict[str, Tuple[object, float]]],
+                required_fields: Sequence[str] = ALL_FIELDS,
+                stages: Sequence[Sequence[OcrPass]] = DEFAULT_CASCADE,
+                min_confidence: float = OCR_CASCADE_MIN_CONFIDENCE) -> Tuple[MergedText, List[str]]:
+    """
+    Run the cascade on image. run_pass(image, config) returns the words of one pass.
+    Returns (merged words of every pass that ran, names of the passes that ran).
+    """
+    pool = get_ocr_pool()
+    frames: Dict[int, List[List[OcrWord]]] = {}
+    passes_run: List[str] = []
+    merged = MergedText([])
+    for stage in stages:
+        jobs = [(image.rotate(p.rotate, expand=True) if p.rotate else image, p.config) for p in stage]
+        for ocr_pass, words in zip(stage, pool.map(run_pass, jobs)):
+            passes_run.append(ocr_pass.name)
+            if words:
+                frames.setdefault(ocr_pass.rotate, []).append(words)
+        merged = merge_frames(frames)
+        if merged.tokens and fields_complete(score_fields(merged), required_fields, min_confidence):
+            break
+    return merged, passes_run
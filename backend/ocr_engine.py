@@ -0,0 +1,192 @@
+"""
+OCR engine layer
+Keeps initialized Tesseract API handles alive (one per worker thread) via tesserocr so every pass
+reuses the loaded language model and receives the image in memory. Falls back to pytesseract,
+which starts a tesseract process per call, when tesserocr is not installed.
+"""
+import os
+import shlex
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pytesseract
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    # print("⚠️  tesserocr not installed. OCR will use pytesseract. Install with: pip install tesserocr")
+
+# 'auto' (tesserocr if installed), 'tesserocr' or 'pytesseract'
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+# Optional tessdata directory for tesserocr (defaults to the one tesserocr was built against)
+TESSDATA_PATH = os.environ.get('TESSDATA_PREFIX')
+
+
+class OcrWord(NamedTuple):
+    """One recognized word with its confidence (0-100) and pixel bounding box"""
+    text: str
+    conf: float
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+def parse_config(config: str) -> Tuple[Optional[int], Optional[int], Dict[str, str]]:
+    """Parse a pytesseract-style config string into (oem, psm, variables)"""
+    oem = None
+    psm = None
+    variables = {}
+    args = shlex.split(config or '')
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--oem' and i + 1 < len(args):
+            oem = int(args[i + 1])
+            i += 1
+        elif arg == '--psm' and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == '-c' and i + 1 < len(args) and '=' in args[i + 1]:
+            key, value = args[i + 1].split('=', 1)
+            variables[key] = value
+            i += 1
+        i += 1
+    return oem, psm, variables
+
+
+class PytesseractEngine:
+    """Subprocess backend (one tesseract process per call)"""
+    name = 'pytesseract'
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+
+    def image_to_string(self, image, config: str = '', timeout: float = 0) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=config, timeout=timeout)
+
+    def image_to_data(self, image, config: str = '', timeout: float = 0) -> List[OcrWord]:
+        data = pytesseract.image_to_data(image, lang=self.lang, config=config, timeout=timeout,
+                                         output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            # Non-word levels (page, block, line) are reported with conf -1
+            if text.strip() and conf >= 0:
+                words.append(OcrWord(text.strip(), conf, int(data['left'][i]), int(data['top'][i]),
+                                     int(data['width'][i]), int(data['height'][i])))
+        return words
+
+    def detect_orientation(self, image, timeout: float = 0) -> Optional[Tuple[int, float]]:
+        """Tesseract OSD: (clockwise degrees to upright, confidence) or None if undetermined"""
+        try:
+            osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT, timeout=timeout)
+        except pytesseract.TesseractError:
+            # Too few characters for OSD
+            return None
+        return int(osd['rotate']) % 360, float(osd['orientation_conf'])
+
+
+class TesserocrEngine:
+    """In-process backend with one persistent Tesseract API handle per thread and OEM"""
+    name = 'tesserocr'
+
+    def __init__(self, lang: str = OCR_LANG, path: Optional[str] = TESSDATA_PATH):
+        self.lang = lang
+        self.path = path
+        self._local = threading.local()
+
+    def _get_api(self, oem: Optional[int]):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        oem = tesserocr.OEM.DEFAULT if oem is None else oem
+        api = apis.get(oem)
+        if api is None:
+            kwargs = {'lang': self.lang, 'oem': oem}
+            if self.path:
+                kwargs['path'] = self.path
+            api = apis[oem] = tesserocr.PyTessBaseAPI(**kwargs)
+        return api
+
+    def _run(self, image, config: str, read: Callable):
+        """Configure the thread's handle for config, run read(api) on image, then reset it"""
+        oem, psm, variables = parse_config(config)
+        api = self._get_api(oem)
+        # pytesseract's default page segmentation is 3 (fully automatic)
+        api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+        previous = {}
+        for key, value in variables.items():
+            previous[key] = api.GetVariableAsString(key)
+            api.SetVariable(key, value)
+        try:
+            api.SetImage(image)
+            return read(api)
+        finally:
+            # Handles are reused, so per-pass variables (e.g. whitelists) must not leak
+            for key, value in previous.items():
+                api.SetVariable(key, value if value is not None else '')
+            api.Clear()
+
+    def image_to_string(self, image, config: str = '', timeout: float = 0) -> str:
+        # timeout is enforced by the OCR pool; an in-process call cannot be killed
+        return self._run(image, config, lambda api: api.GetUTF8Text())
+
+    def image_to_data(self, image, config: str = '', timeout: float = 0) -> List[OcrWord]:
+        return self._run(image, config, self._read_words)
+
+    @staticmethod
+    def _read_words(api) -> List[OcrWord]:
+        api.Recognize()
+        iterator = api.GetIterator()
+        if iterator is None:
+            return []
+        level = tesserocr.RIL.WORD
+        words = []
+        for word in tesserocr.iterate_level(iterator, level):
+            text = word.GetUTF8Text(level)
+            box = word.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            words.append(OcrWord(text.strip(), float(word.Confidence(level)), x1, y1, x2 - x1, y2 - y1))
+        return words
+
+    def detect_orientation(self, image, timeout: float = 0) -> Optional[Tuple[int, float]]:
+        """Tesseract OSD: (clockwise degrees to upright, confidence) or None if undetermined"""
+        api = self._get_api(None)
+        api.SetPageSegMode(tesserocr.PSM.OSD_ONLY)
+        try:
+            api.SetImage(image)
+            osd = api.DetectOrientationScript()
+        finally:
+            api.Clear()
+        if not osd:
+            return None
+        # orient_deg is the current (counter-clockwise) orientation of the text
+        return (360 - int(osd['orient_deg'])) % 360, float(osd['orient_conf'])
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(name: str = OCR_ENGINE):
+    """Create an OCR engine by name ('auto', 'tesserocr' or 'pytesseract')"""
+    if name == 'tesserocr' or (name == 'auto' and TESSEROCR_AVAILABLE):
+        if not TESSEROCR_AVAILABLE:
+            raise RuntimeError('OCR_ENGINE=tesserocr but tesserocr is not installed')
+        return TesserocrEngine()
+    return PytesseractEngine()
+
+
+def get_ocr_engine():
+    """Return the shared process-wide OCR engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine()
+    return _engine
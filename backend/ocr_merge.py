@@ -0,0 +1,120 @@
+"""
+Word-level merging of OCR passes
+Words from all passes over the same image are clustered by bounding-box overlap, each cluster
+keeps its confidence-weighted winning spelling, and the result is laid out in reading order.
+The merged text is deterministic and does not grow with the number of passes.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+from ocr_engine import OcrWord
+
+# Words below this Tesseract confidence (0-100) are dropped before merging
+OCR_MIN_WORD_CONF = float(os.environ.get('OCR_MIN_WORD_CONF', 20))
+# Boxes overlapping at least this much (intersection over union) are the same physical word
+WORD_IOU_THRESHOLD = 0.5
+
+
+class Token:
+    """A deduplicated word: winning text, confidence (0-1) and box (left, top, right, bottom)"""
+    __slots__ = ('text', 'conf', 'box', '_votes', '_best')
+
+    def __init__(self, word: OcrWord):
+        self.box = (word.left, word.top, word.left + word.width, word.top + word.height)
+        self._votes: Dict[str, float] = {}
+        self._best: Dict[str, float] = {}
+        self.text = word.text
+        self.conf = 0.0
+        self.add(word)
+
+    def add(self, word: OcrWord):
+        self._votes[word.text] = self._votes.get(word.text, 0.0) + word.conf
+        self._best[word.text] = max(self._best.get(word.text, 0.0), word.conf)
+        # Spelling with the most total confidence across passes wins (ties: first seen)
+        self.text = max(self._votes, key=self._votes.get)
+        self.conf = self._best[self.text] / 100.0
+
+    @property
+    def center_y(self) -> float:
+        return (self.box[1] + self.box[3]) / 2.0
+
+    def to_dict(self) -> Dict:
+        return {'text': self.text, 'conf': round(self.conf, 3), 'box': list(self.box)}
+
+
+class MergedText:
+    """Deduplicated tokens of one or more passes, in reading order"""
+
+    def __init__(self, lines: List[List[Token]]):
+        self.lines = lines
+        self.tokens = [token for line in lines for token in line]
+        self.text = '\n'.join(' '.join(token.text for token in line) for line in lines)
+
+    def __add__(self, other: 'MergedText') -> 'MergedText':
+        return MergedText(self.lines + other.lines)
+
+
+def _iou(a, b) -> float:
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def _reading_order(tokens: List[Token]) -> List[List[Token]]:
+    """Group tokens into lines (vertical center inside the line's span) sorted top-down, left-right"""
+    lines: List[List[Token]] = []
+    spans = []
+    for token in sorted(tokens, key=lambda t: (t.center_y, t.box[0])):
+        if lines and spans[-1][0] <= token.center_y <= spans[-1][1]:
+            lines[-1].append(token)
+        else:
+            lines.append([token])
+            spans.append((token.box[1], token.box[3]))
+    return [sorted(line, key=lambda t: t.box[0]) for line in lines]
+
+
+def merge_words(passes: Sequence[Sequence[OcrWord]], min_conf: float = OCR_MIN_WORD_CONF) -> MergedText:
+    """Merge the words of several passes over the same image (same coordinate frame)"""
+    words = [word for words in passes for word in words if word.conf >= min_conf]
+    tokens: List[Token] = []
+    # Highest confidence first so each cluster is anchored on its best reading
+    for word in sorted(words, key=lambda w: -w.conf):
+        box = (word.left, word.top, word.left + word.width, word.top + word.height)
+        best, best_iou = None, WORD_IOU_THRESHOLD
+        for token in tokens:
+            iou = _iou(token.box, box)
+            if iou >= best_iou:
+                best, best_iou = token, iou
+        if best is None:
+            tokens.append(Token(word))
+        else:
+            best.add(word)
+    return MergedText(_reading_order(tokens))
+
+
+def words_to_text(words: Sequence[OcrWord]) -> str:
+    """Lay out a single pass's words as text"""
+    return merge_words([words], min_conf=0).text
+
+
+def field_confidence(value: Optional[str], tokens: Sequence[Token]) -> float:
+    """
+    Confidence (0-1) of an extracted field: mean confidence of the tokens it was read from.
+    Digit runs are matched by their digits so an ID number stitched from several tokens still scores.
+    """
+    if not value:
+        return 0.0
+    value_digits = re.sub(r'\D', '', value)
+    value_words = set(value.upper().split())
+    confs = []
+    for token in tokens:
+        text = token.text.upper().strip(',.;:')
+        token_digits = re.sub(r'\D', '', text)
+        if text in value_words or (len(token_digits) >= 2 and token_digits in value_digits):
+            confs.append(token.conf)
+    return sum(confs) / len(confs) if confs else 0.0
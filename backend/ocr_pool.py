@@ -0,0 +1,148 @@
+"""
+Process-wide OCR worker pool
+Runs the Tesseract passes of a request in parallel on a bounded set of worker threads.
+Work is scheduled round-robin across requests so one large request cannot starve the others.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Number of OCR worker threads (each pass releases the GIL while Tesseract runs)
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 2))
+# Maximum seconds a single OCR pass may run once it has started
+OCR_PASS_TIMEOUT = float(os.environ.get('OCR_PASS_TIMEOUT', 15))
+
+
+class _Job:
+    """A single unit of work queued on the pool"""
+    __slots__ = ('func', 'args', 'future', 'started', 'started_at')
+
+    def __init__(self, func: Callable, args: tuple):
+        self.func = func
+        self.args = args
+        self.future = Future()
+        self.started = threading.Event()
+        self.started_at = 0.0
+
+
+class OcrPool:
+    """Bounded worker pool with fair (round-robin per request) scheduling"""
+
+    def __init__(self, workers: int = OCR_WORKERS, pass_timeout: float = OCR_PASS_TIMEOUT):
+        self.workers = max(1, workers)
+        self.pass_timeout = pass_timeout
+        self._cond = threading.Condition()
+        # Request id -> queued jobs. Requests are served in rotation.
+        self._queues: Dict[int, deque] = {}
+        self._rotation: deque = deque()
+        self._next_request_id = 0
+        self._threads: List[threading.Thread] = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'ocr-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._rotation:
+                    self._cond.wait()
+                request_id = self._rotation.popleft()
+                queue = self._queues[request_id]
+                job = queue.popleft()
+                if queue:
+                    # Requeue at the back so other requests get the next worker
+                    self._rotation.append(request_id)
+                else:
+                    del self._queues[request_id]
+
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            job.started_at = time.monotonic()
+            job.started.set()
+            try:
+                job.future.set_result(job.func(*job.args))
+            except BaseException as e:
+                job.future.set_exception(e)
+
+    def _submit_all(self, func: Callable, items: Iterable[tuple]) -> List[_Job]:
+        jobs = [_Job(func, args) for args in items]
+        if not jobs:
+            return jobs
+        with self._cond:
+            request_id = self._next_request_id
+            self._next_request_id += 1
+            self._queues[request_id] = deque(jobs)
+            self._rotation.append(request_id)
+            self._cond.notify(len(jobs))
+        return jobs
+
+    def map(self, func: Callable, items: Iterable[tuple], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Run func(*args) for every args tuple in items and return the results in input order.
+        A pass that raises or exceeds the per-pass timeout yields None instead of failing the request.
+        """
+        timeout = self.pass_timeout if timeout is None else timeout
+        jobs = self._submit_all(func, items)
+        results = []
+        for job in jobs:
+            # Queue time does not count against the pass timeout, only run time does
+            job.started.wait()
+            remaining = timeout - (time.monotonic() - job.started_at)
+            try:
+                results.append(job.future.result(timeout=max(remaining, 0)))
+            except Exception:
+                # print(f"OCR pass failed or timed out: {e}")
+                results.append(None)
+        return results
+
+    def imap_unordered(self, func: Callable, items: Iterable[tuple],
+                       timeout: Optional[float] = None) -> Iterator[Tuple[int, Any]]:
+        """
+        Like map, but yields (index, result) as each job finishes, for streaming many independent jobs.
+        A job that raises or runs longer than the timeout yields (index, None).
+        """
+        timeout = self.pass_timeout if timeout is None else timeout
+        jobs = self._submit_all(func, items)
+        pending = {job.future: index for index, job in enumerate(jobs)}
+        try:
+            while pending:
+                # Wake up for the earliest running job's deadline (queued jobs have none yet)
+                now = time.monotonic()
+                deadlines = [jobs[index].started_at + timeout for index in pending.values() if jobs[index].started.is_set()]
+                wait_for = min(min(deadlines, default=now + timeout) - now, timeout)
+                done, _ = wait(list(pending), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        yield index, future.result()
+                    except Exception:
+                        yield index, None
+                now = time.monotonic()
+                for future, index in list(pending.items()):
+                    job = jobs[index]
+                    if job.started.is_set() and now - job.started_at > timeout:
+                        # Stop waiting; the worker finishes the job in the background
+                        del pending[future]
+                        yield index, None
+        finally:
+            # Consumer stopped early (e.g. client disconnected): drop the jobs that have not started
+            for future in pending:
+                future.cancel()
+
+
+_pool: Optional[OcrPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OcrPool:
+    """Return the shared process-wide OCR pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OcrPool()
+    return _pool
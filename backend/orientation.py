@@ -0,0 +1,109 @@
+"""
+Orientation stage
+Brings ID and selfie images upright once, before OCR and face detection, using lossless 90° transposes.
+Order of evidence: EXIF orientation tag, then Tesseract OSD, then a cheap text-line direction estimate.
+"""
+import io
+import os
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ocr_engine import get_ocr_engine
+from ocr_pool import get_ocr_pool
+
+# Minimum Tesseract OSD orientation confidence to trust its answer
+OSD_MIN_CONFIDENCE = float(os.environ.get('OSD_MIN_CONFIDENCE', 2.0))
+# How much more vertical than horizontal line length is needed to call the text sideways
+TEXT_LINE_RATIO = float(os.environ.get('TEXT_LINE_RATIO', 1.5))
+# Images are downscaled to this size for the text-line estimate
+_LINE_ESTIMATE_SIZE = 800
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# EXIF orientation -> (clockwise rotation, mirror horizontally after rotating)
+_EXIF_TRANSFORMS = {
+    2: (0, True),
+    3: (180, False),
+    4: (180, True),
+    5: (90, True),
+    6: (90, False),
+    7: (270, True),
+    8: (270, False),
+}
+
+# Clockwise degrees -> lossless transpose
+_PIL_TRANSPOSES = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+_CV_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def rotate_clockwise_pil(image: Image.Image, degrees: int) -> Image.Image:
+    """Rotate a PIL image clockwise by a multiple of 90 degrees without resampling"""
+    degrees %= 360
+    return image.transpose(_PIL_TRANSPOSES[degrees]) if degrees else image
+
+
+def rotate_clockwise_cv(image: np.ndarray, degrees: int) -> np.ndarray:
+    """Rotate an OpenCV image clockwise by a multiple of 90 degrees without resampling"""
+    degrees %= 360
+    return cv2.rotate(image, _CV_ROTATIONS[degrees]) if degrees else image
+
+
+def exif_orientation(image_data: bytes) -> int:
+    """Read the EXIF orientation tag (1 when absent) without decoding the pixels"""
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            return int(image.getexif().get(EXIF_ORIENTATION_TAG, 1))
+    except Exception:
+        return 1
+
+
+def decode_upright_cv(image_data: bytes) -> Optional[np.ndarray]:
+    """cv2.imdecode with the EXIF orientation applied explicitly (None if undecodable)"""
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+    rotation, mirror = _EXIF_TRANSFORMS.get(exif_orientation(image_data), (0, False))
+    image = rotate_clockwise_cv(image, rotation)
+    return cv2.flip(image, 1) if mirror else image
+
+
+def estimate_text_rotation(image: Image.Image) -> int:
+    """
+    Cheap text-line direction estimate: 0 if text lines run horizontally, 90 if they run vertically.
+    Characters are smeared together into line blobs, which are elongated along the line direction.
+    Cannot tell upright from upside down.
+    """
+    gray = np.asarray(image.convert('L'))
+    scale = _LINE_ESTIMATE_SIZE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    blobs = cv2.dilate(ink, np.ones((3, 3), np.uint8), iterations=2)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(blobs)
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    horizontal = widths[widths > heights * 2].sum()
+    vertical = heights[heights > widths * 2].sum()
+    return 90 if vertical > horizontal * TEXT_LINE_RATIO else 0
+
+
+def detect_text_rotation(image: Image.Image) -> Tuple[int, str]:
+    """Clockwise degrees needed to make the text upright, and the method that decided it"""
+    engine = get_ocr_engine()
+    osd = get_ocr_pool().map(engine.detect_orientation, [(image,)])[0]
+    if osd is not None:
+        rotation, confidence = osd
+        if confidence >= OSD_MIN_CONFIDENCE:
+            return rotation, 'osd'
+    return estimate_text_rotation(image), 'lines'
@@ -0,0 +1,275 @@
+"""
+Image quality gate
+Cheap checks on a downscaled copy of an upload: blur (variance of the Laplacian), exposure, glare,
+ID card presence and a low-resolution face detection. They run before OCR and full face inference,
+so attempts that would end in 'No face detected', 'Low-quality face' or 'face too small' are
+rejected in milliseconds. /precheck serves the same checks to the capture screens for a thumbnail,
+before the full-resolution photo is uploaded, and /compare-face/burst uses them (plus head pose from
+the detector keypoints) to pick the selfie frame worth a full inference.
+"""
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from face_executor import FACE_FAST_MODEL_NAME, FACE_MODEL_NAME, FaceModels, get_face_executor
+from orientation import rotate_clockwise_cv
+
+# Run the gate at the start of /validate-id, /compare-face and /compare-faces (1 = on). Off by
+# default until the thresholds below are calibrated on real uploads: with it on, photos those
+# endpoints accept today (e.g. from the Flutter ID validation flow) can be rejected up front.
+# /precheck and /compare-face/burst use the checks either way
+QUALITY_GATE = os.environ.get('QUALITY_GATE', '0') == '1'
+# Long side of the analysis copy
+QUALITY_SIZE = int(os.environ.get('QUALITY_SIZE', 640))
+# Sharpness (variance of the Laplacian at QUALITY_SIZE, 90th percentile over an 8x8 grid of tiles)
+# below which the image is too blurry
+QUALITY_MIN_SHARPNESS = float(os.environ.get('QUALITY_MIN_SHARPNESS', 6))
+# Mean brightness bounds (0-255) and share of blown-out pixels that counts as glare
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get('QUALITY_MIN_BRIGHTNESS', 40))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get('QUALITY_MAX_BRIGHTNESS', 225))
+QUALITY_MAX_GLARE = float(os.environ.get('QUALITY_MAX_GLARE', 0.05))
+# Smallest card outline (share of the frame) and whether an ID photo without one is rejected.
+# Off by default: a photo cropped tightly to the card has no visible outline
+QUALITY_MIN_CARD_AREA = float(os.environ.get('QUALITY_MIN_CARD_AREA', 0.2))
+QUALITY_REQUIRE_CARD = os.environ.get('QUALITY_REQUIRE_CARD', '0') == '1'
+# Detection score accepted at low resolution (the full-size check is 0.6) and the margin allowed on
+# the estimated face width, since boxes from the small copy are only approximate
+QUALITY_MIN_FACE_SCORE = float(os.environ.get('QUALITY_MIN_FACE_SCORE', 0.5))
+QUALITY_FACE_WIDTH_MARGIN = float(os.environ.get('QUALITY_FACE_WIDTH_MARGIN', 0.8))
+
+FACE_MIN_WIDTH = 100  # compare_face / compare_faces / validate_id
+
+# Issue messages per image kind, worded like the endpoints' own face check messages
+_LABELS = {
+    'id': {'no_face': 'No face detected in ID image', 'multiple_faces': 'Multiple faces detected in ID image',
+           'low_score': 'Low-quality face in ID image', 'small_face': 'ID face too small', 'name': 'ID image'},
+    'selfie': {'no_face': 'No face detected in selfie', 'multiple_faces': 'Multiple faces detected in selfie',
+               'low_score': 'Low-quality face in selfie', 'small_face': 'Selfie face too small', 'name': 'selfie'},
+}
+
+
+def downscale(img: np.ndarray, size: int = QUALITY_SIZE) -> Tuple[np.ndarray, float]:
+    """img reduced so its long side is at most size, and the factor from its pixels to img pixels"""
+    long_side = max(img.shape[:2])
+    if long_side <= size:
+        return img, 1.0
+    factor = long_side / size
+    small = cv2.resize(img, (round(img.shape[1] / factor), round(img.shape[0] / factor)), interpolation=cv2.INTER_AREA)
+    return small, img.shape[1] / small.shape[1]
+
+
+def find_card(gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding rect (x, y, w, h) of the largest card-shaped quadrilateral, if any"""
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = QUALITY_MIN_CARD_AREA * gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        x, y, w, h = cv2.boundingRect(approx)
+        # ID-1 cards are 1.586:1; allow for perspective
+        if 1.2 <= max(w, h) / max(1, min(w, h)) <= 2.0:
+            return x, y, w, h
+    return None
+
+
+def sharpness(gray: np.ndarray, grid: int = 8) -> float:
+    """
+    High percentile of the per-tile Laplacian variance: a sharp photo has some tiles with crisp
+    edges, while plain regions (walls, soft backgrounds, a white mask) would drag a single
+    whole-image variance down
+    """
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    height, width = gray.shape[:2]
+    tiles = [laplacian[i * height // grid:(i + 1) * height // grid, j * width // grid:(j + 1) * width // grid].var()
+             for i in range(grid) for j in range(grid)]
+    return float(np.percentile(tiles, 90))
+
+
+def pixel_checks(small: np.ndarray, kind: str, region: Optional[Tuple[int, int, int, int]] = None) -> Tuple[Dict, List[Dict]]:
+    """
+    Blur, exposure, glare (and for IDs card presence) on the analysis copy. An ID's exposure and glare
+    are measured on the card only: without a located card they are skipped, since the background
+    (often a white sheet under a scan) would be judged instead
+    """
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    metrics, issues = {}, []
+    if kind == 'id':
+        card = find_card(gray)
+        metrics['cardFound'] = card is not None
+        if card is None and QUALITY_REQUIRE_CARD:
+            issues.append({'check': 'card', 'message': 'No ID card found in the photo'})
+        region = region or card
+    if region is not None:
+        x, y, w, h = region
+        gray = gray[max(0, y):y + h, max(0, x):x + w]
+
+    sharp = sharpness(gray)
+    metrics['sharpness'] = round(sharp, 1)
+    name = _LABELS[kind]['name']
+    if sharp < QUALITY_MIN_SHARPNESS:
+        issues.append({'check': 'blur', 'message': f'The {name} is too blurry'})
+    if kind == 'id' and region is None:
+        return metrics, issues
+
+    brightness = float(gray.mean())
+    glare = float(np.count_nonzero(gray >= 250)) / gray.size
+    metrics.update({'brightness': round(brightness, 1), 'glare': round(glare, 4)})
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        issues.append({'check': 'exposure', 'message': f'The {name} is too dark'})
+    elif brightness > QUALITY_MAX_BRIGHTNESS:
+        issues.append({'check': 'exposure', 'message': f'The {name} is overexposed'})
+    if glare > QUALITY_MAX_GLARE:
+        issues.append({'check': 'glare', 'message': f'Glare on the {name}'})
+    return metrics, issues
+
+
+def detect_faces(models: FaceModels, small: np.ndarray, kind: str) -> np.ndarray:
+    """
+    Face boxes on the analysis copy (run on a face session). An ID photo may still be sideways
+    (its text orientation is only found later, by OCR), so when no face is found upright the
+    other rotations are tried before reporting none
+    """
+    bboxes, _ = models.detect_boxes(small, True)
+    if kind == 'id' and len(bboxes) == 0:
+        for rotation in (90, 270, 180):
+            bboxes, _ = models.detect_boxes(rotate_clockwise_cv(small, rotation), True)
+            if len(bboxes):
+                break
+    return bboxes
+
+
+def face_checks(bboxes: np.ndarray, kind: str, factor: float) -> Tuple[Dict, List[Dict]]:
+    """One face, a usable detection score and enough width (in full-resolution pixels)"""
+    labels = _LABELS[kind]
+    metrics = {'faces': int(len(bboxes))}
+    if len(bboxes) == 0:
+        return metrics, [{'check': 'face', 'message': labels['no_face']}]
+    if len(bboxes) > 1:
+        return metrics, [{'check': 'face', 'message': labels['multiple_faces']}]
+    box = bboxes[0]
+    width = float(box[2] - box[0]) * factor
+    metrics.update({'faceScore': round(float(box[4]), 3), 'faceWidth': round(width)})
+    if box[4] < QUALITY_MIN_FACE_SCORE:
+        return metrics, [{'check': 'face', 'message': labels['low_score']}]
+    if width < FACE_MIN_WIDTH * QUALITY_FACE_WIDTH_MARGIN:
+        return metrics, [{'check': 'face', 'message': labels['small_face']}]
+    return metrics, []
+
+
+def assess(images: List[Tuple[np.ndarray, str]], faces: bool = True,
+           full_widths: Optional[List[Optional[int]]] = None) -> List[Dict]:
+    """
+    Quality report ({ "ok", "issues", "metrics", "ms" }) for each (BGR image, 'id' | 'selfie').
+    full_widths: width of the full-resolution photo each image stands for (a /precheck thumbnail),
+    so face sizes are judged in the pixels the real upload will have.
+    Face detection runs only for images that passed the pixel checks, all of them in parallel, on the
+    light model pack when model tiers are configured.
+    """
+    start = time.perf_counter()
+    reports, pending = [], []
+    for i, (img, kind) in enumerate(images):
+        small, factor = downscale(img)
+        if full_widths and full_widths[i]:
+            factor = full_widths[i] / small.shape[1]
+        metrics, issues = pixel_checks(small, kind)
+        reports.append({'ok': not issues, 'issues': issues, 'metrics': metrics})
+        if faces and not issues:
+            executor = get_face_executor(FACE_FAST_MODEL_NAME or FACE_MODEL_NAME)
+            pending.append((i, kind, factor, executor.submit(detect_faces, small, kind)))
+    for i, kind, factor, future in pending:
+        metrics, issues = face_checks(future.result(), kind, factor)
+        reports[i]['metrics'].update(metrics)
+        reports[i]['issues'] += issues
+        reports[i]['ok'] = not reports[i]['issues']
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+    for report in reports:
+        report['ms'] = elapsed
+    return reports
+
+
+def head_pose(kps: np.ndarray) -> Dict:
+    """
+    Rough pose from the five detector keypoints (eyes, nose, mouth corners): roll in degrees, and
+    yaw / pitch as the nose's offset from where it sits on a frontal face (0 = frontal; about 0.5
+    is a strongly turned or tilted head), measured with the eye line levelled
+    """
+    left_eye, right_eye, nose, left_mouth, right_mouth = np.asarray(kps, dtype=np.float64)
+    dx, dy = right_eye - left_eye
+    roll = np.arctan2(dy, dx)
+    eyes = (left_eye + right_eye) / 2
+    cos, sin = np.cos(-roll), np.sin(-roll)
+    rotation = np.array([[cos, -sin], [sin, cos]])
+    nose, mouth = rotation @ (nose - eyes), rotation @ ((left_mouth + right_mouth) / 2 - eyes)
+    interocular = max(np.hypot(dx, dy), 1e-6)
+    # On the ArcFace alignment template the nose is halfway down from the eye line to the mouth
+    yaw = (nose[0] - mouth[0] / 2) / interocular
+    pitch = nose[1] / mouth[1] - 0.5 if mouth[1] > 1e-6 else 0.5
+    return {'yaw': round(float(yaw), 3), 'pitch': round(float(pitch), 3), 'roll': round(float(np.degrees(roll)), 1)}
+
+
+def frontality(pose: Dict) -> float:
+    """1 for a frontal, level face, falling to 0 at |yaw| or |pitch| 0.5 or 45 degrees of roll"""
+    return (max(0.0, 1 - 2 * abs(pose['yaw'])) * max(0.0, 1 - 2 * abs(pose['pitch']))
+            * max(0.0, 1 - abs(pose['roll']) / 45))
+
+
+def rank_frames(frames: List[np.ndarray]) -> List[Dict]:
+    """
+    Quality report (as assess) plus a "score" for each selfie frame of a burst, in input order.
+    A frame with one detected face scores sharpness x face width (each relative to the best such frame
+    of the burst, which shares its lighting and distance) x frontality; other frames score 0. Frames
+    that only failed the blur check are scored too, so a burst of blurry frames still has a best one;
+    order frames by (ok, score).
+    """
+    start = time.perf_counter()
+    reports, pending = [], []
+    executor = get_face_executor(FACE_FAST_MODEL_NAME or FACE_MODEL_NAME)
+    for i, img in enumerate(frames):
+        small, factor = downscale(img)
+        metrics, issues = pixel_checks(small, 'selfie')
+        reports.append({'ok': not issues, 'issues': issues, 'metrics': metrics, 'score': 0.0})
+        # Blurry frames are still detected: in a burst where every frame is blurry the least bad one is used
+        if not any(issue['check'] == 'exposure' for issue in issues):
+            pending.append((i, factor, executor.submit(FaceModels.detect_boxes, small, True)))
+    for i, factor, future in pending:
+        bboxes, kpss = future.result()
+        metrics, issues = face_checks(bboxes, 'selfie', factor)
+        reports[i]['metrics'].update(metrics)
+        reports[i]['issues'] += issues
+        if len(bboxes) == 1 and kpss is not None:
+            pose = head_pose(kpss[0])
+            reports[i]['metrics'].update(pose)
+            reports[i]['metrics']['frontality'] = round(frontality(pose), 3)
+        reports[i]['ok'] = not reports[i]['issues']
+
+    usable = [r for r in reports if 'frontality' in r['metrics']
+              and all(issue['check'] == 'blur' for issue in r['issues'])]
+    if usable:
+        best_sharpness = max(r['metrics']['sharpness'] for r in usable) or 1.0
+        best_width = max(r['metrics']['faceWidth'] for r in usable) or 1
+        for report in usable:
+            metrics = report['metrics']
+            # Square root: the Laplacian variance grows with the square of edge contrast
+            score = ((metrics['sharpness'] / best_sharpness) ** 0.5 * (metrics['faceWidth'] / best_width)
+                     * metrics['frontality'])
+            report['score'] = round(score, 4)
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+    for report in reports:
+        report['ms'] = elapsed
+    return reports
+
+
+def first_issue(reports: List[Dict]) -> Optional[str]:
+    """Message of the first failed check across reports (None if all passed)"""
+    for report in reports:
+        if report['issues']:
+            return report['issues'][0]['message']
+    return None
@@ -0,0 +1,159 @@
+"""
+Offline INT8 quantization of the face models (FACE_MODEL_PRECISION=int8)
+Runs the FP32 pack over calibration images and records the exact detector and recognizer inputs the
+app produces (same resizing, alignment and normalization). It then writes statically quantized copies
+of the detection and recognition models (QDQ, per-channel INT8 weights, UINT8 activations) with a
+quantization.json manifest to ~/.insightface/models/<name>_int8 (or --output). Modules that are not
+quantized are copied unchanged, so FACE_MODULES=all still loads. --mode dynamic quantizes the
+weights only and needs no calibration images (usually slower than static for convolutions on CPU).
+Use calibration photos that are not in the pair set used by bench_face_quantized.py.
+Usage: python quantize_face_models.py [images or directories ...] [--output DIR] [--mode static|dynamic]
+       [--method minmax|entropy|percentile] [--limit N]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import onnxruntime
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from face_executor import FACE_MODEL_NAME, FaceModels, allowed_modules, model_dir
+
+QUANTIZED_TASKS = ('detection', 'recognition')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+METHODS = {
+    'minmax': CalibrationMethod.MinMax,
+    'entropy': CalibrationMethod.Entropy,
+    'percentile': CalibrationMethod.Percentile,
+}
+
+
+class FeedRecorder:
+    """Stands in for a model's InferenceSession and keeps every input feed it is run with"""
+
+    def __init__(self, session):
+        self.session = session
+        self.feeds = []
+
+    def run(self, output_names, feed, *args, **kwargs):
+        self.feeds.append(feed)
+        return self.session.run(output_names, feed, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class FeedReader(CalibrationDataReader):
+    def __init__(self, feeds):
+        self._feeds = iter(feeds)
+
+    def get_next(self):
+        return next(self._feeds, None)
+
+
+def calibration_images(paths, limit):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            files.append(path)
+    if not files:
+        from insightface.data import get_image
+        return [get_image(name) for name in ('t1', 'Tom_Hanks_54745', 'mask_white')]
+    images = (cv2.imread(f) for f in files)
+    return [img for img in images if img is not None][:limit]
+
+
+def record_feeds(models: FaceModels, images):
+    """Model inputs by task name, produced by running the FP32 pipeline over images"""
+    recorders = {}
+    for task in QUANTIZED_TASKS:
+        if task in models.models:
+            recorders[task] = models.models[task].session = FeedRecorder(models.models[task].session)
+    for img in images:
+        models.get(img)
+    for task, recorder in recorders.items():
+        models.models[task].session = recorder.session
+    return {task: recorder.feeds for task, recorder in recorders.items()}
+
+
+def quantize_model(source: str, target: str, feeds, mode: str = 'static', method: str = 'minmax'):
+    with tempfile.TemporaryDirectory() as scratch:
+        # Shape inference and graph optimization before quantization, as ORT recommends
+        prepared = os.path.join(scratch, 'prepared.onnx')
+        quant_pre_process(source, prepared, skip_symbolic_shape=True)
+        if mode == 'dynamic':
+            quantize_dynamic(prepared, target, weight_type=QuantType.QUInt8)
+        else:
+            quantize_static(prepared, target, FeedReader(feeds), quant_format=QuantFormat.QDQ,
+                            per_channel=True, weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8,
+                            calibrate_method=METHODS[method])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='calibration images or directories of them '
+                                                  '(default: the InsightFace sample images)')
+    parser.add_argument('--name', default=FACE_MODEL_NAME, help='model pack to quantize')
+    parser.add_argument('--output', help='output directory (default: ~/.insightface/models/<name>_int8)')
+    parser.add_argument('--mode', choices=('static', 'dynamic'), default='static')
+    parser.add_argument('--method', choices=sorted(METHODS), default='minmax', help='static calibration method')
+    parser.add_argument('--limit', type=int, default=100, help='calibration images to use')
+    args = parser.parse_args()
+
+    source_dir = model_dir(args.name, 'fp32')
+    output_dir = args.output or model_dir(args.name, 'int8')
+    os.makedirs(output_dir, exist_ok=True)
+
+    models = FaceModels(args.name, modules=allowed_modules(), directory=source_dir)
+    models.prepare(ctx_id=0, det_size=(640, 640))
+    images = calibration_images(args.images, args.limit) if args.mode == 'static' else []
+    feeds = record_feeds(models, images) if images else {}
+
+    manifest = {
+        'precision': 'int8',
+        'mode': args.mode,
+        'method': args.method if args.mode == 'static' else None,
+        'source': source_dir,
+        'onnxruntime': onnxruntime.__version__,
+        'calibrationImages': len(images),
+        'created': time.time(),
+        'models': {},
+    }
+    loaded = {os.path.basename(model.model_file): (task, model) for task, model in models.models.items()}
+    for source in sorted(glob.glob(os.path.join(source_dir, '*.onnx'))):
+        filename = os.path.basename(source)
+        target = os.path.join(output_dir, filename)
+        task, model = loaded.get(filename, (None, None))
+        quantized = task in QUANTIZED_TASKS and (args.mode == 'dynamic' or bool(feeds.get(task)))
+        if quantized:
+            start = time.perf_counter()
+            quantize_model(source, target, feeds.get(task), args.mode, args.method)
+            print(f'{filename}: {task} quantized from {len(feeds.get(task) or [])} inputs '
+                  f'in {time.perf_counter() - start:.1f} s, '
+                  f'{os.path.getsize(source) / 2 ** 20:.1f} MB -> {os.path.getsize(target) / 2 ** 20:.1f} MB')
+        else:
+            shutil.copyfile(source, target)
+            print(f'{filename}: copied')
+        entry = {'task': task, 'quantized': quantized}
+        if model is not None and hasattr(model, 'input_mean'):
+            entry['input_mean'] = float(model.input_mean)
+            entry['input_std'] = float(model.input_std)
+        manifest['models'][filename] = entry
+
+    with open(os.path.join(output_dir, 'quantization.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'wrote {output_dir} (load with FACE_MODEL_PRECISION=int8 or FACE_MODEL_DIR={output_dir})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Startup warm-up and readiness state
+Models are created lazily on first use. The warm-up steps (model loading, dummy inferences) run once,
+in order, on a background thread started at import or by the first /ready probe, and the state and
+duration of each step is recorded. A worker is ready once every step has finished, so a load balancer
+polling /ready only routes traffic to warmed workers. A failed step keeps the worker unready until a
+later /ready probe retries it (after a backoff that doubles with each failure of that step); steps
+that already finished are not run again.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Start the warm-up when app.py is imported (0 = wait for the first /ready probe)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+# Seconds before a failed step may be retried, doubled after every further failure up to the maximum
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', 5))
+WARMUP_RETRY_MAX_SECONDS = float(os.environ.get('WARMUP_RETRY_MAX_SECONDS', 300))
+
+
+class Readiness:
+    """Ordered warm-up steps and their progress"""
+
+    def __init__(self):
+        self._steps: List[Tuple[str, Callable]] = []
+        self._state: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._failures: Dict[str, int] = {}
+        self._retry_at = None
+        self._created = time.monotonic()
+
+    def step(self, name: str, func: Callable):
+        """Register a warm-up step (run in registration order)"""
+        self._steps.append((name, func))
+        self._state[name] = {'state': 'pending'}
+
+    def start(self):
+        """Run the steps on a background thread (first call), or retry a failed step once its backoff is over"""
+        with self._lock:
+            if self._thread is not None and (self._retry_at is None or time.monotonic() < self._retry_at):
+                return
+            self._retry_at = None
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        for name, func in self._steps:
+            with self._lock:
+                if self._state[name]['state'] == 'done':
+                    continue
+                self._state[name] = {'state': 'running'}
+            start = time.monotonic()
+            try:
+                func()
+            except Exception as e:
+                with self._lock:
+                    failures = self._failures[name] = self._failures.get(name, 0) + 1
+                    self._state[name] = {'state': 'failed', 'seconds': round(time.monotonic() - start, 3),
+                                         'error': str(e), 'failures': failures}
+                    backoff = min(WARMUP_RETRY_SECONDS * 2 ** (failures - 1), WARMUP_RETRY_MAX_SECONDS)
+                    self._retry_at = time.monotonic() + backoff
+                # Later steps depend on the earlier ones
+                return
+            with self._lock:
+                self._state[name] = {'state': 'done', 'seconds': round(time.monotonic() - start, 3)}
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(step['state'] == 'done' for step in self._state.values())
+
+    def status(self) -> Dict:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._state.items()}
+            started = self._thread is not None
+            retry_at = self._retry_at
+        status = {
+            'ready': all(step['state'] == 'done' for step in steps.values()),
+            'started': started,
+            'uptimeSeconds': round(time.monotonic() - self._created, 3),
+            'steps': steps,
+        }
+        if retry_at is not None:
+            status['retryInSeconds'] = round(max(0.0, retry_at - time.monotonic()), 3)
+        return status
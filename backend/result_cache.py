@@ -0,0 +1,203 @@
+"""
+Content-addressed result cache
+Results are keyed by a fast hash of the decoded image bytes plus a profile string describing how
+they were computed. Entries are evicted least-recently-used beyond a size bound and expire after a TTL.
+The backing store is pluggable: in-process by default, or SQLite on disk shared by all workers.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# 'memory', 'disk' or 'off'
+OCR_CACHE_BACKEND = os.environ.get('OCR_CACHE_BACKEND', 'memory')
+OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', 1024))
+OCR_CACHE_TTL = float(os.environ.get('OCR_CACHE_TTL', 3600))
+OCR_CACHE_PATH = os.environ.get('OCR_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr_cache.sqlite3'))
+
+# Detected faces (boxes, scores, embeddings) per image: 'memory' or 'off', bounded by entries and MB
+FACE_CACHE_BACKEND = os.environ.get('FACE_CACHE_BACKEND', 'memory')
+FACE_CACHE_SIZE = int(os.environ.get('FACE_CACHE_SIZE', 2048))
+FACE_CACHE_MAX_MB = float(os.environ.get('FACE_CACHE_MAX_MB', 64))
+FACE_CACHE_TTL = float(os.environ.get('FACE_CACHE_TTL', 3600))
+
+
+def make_key(image_data: bytes, profile: str) -> str:
+    """Hash of the image bytes and the profile that produced the result"""
+    digest = hashlib.blake2b(image_data, digest_size=16)
+    digest.update(b'\0' + profile.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryStore:
+    """In-process LRU store (per worker), optionally also bounded by the total size of its values"""
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int = 0, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # max_bytes=0: no size bound; sizeof estimates the bytes held by a value
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Returns (value or None, expired)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, created, size = entry
+            if time.time() - created > self.ttl:
+                del self._entries[key]
+                self.bytes -= size
+                return None, True
+            self._entries.move_to_end(key)
+            return value, False
+
+    def put(self, key: str, value) -> int:
+        """Store value and return the number of entries evicted to make room"""
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (value, time.time(), size)
+            self.bytes += size
+            evicted = 0
+            while len(self._entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes
+                                                             and len(self._entries) > 1):
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+                evicted += 1
+            return evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteStore:
+    """On-disk LRU store shared by every worker process using the same file"""
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, key: str):
+        conn = self._connect()
+        row = conn.execute('SELECT value, created FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, False
+        now = time.time()
+        with conn:
+            if now - row[1] > self.ttl:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return None, True
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), False
+
+    def put(self, key: str, value) -> int:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(value), now, now))
+            excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('DELETE FROM cache WHERE key IN '
+                             '(SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,))
+                return excess
+        return 0
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class ResultCache:
+    """Cache front-end with hit / miss / eviction counters"""
+
+    def __init__(self, store=None):
+        # store=None disables caching but keeps the same interface
+        self.store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.store is None:
+            return None
+        value, expired = self.store.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self.expirations += int(expired)
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        if self.store is None:
+            return
+        evicted = self.store.put(key, value)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.store).__name__ if self.store is not None else None,
+                'entries': len(self.store) if self.store is not None else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                # Only stores bounded by value size track bytes
+                'bytes': self.store.bytes if getattr(self.store, 'sizeof', None) else None,
+            }
+
+
+def create_ocr_cache() -> ResultCache:
+    """Build the OCR result cache from the OCR_CACHE_* settings"""
+    if OCR_CACHE_BACKEND == 'off':
+        return ResultCache(None)
+    if OCR_CACHE_BACKEND == 'disk':
+        return ResultCache(SqliteStore(OCR_CACHE_PATH, OCR_CACHE_SIZE, OCR_CACHE_TTL))
+    return ResultCache(MemoryStore(OCR_CACHE_SIZE, OCR_CACHE_TTL))
+
+
+def _faces_nbytes(faces) -> int:
+    """Approximate memory held by a cached list of face attribute dicts"""
+    size = 64
+    for face in faces:
+        size += 240 + sum(getattr(value, 'nbytes', 16) for value in face.values())
+    return size
+
+
+def create_face_cache() -> ResultCache:
+    """Build the face detection / embedding cache from the FACE_CACHE_* settings"""
+    if FACE_CACHE_BACKEND == 'off':
+        return ResultCache(None)
+    return ResultCache(MemoryStore(FACE_CACHE_SIZE, FACE_CACHE_TTL, int(FACE_CACHE_MAX_MB * 2 ** 20), _faces_nbytes))
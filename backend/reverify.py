@@ -0,0 +1,286 @@
+"""
+Offline bulk re-verification
+Re-scores stored verifications (after a threshold or model change) without going through HTTP and
+base64: reads a manifest of local ID / selfie image paths and runs every pair through the same code as
+/validate-id (extract_text_internal + validate_text for the text check, compare_faces_internal for the
+face check; the quality gate is skipped, stored photos are scored as they are).
+The manifest is sharded over a process pool. Each process imports app.py once and holds one face model
+instance (FACE_SESSIONS=1, no cross-request batching) with the cores split between processes.
+Results are streamed as pairs finish, with per-stage timings: a .csv output gets one flushed row per
+pair, a .parquet output is a directory of part files written every --flush-rows rows (needs pyarrow).
+Pairs already verified in the output are skipped, so a crashed or interrupted run is resumed by running
+the same command again (--restart starts over); pairs that ended in an error are dropped from the output
+and verified again.
+Manifest: CSV with a header row or JSONL, fields id, id_image, selfie_image and optionally id_number,
+first_name, last_name, birthday, user_type (the user's input; without them only faces are compared).
+Image paths are relative to the manifest.
+Usage: python reverify.py manifest.csv results.csv [--workers N] [--threads N] [--no-text] [--restart]
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+# Result columns and their types (Parquet schema)
+COLUMNS = [
+    ('id', 'str'), ('status', 'str'), ('error', 'str'),
+    ('is_valid', 'bool'), ('face_match', 'bool'), ('similarity', 'float'), ('face_message', 'str'),
+    ('model_tier', 'str'), ('text_valid', 'bool'), ('id_number_match', 'bool'), ('name_match', 'bool'),
+    ('birthday_match', 'bool'), ('id_type', 'str'),
+    ('decode_ms', 'float'), ('ocr_ms', 'float'), ('face_ms', 'float'), ('total_ms', 'float'), ('worker', 'int'),
+]
+TEXT_FIELDS = ('id_number', 'first_name', 'last_name', 'birthday')
+STAGES = ('decode_ms', 'ocr_ms', 'face_ms', 'total_ms')
+
+
+def read_manifest(path):
+    """Manifest rows with image paths made absolute; rows without an id get their line number"""
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    for i, row in enumerate(rows, 1):
+        row['id'] = str(row.get('id') or i)
+        for field in ('id_image', 'selfie_image'):
+            row[field] = os.path.join(root, row[field])
+    return rows
+
+
+class CsvSink:
+    """Appends one flushed row per result; a resumed run continues the same file"""
+
+    def __init__(self, path, restart):
+        self.done = set()
+        if os.path.exists(path) and not restart:
+            self._drop_partial_line(path)
+            with open(path, newline='') as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+            verified = [row for row in rows if row.get('status') == 'ok']
+            if len(verified) < len(rows):
+                # Failed pairs are redone: drop their rows so every pair ends up with one result
+                self._rewrite(path, reader.fieldnames, verified)
+            self.done = {row['id'] for row in verified}
+        new = restart or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'w' if new else 'a', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=[name for name, _ in COLUMNS])
+        if new:
+            self._writer.writeheader()
+
+    @staticmethod
+    def _drop_partial_line(path):
+        # A crash mid-write can leave a row without its newline; it is redone
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    @staticmethod
+    def _rewrite(path, fieldnames, rows):
+        # Written under another name first, so the results are either all there or untouched
+        with open(path + '.tmp', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(path + '.tmp', path)
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Directory of Parquet part files, one per --flush-rows results (rows not yet written are redone,
+    and so are failed pairs, whose rows are dropped from their part file on resume)
+    """
+
+    def __init__(self, path, restart, flush_rows):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow (pip install pyarrow), or write to a .csv file')
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        types = {'str': pyarrow.string(), 'bool': pyarrow.bool_(), 'float': pyarrow.float64(), 'int': pyarrow.int64()}
+        self._schema = pyarrow.schema([(name, types[kind]) for name, kind in COLUMNS])
+        self.path = path
+        self.flush_rows = max(1, flush_rows)
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+        parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if restart:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self.done = set()
+        for part in parts:
+            table = self._pq.read_table(part, columns=['id', 'status'])
+            verified = [status == 'ok' for status in table.column('status').to_pylist()]
+            if not all(verified):
+                self._write_part(self._pq.read_table(part).filter(pyarrow.array(verified)), part)
+            self.done.update(pair for pair, ok in zip(table.column('id').to_pylist(), verified) if ok)
+        self._next_part = len(parts)
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+        self._write_part(table, os.path.join(self.path, f'part-{self._next_part:05d}.parquet'))
+        self._next_part += 1
+        self._rows = []
+
+    def _write_part(self, table, target):
+        # Written under another name first, so a part file is either complete or absent
+        self._pq.write_table(table, target + '.tmp')
+        os.replace(target + '.tmp', target)
+
+    def close(self):
+        self._flush()
+
+
+_backend = None
+_check_text = True
+
+
+def _init_worker(threads, check_text):
+    """
+    Pool initializer: one model instance per process, then import the app and load the models.
+    The OCR pool is sized when it is imported, so nothing that imports it (app, image_context) may be
+    imported before these settings are in place; this module only reaches the app through _backend
+    """
+    global _backend, _check_text
+    os.environ.update({
+        'WARMUP_ON_START': '0',
+        'FACE_SESSIONS': '1',
+        'FACE_BATCH_SIZE': '1',
+    })
+    os.environ.setdefault('FACE_INTRA_OP_THREADS', str(threads))
+    os.environ.setdefault('OCR_WORKERS', str(threads))
+    import app
+    app.get_face_executor().warm_up()
+    _backend, _check_text = app, check_text
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def verify(row):
+    """Text and face checks of one manifest row, as /validate-id runs them (in a pool process)"""
+    start = time.perf_counter()
+    result = {'id': row['id'], 'status': 'ok', 'worker': os.getpid()}
+    try:
+        stage = time.perf_counter()
+        contexts = []
+        for field in ('id_image', 'selfie_image'):
+            with open(row[field], 'rb') as f:
+                contexts.append(_backend.ImageContext(f.read()))
+        id_ctx, selfie_ctx = contexts
+        if id_ctx.bgr is None or selfie_ctx.bgr is None:
+            raise ValueError('Failed to decode images')
+        result['decode_ms'] = _ms(stage)
+
+        # OCR first, like /validate-id: it finds the ID's text orientation, which the face stage reuses
+        text_valid = None
+        if _check_text and any(row.get(field) for field in TEXT_FIELDS):
+            stage = time.perf_counter()
+            required_fields = ['fullName', 'idNumber'] + (['dateOfBirth'] if row.get('birthday') else [])
+            ocr_result = _backend.extract_text_internal(id_ctx, required_fields=required_fields)
+            if ocr_result:
+                id_type = ocr_result.get('idType') or _backend.detect_id_type(ocr_result['rawText'])
+                text = _backend.validate_text(
+                    extracted_data=ocr_result,
+                    user_input_id_number=row.get('id_number') or '',
+                    user_input_first_name=row.get('first_name') or '',
+                    user_input_last_name=row.get('last_name') or '',
+                    user_input_birthday=row.get('birthday') or None
+                )
+                text_valid = text['isValid'] and (row.get('user_type') != 'professional' or id_type == 'government')
+                result.update({'id_type': id_type, 'id_number_match': text['idNumberMatch'],
+                               'name_match': text['nameMatch'], 'birthday_match': text['birthdayMatch']})
+            else:
+                text_valid = False
+            result['text_valid'] = text_valid
+            result['ocr_ms'] = _ms(stage)
+
+        stage = time.perf_counter()
+        face = _backend.compare_faces_internal(id_ctx, selfie_ctx)
+        result['face_ms'] = _ms(stage)
+        result.update({'face_match': face['isMatch'], 'similarity': face['similarity'],
+                       'face_message': face['message'], 'model_tier': face.get('modelTier')})
+        if text_valid is not None:
+            result['is_valid'] = text_valid and face['isMatch']
+    except Exception as e:
+        result.update({'status': 'error', 'error': str(e)})
+    result['total_ms'] = _ms(start)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='CSV or JSONL of id, id_image, selfie_image (+ user input fields)')
+    parser.add_argument('output', help='results .csv file or .parquet directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes (one model each)')
+    parser.add_argument('--threads', type=int, help='ONNX Runtime / OCR threads per process (default: cores / workers)')
+    parser.add_argument('--no-text', action='store_true', help='compare faces only (skip OCR and text checks)')
+    parser.add_argument('--restart', action='store_true', help='ignore existing results and start over')
+    parser.add_argument('--chunksize', type=int, default=4, help='rows handed to a process at a time')
+    parser.add_argument('--flush-rows', type=int, default=500, help='rows per Parquet part file')
+    args = parser.parse_args()
+
+    rows = read_manifest(args.manifest)
+    if args.output.endswith('.parquet'):
+        sink = ParquetSink(args.output, args.restart, args.flush_rows)
+    else:
+        sink = CsvSink(args.output, args.restart)
+    todo = [row for row in rows if row['id'] not in sink.done]
+    workers = max(1, min(args.workers, len(todo)))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f'{len(rows)} pairs, {len(rows) - len(todo)} already in {args.output}, '
+          f'{len(todo)} to verify on {workers} processes x {threads} threads', file=sys.stderr)
+
+    start = time.perf_counter()
+    results = []
+    try:
+        if todo:
+            # spawn: each process imports the app (and its model settings) from scratch
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(workers, initializer=_init_worker, initargs=(threads, not args.no_text)) as pool:
+                for n, result in enumerate(pool.imap_unordered(verify, todo, args.chunksize), 1):
+                    sink.write(result)
+                    results.append(result)
+                    if n % 100 == 0 or n == len(todo):
+                        rate = n / (time.perf_counter() - start)
+                        print(f'{n}/{len(todo)} ({rate:.1f} pairs/s)', file=sys.stderr)
+    finally:
+        sink.close()
+
+    errors = sum(result['status'] == 'error' for result in results)
+    matches = sum(bool(result.get('face_match')) for result in results)
+    print(f'{len(results)} verified in {time.perf_counter() - start:.1f} s: {matches} face matches, {errors} errors')
+    for stage in STAGES:
+        values = [result[stage] for result in results if result.get(stage) is not None]
+        if values:
+            p50, p95 = np.percentile(values, [50, 95])
+            print(f'{stage}: median {p50:.1f}, p95 {p95:.1f}')
+
+
+if __name__ == '__main__':
+    main()
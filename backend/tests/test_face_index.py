@@ -0,0 +1,77 @@
+import numpy as np
+
+from face_index import FaceIndex, StoreFaceIndex
+from face_store import FaceStore
+
+
+def random_faces(count, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(vectors, query, k):
+    scores = vectors @ (query / np.linalg.norm(query))
+    return [f'u{i}' for i in np.argsort(-scores)[:k]]
+
+
+def test_exact_search_matches_brute_force():
+    vectors = random_faces(3000)
+    index = FaceIndex(dim=32, ivf_min=0)
+    index.add_many((f'u{i}', 'h', vector) for i, vector in enumerate(vectors))
+    for query in random_faces(20, seed=1):
+        matches = index.search(query, k=10)
+        assert [match.user_id for match in matches] == brute_force(vectors, query, 10)
+        assert np.allclose([match.similarity for match in matches], np.sort(vectors @ query)[::-1][:10], atol=1e-5)
+
+
+def test_ivf_search_finds_near_duplicates():
+    vectors = random_faces(4000)
+    index = FaceIndex(dim=32, ivf_min=10 ** 9, nprobe=8)
+    index.add_many((f'u{i}', 'h', vector) for i, vector in enumerate(vectors))
+    index.build_clusters()
+    assert index.stats()['ivf']
+    noise = random_faces(50, seed=2) * 0.1
+    hits = sum(index.search(vectors[i] + noise[i], k=1)[0].user_id == f'u{i}' for i in range(50))
+    assert hits >= 48
+    # Faces added after clustering are always scanned
+    index.add('late', 'h', vectors[0])
+    assert {match.user_id for match in index.search(vectors[0], k=2)} == {'u0', 'late'}
+
+
+def test_exclude_user_and_replace():
+    vectors = random_faces(10)
+    index = FaceIndex(dim=32, ivf_min=0)
+    index.add('a', 'id1', vectors[0])
+    index.add('a', 'id2', vectors[0])
+    index.add('b', 'id1', vectors[1])
+    assert [match.user_id for match in index.search(vectors[0], k=1, exclude_user='a')] == ['b']
+    index.add('b', 'id1', vectors[0] * 3)  # same key: replaced, and normalized
+    assert len(index) == 3
+    assert abs(index.search(vectors[0], k=3, exclude_user='a')[0].similarity - 1.0) < 1e-5
+
+
+def test_store_index_follows_writes_from_other_processes(tmp_path):
+    path = str(tmp_path / 'faces.sqlite3')
+    worker, other_worker = FaceStore(path), FaceStore(path)
+    faces = StoreFaceIndex(worker, factory=lambda: FaceIndex(dim=32, ivf_min=0))
+    vectors = random_faces(3)
+    worker.put('u0', 'h', vectors[0], 0.9, [0, 0, 1, 1])
+    assert len(faces.get()) == 1 and faces.reloads == 1
+
+    # This worker's own write is applied in place, no reload
+    worker.put('u1', 'h', vectors[1], 0.9, [0, 0, 1, 1])
+    faces.apply(lambda index: index.add('u1', 'h', vectors[1]))
+    assert len(faces.get()) == 2 and faces.reloads == 1
+
+    # Another worker's registration and deletion show up on the next use
+    other_worker.put('u2', 'h', vectors[2], 0.9, [0, 0, 1, 1])
+    assert faces.get().search(vectors[2], k=1)[0].user_id == 'u2' and faces.reloads == 2
+    other_worker.delete('u0')
+    assert {match.user_id for match in faces.get().search(vectors[0], k=5)} == {'u1', 'u2'}
+
+    # An own write racing another worker's is not applied on top of a stale index: it reloads instead
+    other_worker.delete('u1')
+    worker.delete('u2')
+    faces.apply(lambda index: index.remove_user('u2'))
+    assert len(faces.get()) == 0 and faces.reloads == 4
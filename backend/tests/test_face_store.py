@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+
+import face_store
+from face_store import FaceStore, image_hash
+
+
+def unit(seed, dim=512):
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return vector / np.linalg.norm(vector)
+
+
+def test_round_trip_keeps_a_unit_embedding(tmp_path):
+    store = FaceStore(str(tmp_path / 'faces.sqlite3'))
+    embedding = unit(0)
+    store.put('u1', image_hash(b'id photo'), embedding, 0.87, [1, 2, 3, 4])
+    record = store.get('u1', image_hash(b'id photo'))
+    assert record.user_id == 'u1' and record.bbox == [1, 2, 3, 4] and abs(record.det_score - 0.87) < 1e-6
+    assert abs(np.linalg.norm(record.embedding) - 1.0) < 1e-5
+    assert float(np.dot(record.embedding, embedding)) > 0.9999
+    assert store.get('u1', 'other hash') is None and store.get('u2') is None
+
+
+def test_latest_face_and_delete(tmp_path, monkeypatch):
+    store = FaceStore(str(tmp_path / 'faces.sqlite3'))
+    now = time.time()
+    clock = iter([now - 20, now - 10, now])
+    monkeypatch.setattr(face_store.time, 'time', lambda: next(clock))
+    store.put('u1', 'old', unit(1), 0.9, [0, 0, 1, 1])
+    store.put('u1', 'new', unit(2), 0.9, [0, 0, 1, 1])
+    store.put('u2', 'x', unit(3), 0.9, [0, 0, 1, 1])
+    monkeypatch.undo()
+    assert store.get('u1').image_hash == 'new'
+    assert store.delete('u1') == 2
+    assert store.get('u1') is None and store.get('u2') is not None
+
+
+def test_all_lists_every_face(tmp_path):
+    store = FaceStore(str(tmp_path / 'faces.sqlite3'))
+    store.put('u1', 'a', unit(1), 0.9, [0, 0, 1, 1])
+    store.put('u2', 'b', unit(2), 0.9, [0, 0, 1, 1])
+    faces = {(user_id, stored_hash): embedding for user_id, stored_hash, embedding in store.all()}
+    assert sorted(faces) == [('u1', 'a'), ('u2', 'b')]
+    assert faces[('u1', 'a')].dtype == np.float16
+
+
+def test_writes_advance_the_generation_seen_by_every_process(tmp_path):
+    path = str(tmp_path / 'faces.sqlite3')
+    store, other = FaceStore(path), FaceStore(path)
+    assert store.generation() == other.generation() == 0
+    store.put('u1', 'a', unit(1), 0.9, [0, 0, 1, 1])
+    assert other.generation() == store.written_generation == 1
+    assert other.delete('nobody') == 0 and store.generation() == 1
+    assert other.delete('u1') == 1
+    assert store.generation() == other.written_generation == 2
+    assert store.written_generation == 1
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+import bench_field_extraction as legacy
+from field_extraction import FieldScan, KeywordAutomaton, detect_id_type, extract_date_of_birth, extract_id_number, extract_name
+
+CORPUS = legacy.SAMPLES + [legacy.synthetic_text(random.Random(seed)) for seed in range(300)]
+
+
+@pytest.mark.parametrize('text', CORPUS)
+def test_matches_the_original_helpers(text):
+    assert (extract_name(text), extract_id_number(text), extract_date_of_birth(text), detect_id_type(text)) \
+        == legacy.legacy_all(text)
+
+
+def test_scan_returns_every_candidate_with_its_position():
+    text = 'Student ID\n  Juan Dela Cruz\nNo: S 1234567* / 987654\nDOB 1990-05-12, issued 01/02/2020\n'
+    result = FieldScan(text)
+    assert result.name_candidates == [('Student ID', 0, 10), ('Juan Dela Cruz', 13, 27)]
+    assert result.id_candidates == [
+        ('1234567', 34, 41, 'standalone'), ('987654', 45, 51, 'standalone'), ('1234567', 32, 42, 'prefixed'),
+        ('123456798765419', 0, 15, 'digit-run'), ('90051201022020', 15, 29, 'digit-run'),
+    ]
+    assert result.date_candidates == [('1990-05-12', 56, 66, 1), ('01/02/2020', 75, 85, 0)]
+    assert result.indicator_positions == {'student': 0, 'student id': 0}
+    # The longest ID number wins, and the strictest date format wins over an earlier, looser one
+    assert (result.id_number, result.date_of_birth) == ('123456798765419', '01/02/2020')
+
+
+@pytest.mark.parametrize('text', CORPUS)
+def test_candidate_positions_point_at_their_values(text):
+    result = FieldScan(text)
+    for value, start, end in result.name_candidates:
+        assert text[start:end] == value
+    for value, start, end, kind in result.id_candidates:
+        source = result.digits if kind == 'digit-run' else text
+        assert ''.join(char for char in source[start:end] if char.isdigit()) == value
+    for value, start, end, _ in result.date_candidates:
+        assert text[start:end] == value
+    for keyword, position in result.indicator_positions.items():
+        assert text.lower().startswith(keyword, position)
+
+
+def test_keyword_automaton_reports_exactly_the_keywords_present():
+    keywords = ['dl', 'driver', 'driving', 'license', 'student', 'student id', 'student number', 'id']
+    automaton = KeywordAutomaton(keywords)
+    rng = random.Random(7)
+    pieces = keywords + ['x', ' ', 'stu', 'dent', 'nse', 'dri']
+    for _ in range(500):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+        assert automaton.find_all(text) == {keyword for keyword in keywords if keyword in text}
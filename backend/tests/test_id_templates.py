@@ -0,0 +1,24 @@
+from id_templates import identify_template, parse_date, zones_confidence
+from ocr_engine import OcrWord
+
+
+def test_zones_are_scored_in_their_own_crop():
+    # Both zone crops start at (0, 0): pooled together, SANTOS would land on top of JUAN
+    given_name = [OcrWord('JUAN', 30, 5, 5, 60, 20)]
+    surname = [OcrWord('SANTOS', 95, 5, 5, 60, 20)]
+    assert zones_confidence('JUAN SANTOS', [given_name, surname]) == 0.3
+    assert zones_confidence('JUAN SANTOS', [surname]) == 0.95
+    assert zones_confidence(None, [given_name, surname]) == 0.0
+
+
+def test_header_needs_a_specific_keyword():
+    assert identify_template('REPUBLIKA NG PILIPINAS Philippine Identification Card').name == 'philsys'
+    assert identify_template('PCN 1234-5678') is None
+    assert identify_template('') is None
+
+
+def test_parse_date_formats():
+    assert parse_date('1990/01/31') == '01/31/1990'
+    assert parse_date('01/31/1990') == '01/31/1990'
+    assert parse_date('JANUARY 31, 1990') == '01/31/1990'
+    assert parse_date('13/45/1990') is None
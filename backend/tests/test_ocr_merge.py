@@ -0,0 +1,40 @@
+from ocr_engine import OcrWord
+from ocr_merge import field_confidence, merge_words, words_to_text
+
+
+def word(text, conf, left, top, width=50, height=20):
+    return OcrWord(text, conf, left, top, width, height)
+
+
+def test_passes_are_deduplicated_by_box_overlap():
+    first = [word('JUAN', 90, 10, 10), word('DELA', 80, 70, 10), word('CRUZ', 85, 130, 10)]
+    second = [word('JUAN', 70, 12, 11), word('DELA', 75, 71, 9), word('CRUZ', 60, 131, 10)]
+    assert merge_words([first, second]).text == 'JUAN DELA CRUZ'
+
+
+def test_spelling_with_most_total_confidence_wins():
+    passes = [[word('CRUZ', 60, 10, 10)], [word('CRUZ', 55, 11, 10)], [word('CRU2', 90, 10, 11)]]
+    merged = merge_words(passes)
+    assert [token.text for token in merged.tokens] == ['CRUZ']
+    assert merged.tokens[0].conf == 0.6
+
+
+def test_reading_order_and_low_confidence_words():
+    words = [word('1990', 90, 10, 60), word('CRUZ', 90, 70, 10), word('JUAN', 90, 10, 12), word('~~', 5, 140, 10)]
+    assert words_to_text(words) == 'JUAN CRUZ ~~\n1990'
+    assert merge_words([words]).text == 'JUAN CRUZ\n1990'
+
+
+def test_merged_text_does_not_grow_with_passes():
+    line = [word('ID', 90, 10, 10), word('123456', 90, 70, 10)]
+    assert merge_words([line] * 5).text == merge_words([line]).text == 'ID 123456'
+
+
+def test_field_confidence():
+    tokens = merge_words([[word('JUAN', 90, 10, 10), word('CRUZ', 70, 70, 10),
+                           word('1234', 80, 10, 40), word('5678', 60, 70, 40)]]).tokens
+    assert field_confidence('Juan Cruz', tokens) == 0.8
+    # An ID number stitched from two tokens scores with both
+    assert field_confidence('12345678', tokens) == 0.7
+    assert field_confidence(None, tokens) == 0.0
+    assert field_confidence('Maria', tokens) == 0.0
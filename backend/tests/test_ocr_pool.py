@@ -0,0 +1,59 @@
+import threading
+import time
+
+from ocr_pool import OcrPool
+
+
+def test_map_keeps_input_order():
+    pool = OcrPool(workers=3)
+    assert pool.map(lambda x: x * 2, [(i,) for i in range(20)]) == [i * 2 for i in range(20)]
+
+
+def test_failed_or_slow_pass_yields_none():
+    def run(x):
+        if x == 1:
+            raise RuntimeError('tesseract crashed')
+        if x == 2:
+            time.sleep(0.5)
+        return x
+
+    pool = OcrPool(workers=3, pass_timeout=0.1)
+    assert pool.map(run, [(0,), (1,), (2,), (3,)]) == [0, None, None, 3]
+
+
+def test_queue_time_does_not_count_against_timeout():
+    # One worker: the second pass waits for the first, but only its own run time is timed
+    pool = OcrPool(workers=1, pass_timeout=0.15)
+    assert pool.map(lambda x: time.sleep(0.1) or x, [(0,), (1,)]) == [0, 1]
+
+
+def test_requests_are_served_round_robin():
+    pool = OcrPool(workers=1)
+    gate = threading.Event()
+    order = []
+    # Occupy the only worker so both requests are queued before anything runs
+    blocker = threading.Thread(target=pool.map, args=(lambda: gate.wait(), [()]))
+    blocker.start()
+    time.sleep(0.05)
+    first = threading.Thread(target=pool.map, args=(order.append, [('a',)] * 3))
+    first.start()
+    time.sleep(0.05)
+    second = threading.Thread(target=pool.map, args=(order.append, [('b',)] * 3))
+    second.start()
+    time.sleep(0.05)
+    gate.set()
+    for thread in (blocker, first, second):
+        thread.join()
+    assert order == ['a', 'b', 'a', 'b', 'a', 'b']
+
+
+def test_imap_unordered_yields_every_index():
+    pool = OcrPool(workers=2, pass_timeout=0.2)
+
+    def run(x):
+        if x == 3:
+            time.sleep(1)
+        return x
+
+    results = dict(pool.imap_unordered(run, [(i,) for i in range(6)]))
+    assert results == {0: 0, 1: 1, 2: 2, 3: None, 4: 4, 5: 5}
@@ -0,0 +1,64 @@
+import time
+
+import readiness as readiness_module
+from readiness import Readiness
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_steps_run_in_order_once():
+    calls = []
+    readiness = Readiness()
+    for name in ('models', 'warmup', 'index'):
+        readiness.step(name, lambda name=name: calls.append(name))
+    assert not readiness.ready and not readiness.status()['started']
+    readiness.start()
+    readiness.start()
+    assert wait_until(lambda: readiness.ready)
+    assert calls == ['models', 'warmup', 'index']
+    assert all(step['state'] == 'done' for step in readiness.status()['steps'].values())
+
+
+def test_failed_step_keeps_the_worker_unready():
+    calls = []
+
+    def broken():
+        raise RuntimeError('model file missing')
+
+    readiness = Readiness()
+    readiness.step('models', broken)
+    readiness.step('warmup', lambda: calls.append('warmup'))
+    readiness.start()
+    assert wait_until(lambda: readiness.status()['steps']['models']['state'] == 'failed')
+    status = readiness.status()
+    assert not status['ready']
+    assert status['steps']['models']['error'] == 'model file missing'
+    assert status['steps']['warmup']['state'] == 'pending' and calls == []
+
+
+def test_failed_step_is_retried_after_backoff(monkeypatch):
+    monkeypatch.setattr(readiness_module, 'WARMUP_RETRY_SECONDS', 0.05)
+    calls = []
+
+    def flaky():
+        calls.append('models')
+        if len(calls) < 3:
+            raise RuntimeError('download timed out')
+
+    readiness = Readiness()
+    readiness.step('models', flaky)
+    readiness.step('warmup', lambda: calls.append('warmup'))
+    for _ in range(200):
+        # Each /ready probe calls start()
+        readiness.start()
+        if readiness.ready:
+            break
+        time.sleep(0.01)
+    assert readiness.ready
+    assert calls == ['models', 'models', 'models', 'warmup']
+    assert readiness.status()['steps']['models']['state'] == 'done' and 'retryInSeconds' not in readiness.status()
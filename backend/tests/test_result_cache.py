@@ -0,0 +1,76 @@
+import result_cache
+from result_cache import MemoryStore, ResultCache, SqliteStore, make_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_depends_on_image_and_profile():
+    assert make_key(b'image', 'psm6') == make_key(b'image', 'psm6')
+    assert make_key(b'image', 'psm6') != make_key(b'image', 'psm4')
+    assert make_key(b'image', 'psm6') != make_key(b'other', 'psm6')
+
+
+def test_memory_store_evicts_least_recently_used():
+    cache = ResultCache(MemoryStore(max_entries=2, ttl=60))
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_store_expires_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, 'time', clock)
+    cache = ResultCache(MemoryStore(max_entries=10, ttl=60))
+    cache.put('a', 1)
+    clock.now += 59
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_sqlite_store_evicts_and_expires(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, 'time', clock)
+    cache = ResultCache(SqliteStore(str(tmp_path / 'cache.sqlite3'), max_entries=2, ttl=60))
+    for key in ('a', 'b'):
+        cache.put(key, {'text': key})
+        clock.now += 1
+    assert cache.get('a') == {'text': 'a'}
+    clock.now += 1
+    cache.put('c', {'text': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'text': 'a'}
+    clock.now += 61
+    assert cache.get('c') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_disabled_cache_keeps_the_interface():
+    cache = ResultCache(None)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_memory_store_size_bound_evicts_oldest():
+    store = MemoryStore(max_entries=100, ttl=60, max_bytes=250, sizeof=len)
+    cache = ResultCache(store)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, 'x' * 100)
+    assert cache.get('a') is None and cache.get('b') is not None and cache.get('c') is not None
+    assert store.bytes == 200 and cache.stats()['bytes'] == 200
+    # A single value over the bound is still kept
+    cache.put('d', 'x' * 400)
+    assert len(store) == 1 and cache.get('d') is not None
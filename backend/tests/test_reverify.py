@@ -0,0 +1,44 @@
+import csv
+
+import pytest
+
+from reverify import CsvSink, ParquetSink
+
+
+def result(pair, status='ok'):
+    return {'id': pair, 'status': status, 'error': 'decode failed' if status == 'error' else None}
+
+
+def test_csv_resume_skips_verified_pairs_and_redoes_failed_ones(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    sink = CsvSink(path, restart=False)
+    for row in (result('1'), result('2', 'error'), result('3')):
+        sink.write(row)
+    sink.close()
+    with open(path, 'a') as f:
+        f.write('4,ok')  # cut off mid-row by a crash
+
+    sink = CsvSink(path, restart=False)
+    assert sink.done == {'1', '3'}
+    sink.write(result('2'))
+    sink.close()
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['id'], row['status']) for row in rows] == [('1', 'ok'), ('3', 'ok'), ('2', 'ok')]
+
+    assert CsvSink(path, restart=True).done == set()
+
+
+def test_parquet_resume_redoes_failed_pairs(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'results.parquet')
+    sink = ParquetSink(path, restart=False, flush_rows=2)
+    for row in (result('1'), result('2', 'error'), result('3')):
+        sink.write(row)
+    sink.close()
+
+    sink = ParquetSink(path, restart=False, flush_rows=2)
+    assert sink.done == {'1', '3'}
+    sink.write(result('2'))
+    sink.close()
+    assert ParquetSink(path, restart=False, flush_rows=2).done == {'1', '2', '3'}
@@ -0,0 +1,45 @@
+import types
+
+import pytest
+
+import user_auth
+from user_auth import bearer_token, verified_user_id
+
+
+class FirebaseError(Exception):
+    pass
+
+
+@pytest.fixture
+def firebase(monkeypatch):
+    """Stand-in for firebase_admin: 'good' verifies as uid 'user-1', anything else is rejected"""
+    def verify_id_token(token, app=None):
+        if token == 'expired':
+            raise FirebaseError('expired')
+        if token != 'good':
+            raise ValueError('malformed')
+        return {'uid': 'user-1'}
+
+    monkeypatch.setattr(user_auth, 'get_firebase_app', lambda: object())
+    monkeypatch.setattr(user_auth, 'auth', types.SimpleNamespace(verify_id_token=verify_id_token))
+    monkeypatch.setattr(user_auth, 'exceptions', types.SimpleNamespace(FirebaseError=FirebaseError))
+
+
+def test_bearer_token():
+    assert bearer_token('Bearer abc') == 'abc'
+    assert bearer_token('  bearer   abc ') == 'abc'
+    assert bearer_token('Basic abc') is None
+    assert bearer_token('Bearer ') is None
+    assert bearer_token(None) is None
+
+
+def test_user_id_comes_only_from_a_verified_token(firebase):
+    assert verified_user_id('Bearer good') == 'user-1'
+    assert verified_user_id('Bearer forged') is None
+    assert verified_user_id('Bearer expired') is None
+    assert verified_user_id(None) is None
+
+
+def test_nothing_is_authenticated_without_firebase(monkeypatch):
+    monkeypatch.setattr(user_auth, 'get_firebase_app', lambda: None)
+    assert verified_user_id('Bearer good') is None
@@ -0,0 +1,59 @@
+"""
+Signed-in user of a request
+Endpoints that read or write a user's stored ID face (/validate-id storing it, /verify-selfie) take the
+user id from a Firebase ID token sent as "Authorization: Bearer <idToken>", verified with firebase_admin,
+never from the request body, so one account cannot replace or match against another's reference face.
+"""
+import os
+import threading
+from typing import Optional
+
+try:
+    import firebase_admin
+    from firebase_admin import auth, credentials, exceptions
+    FIREBASE_AVAILABLE = True
+except ImportError:
+    firebase_admin = auth = credentials = exceptions = None
+    FIREBASE_AVAILABLE = False
+
+# Service account key of the Firebase project the app signs users in with (the same file the
+# seed scripts use); without it (or without firebase_admin) no request is authenticated, so
+# ID faces are not stored and /verify-selfie is unavailable
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'firebase-credentials.json'
+)
+
+_firebase_app = None
+_firebase_app_lock = threading.Lock()
+
+
+def get_firebase_app():
+    """Firebase app used to verify ID tokens, initialized on first use (None when unavailable)"""
+    global _firebase_app
+    if _firebase_app is None and FIREBASE_AVAILABLE and os.path.exists(FIREBASE_CREDENTIALS):
+        with _firebase_app_lock:
+            if _firebase_app is None:
+                _firebase_app = firebase_admin.initialize_app(
+                    credentials.Certificate(FIREBASE_CREDENTIALS), name='id-validation'
+                )
+    return _firebase_app
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Token of an "Authorization: Bearer <token>" header value"""
+    scheme, _, token = (authorization or '').strip().partition(' ')
+    token = token.strip()
+    return token if scheme.lower() == 'bearer' and token else None
+
+
+def verified_user_id(authorization: Optional[str]) -> Optional[str]:
+    """Firebase uid of a valid, unexpired ID token in the Authorization header, else None"""
+    token = bearer_token(authorization)
+    app = get_firebase_app() if token else None
+    if app is None:
+        return None
+    try:
+        claims = auth.verify_id_token(token, app=app)
+    except (ValueError, exceptions.FirebaseError):
+        return None
+    return claims.get('uid')